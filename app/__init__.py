@@ -1,16 +0,0 @@
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-from config import Config
-
-db = SQLAlchemy()
-
-def create_app(config_class=Config):
-    app = Flask(__name__)
-    app.config.from_object(config_class)
-
-    db.init_app(app)
-
-    from app.routes import bp
-    app.register_blueprint(bp)
-
-    return app
\ No newline at end of file
@@ -0,0 +1,231 @@
+from sqlalchemy import select, delete, insert
+from sqlalchemy.dialects import sqlite, postgresql
+from models import db, Pod, SharingGroup, PodSharingGroup, Accounting, EnergyFlow
+from loadcurves import monthly_energy_by_pod
+from summary import mark_stale
+import pagecache
+from jobs import job_handler
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+# Rows per executemany batch when inserting the allocation
+INSERT_BATCH_SIZE = 1000
+
+ACCOUNTING_KEY = ['accYear', 'accMonth', 'accMember', 'accPod', 'accSGId']
+
+
+def load_memberships():
+    """One row per (sharing group, pod) with everything the allocation needs, in a single query."""
+    stmt = (
+        select(
+            PodSharingGroup.sharingGroupID.label('sgID'),
+            SharingGroup.sgPrice,
+            Pod.podsID,
+            Pod.memberID,
+            Pod.podType,
+            Pod.energyproduction
+        )
+        .join(SharingGroup, PodSharingGroup.sharingGroupID == SharingGroup.sgID)
+        .join(Pod, PodSharingGroup.podID == Pod.podsID)
+    )
+    return pd.read_sql(stmt, db.session.connection())
+
+
+def share_energy(memberships, production=None, consumption=None):
+    """Split each sharing group's production across its consumption pods.
+
+    A production pod belonging to several groups shares its production equally
+    between them. Each group's production is then divided between the group's
+    consumption pods; the production pods give away the same energy, so every
+    group balances to zero.
+
+    ``production`` optionally overrides ``Pod.energyproduction`` with a Series
+    of monthly production indexed by podsID. ``consumption`` is a Series of
+    metered monthly consumption indexed by podsID: when a group has metered
+    consumers, only ``min(production, consumption)`` is shared and it is split
+    pro rata to consumption, otherwise the production is split equally.
+    Returns the memberships with the columns ``produced`` (each group's part of
+    a production pod), ``consumed`` (metered, NaN otherwise), ``energy`` (received
+    when positive, given away when negative) and ``shared`` (the group has
+    consumers to share with).
+    """
+    df = memberships.copy()
+    df['energyproduction'] = df['energyproduction'].astype(float)
+    if production is not None:
+        metered = df['podsID'].map(production)
+        df['energyproduction'] = metered.fillna(df['energyproduction'])
+    df['energyproduction'] = df['energyproduction'].fillna(0.0)
+    df['sgPrice'] = df['sgPrice'].astype(float).fillna(0.0)
+
+    is_prod = (df['podType'] == 'Production').to_numpy()
+    is_cons = ~is_prod
+
+    # Production pods in several groups contribute an equal part to each
+    groups_per_pod = df.groupby('podsID')['sgID'].transform('size').to_numpy()
+    contribution = np.where(is_prod, df['energyproduction'].to_numpy() / groups_per_pod, 0.0)
+
+    sg_codes, sg_index = np.unique(df['sgID'].to_numpy(), return_inverse=True)
+    n_groups = len(sg_codes)
+    group_production = np.bincount(sg_index, weights=contribution, minlength=n_groups)
+    group_consumers = np.bincount(sg_index, weights=is_cons, minlength=n_groups)
+
+    if consumption is not None:
+        used = df['podsID'].map(consumption).to_numpy(dtype=float)
+    else:
+        used = np.full(len(df), np.nan)
+    used = np.where(is_cons, used, np.nan)
+    metered = ~np.isnan(used)
+    group_metered = np.bincount(sg_index, weights=metered, minlength=n_groups) > 0
+    group_consumption = np.bincount(sg_index, weights=np.nan_to_num(used), minlength=n_groups)
+
+    # Metered groups split pro rata to consumption, the others equally between consumers
+    weight = np.where(group_metered[sg_index], np.nan_to_num(used), 1.0) * is_cons
+    group_weight = np.bincount(sg_index, weights=weight, minlength=n_groups)
+    group_shared = np.where(group_metered, np.minimum(group_production, group_consumption),
+                            group_production)
+
+    # Groups without consumers have nobody to share with
+    shared = (group_consumers[sg_index] > 0) & (group_weight[sg_index] > 0)
+    consumer_share = np.divide(
+        group_shared[sg_index] * weight, group_weight[sg_index],
+        out=np.zeros(len(df)), where=shared
+    )
+    producer_part = np.divide(
+        group_shared[sg_index], group_production[sg_index],
+        out=np.zeros(len(df)), where=group_production[sg_index] > 0
+    )
+    df['produced'] = contribution
+    df['consumed'] = used
+    df['energy'] = np.where(is_cons, consumer_share, -contribution * producer_part)
+    df['shared'] = shared
+    return df
+
+
+def allocate(memberships, year, month, production=None, consumption=None):
+    """The Accounting rows of a month: the energy of ``share_energy`` at the group's price.
+
+    Consumption pods are charged ``share * sgPrice`` and the production pods are
+    credited the same amount as a negative line. Returns a DataFrame.
+    """
+    return _accounting_rows(share_energy(memberships, production=production, consumption=consumption), year, month)
+
+
+def _accounting_rows(df, year, month):
+    amount = np.round(df['energy'].to_numpy() * df['sgPrice'].to_numpy(), 2)
+
+    keep = df['shared'].to_numpy() & (amount != 0)
+    return pd.DataFrame({
+        'accYear': year,
+        'accMonth': month,
+        'accMember': df['memberID'].to_numpy()[keep],
+        'accPod': df['podsID'].to_numpy()[keep],
+        'accSGId': df['sgID'].to_numpy()[keep],
+        'accAmount': amount[keep],
+        'accBillingDate': None
+    })
+
+
+def energy_flows(shared, year, month):
+    """Sum the energy of ``share_energy`` per sharing group and member, the rows of EnergyFlow."""
+    df = pd.DataFrame({
+        'efSGId': shared['sgID'],
+        'efMember': shared['memberID'],
+        'efProduction': shared['produced'],
+        'efConsumption': shared['consumed'],
+        'efShared': shared['energy'].clip(lower=0),
+        'efSupplied': (-shared['energy']).clip(lower=0),
+    })
+    # A member's consumption stays unknown when none of their pods is metered
+    flows = df.groupby(['efSGId', 'efMember'], as_index=False).agg(
+        efProduction=('efProduction', 'sum'),
+        efConsumption=('efConsumption', lambda values: values.sum(min_count=1)),
+        efShared=('efShared', 'sum'),
+        efSupplied=('efSupplied', 'sum'),
+    )
+    flows.insert(0, 'efMonth', month)
+    flows.insert(0, 'efYear', year)
+    return flows.round({'efProduction': 3, 'efConsumption': 3, 'efShared': 3, 'efSupplied': 3})
+
+
+def save_energy_flows(flows, year, month):
+    """Replace the energy flows of a month in the current transaction, the caller commits."""
+    records = flows.astype(object).where(flows.notna(), None).to_dict('records')
+    computed = datetime.now()
+    for record in records:
+        record['efComputed'] = computed
+    pagecache.mark_stale(db.session, EnergyFlow)
+    connection = db.session.connection()
+    connection.execute(delete(EnergyFlow).where(EnergyFlow.efYear == year, EnergyFlow.efMonth == month))
+    for start in range(0, len(records), INSERT_BATCH_SIZE):
+        connection.execute(insert(EnergyFlow), records[start:start + INSERT_BATCH_SIZE])
+    return len(records)
+
+
+def _insert_statement(replace_unbilled):
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        stmt = sqlite.insert(Accounting)
+    elif dialect == 'postgresql':
+        stmt = postgresql.insert(Accounting)
+    else:
+        raise NotImplementedError(f'Allocation upsert is not supported on {dialect}')
+    if replace_unbilled:
+        # Billed history is never rewritten, only still unbilled amounts are refreshed
+        return stmt.on_conflict_do_update(
+            index_elements=ACCOUNTING_KEY,
+            set_={'accAmount': stmt.excluded.accAmount},
+            where=Accounting.accBillingDate.is_(None)
+        )
+    return stmt.on_conflict_do_nothing(index_elements=ACCOUNTING_KEY)
+
+
+def save_allocation(rows, replace_unbilled=False):
+    """Bulk insert the allocated rows, skipping those already present under uix_accounting."""
+    stmt = _insert_statement(replace_unbilled)
+    records = rows.astype(object).where(rows.notna(), None).to_dict('records')
+    # The Core upsert bypasses the ORM events keeping the summary table up to date
+    mark_stale(db.session, {(r['accYear'], r['accMonth'], r['accMember'], r['accSGId']) for r in records})
+    pagecache.mark_stale(db.session, Accounting)
+    written = 0
+    for start in range(0, len(records), INSERT_BATCH_SIZE):
+        result = db.session.connection().execute(stmt, records[start:start + INSERT_BATCH_SIZE])
+        written += max(result.rowcount, 0)
+    db.session.commit()
+    return written
+
+
+def _metered(year, month):
+    # Metered load curves take precedence over the static Pod.energyproduction
+    metered = monthly_energy_by_pod(year, month)
+    return None if metered.empty else metered
+
+
+def run_allocation(year, month, replace_unbilled=False):
+    """Close a month: its accounting rows and, committed with them, its energy flows."""
+    metered = _metered(year, month)
+    shared = share_energy(load_memberships(), production=metered, consumption=metered)
+    rows = _accounting_rows(shared, year, month)
+    save_energy_flows(energy_flows(shared, year, month), year, month)
+    written = save_allocation(rows, replace_unbilled=replace_unbilled)
+    return {
+        'rows': len(rows),
+        'written': written,
+        'groups': int(rows['accSGId'].nunique()),
+        'balance': float(rows['accAmount'].sum()) if len(rows) else 0.0
+    }
+
+
+@job_handler('allocation')
+def allocation_job(job, year, month, replace_unbilled=False):
+    # Idempotent: the upsert skips, or refreshes, the records a previous attempt wrote
+    return run_allocation(year, month, replace_unbilled=replace_unbilled)
+
+
+def refresh_energy_flows(year, month):
+    """Compute the energy flows of a month closed before they were recorded, its accounting is left as is."""
+    metered = _metered(year, month)
+    shared = share_energy(load_memberships(), production=metered, consumption=metered)
+    count = save_energy_flows(energy_flows(shared, year, month), year, month)
+    db.session.commit()
+    return count
@@ -0,0 +1,160 @@
+from sqlalchemy import select, func, case
+from models import db, EnergyFlow, AccountingSummary
+from artifacts import DATA_DIR
+import hashlib
+import json
+import os
+import time
+
+CHART_DIR = os.path.join(DATA_DIR, 'analytics')
+# Replaced chart versions are kept this long, longer than a cached page linking them lives
+CHART_KEEP_SECONDS = 3600
+
+ENERGY_COLUMNS = ('production', 'consumption', 'shared', 'supplied')
+
+
+class MonthlySeries:
+    """The months of a sharing group or a member, one value per month in each array.
+
+    Read from the energy flows recorded at each month close and from the
+    accounting summary, never from the accounting rows themselves.
+    """
+
+    def __init__(self, flows, amounts):
+        months = sorted(set(flows) | set(amounts))
+        self.months = [f'{year:04d}-{month:02d}' for year, month in months]
+        for index, name in enumerate(ENERGY_COLUMNS):
+            setattr(self, name, [_number(flows[key][index]) if key in flows else None for key in months])
+        self.amount = [_number(amounts.get(key)) for key in months]
+
+    @property
+    def self_consumption(self):
+        """Part of the production consumed inside the group, per month."""
+        return [round(shared / production, 4) if shared is not None and production else None
+                for shared, production in zip(self.shared, self.production)]
+
+    @property
+    def coverage(self):
+        """Part of the metered consumption covered by the group's production, per month."""
+        return [round(shared / consumption, 4) if shared is not None and consumption else None
+                for shared, consumption in zip(self.shared, self.consumption)]
+
+    def rows(self):
+        return [dict(month=month, production=production, consumption=consumption, shared=shared,
+                     supplied=supplied, amount=amount, self_consumption=rate, coverage=coverage)
+                for month, production, consumption, shared, supplied, amount, rate, coverage in zip(
+                    self.months, self.production, self.consumption, self.shared, self.supplied,
+                    self.amount, self.self_consumption, self.coverage)]
+
+    def to_dict(self):
+        return {'months': self.months, 'amount': self.amount, 'self_consumption': self.self_consumption,
+                'coverage': self.coverage, **{name: getattr(self, name) for name in ENERGY_COLUMNS}}
+
+
+def _number(value):
+    return None if value is None else float(value)
+
+
+def _flows(criterion):
+    rows = db.session.execute(
+        select(EnergyFlow.efYear, EnergyFlow.efMonth, func.sum(EnergyFlow.efProduction),
+               func.sum(EnergyFlow.efConsumption), func.sum(EnergyFlow.efShared), func.sum(EnergyFlow.efSupplied))
+        .where(criterion)
+        .group_by(EnergyFlow.efYear, EnergyFlow.efMonth)
+    )
+    return {(row[0], row[1]): row[2:] for row in rows}
+
+
+def _amounts(criterion, amount):
+    rows = db.session.execute(
+        select(AccountingSummary.asYear, AccountingSummary.asMonth, func.sum(amount))
+        .where(criterion)
+        .group_by(AccountingSummary.asYear, AccountingSummary.asMonth)
+    )
+    return {(year, month): total for year, month, total in rows}
+
+
+def sharing_group_series(sg_id):
+    # The group balances to zero, its revenue is what its consumers are charged
+    charged = case((AccountingSummary.asAmount > 0, AccountingSummary.asAmount), else_=0)
+    return MonthlySeries(_flows(EnergyFlow.efSGId == sg_id), _amounts(AccountingSummary.asSGId == sg_id, charged))
+
+
+def member_series(member_id):
+    return MonthlySeries(_flows(EnergyFlow.efMember == member_id),
+                         _amounts(AccountingSummary.asMember == member_id, AccountingSummary.asAmount))
+
+
+def sharing_group_totals():
+    """Production, shared energy and months recorded of every sharing group, for the analytics index."""
+    return {row.efSGId: row for row in db.session.execute(
+        select(EnergyFlow.efSGId, func.sum(EnergyFlow.efProduction).label('production'),
+               func.sum(EnergyFlow.efShared).label('shared'),
+               func.count(func.distinct(EnergyFlow.efYear * 100 + EnergyFlow.efMonth)).label('months'))
+        .group_by(EnergyFlow.efSGId)
+    )}
+
+
+def _bar(name, months, values, **extra):
+    return dict({'type': 'bar', 'name': name, 'x': months, 'y': values}, **extra)
+
+
+RATES = {'self_consumption': 'Self-consumption', 'coverage': 'Coverage'}
+
+
+def chart_payload(series, title, rate='self_consumption'):
+    """The plotly.js figures of a series: energy per month, and amount with the self-consumption or coverage rate."""
+    months = series.months
+    energy = {
+        'data': [
+            _bar('Production', months, series.production),
+            _bar('Consumption', months, series.consumption),
+            _bar('Shared', months, series.shared),
+        ],
+        'layout': {'title': {'text': f'{title}: energy per month'}, 'barmode': 'group',
+                   'yaxis': {'title': {'text': 'kWh'}}},
+    }
+    amount = {
+        'data': [
+            _bar('Amount', months, series.amount),
+            {'type': 'scatter', 'mode': 'lines+markers', 'name': RATES[rate], 'x': months,
+             'y': getattr(series, rate), 'yaxis': 'y2'},
+        ],
+        'layout': {'title': {'text': f'{title}: amount per month'},
+                   'yaxis': {'title': {'text': 'EUR'}},
+                   'yaxis2': {'title': {'text': RATES[rate]}, 'overlaying': 'y', 'side': 'right',
+                              'tickformat': '.0%', 'rangemode': 'tozero'}},
+    }
+    return {'energy': energy, 'amount': amount}
+
+
+def chart_file(kind, entity_id, payload, chart_dir=None):
+    """Store the JSON of a chart payload under its digest, returns the digest.
+
+    The digest changes with the data, so its URL can be cached forever: a new
+    month close or a corrected amount gives the page a new URL. The versions it
+    replaces are removed once older than the pages that may still link them.
+    """
+    chart_dir = chart_dir or CHART_DIR
+    body = json.dumps(payload, separators=(',', ':'), sort_keys=True).encode()
+    digest = hashlib.sha256(body).hexdigest()[:16]
+    path = chart_path(kind, entity_id, digest, chart_dir)
+    if not os.path.exists(path):
+        os.makedirs(chart_dir, exist_ok=True)
+        with open(f'{path}.{os.getpid()}.part', 'wb') as f:
+            f.write(body)
+        os.replace(f'{path}.{os.getpid()}.part', path)
+        prefix = f'{kind}-{entity_id}-'
+        expired = time.time() - CHART_KEEP_SECONDS
+        for name in os.listdir(chart_dir):
+            if name.startswith(prefix) and name.endswith('.json') and name != os.path.basename(path):
+                try:
+                    if os.path.getmtime(os.path.join(chart_dir, name)) < expired:
+                        os.remove(os.path.join(chart_dir, name))
+                except OSError:
+                    pass
+    return digest
+
+
+def chart_path(kind, entity_id, digest, chart_dir=None):
+    return os.path.join(chart_dir or CHART_DIR, f'{kind}-{entity_id}-{digest}.json')
@@ -0,0 +1,127 @@
+from sqlalchemy import insert, select
+from werkzeug.utils import secure_filename
+from models import db, BillingFile, BillingFileEntry
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+import hashlib
+import uuid
+import shutil
+import gzip
+import csv
+import os
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+ARCHIVE_DIR = os.path.join(DATA_DIR, 'archive')
+# Uploaded sheets waiting for their import job
+UPLOAD_DIR = os.path.join(DATA_DIR, 'uploads')
+
+COPY_CHUNK = 64 * 1024
+ENTRY_BATCH_SIZE = 1000
+
+
+def archive_path(digest, archive_dir=None):
+    # Content-addressed: the sha256 of the uncompressed file names its gzip copy
+    return os.path.join(archive_dir or ARCHIVE_DIR, digest[:2], f'{digest}.csv.gz')
+
+
+def file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(COPY_CHUNK), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def store_billing_file(path, filename, row_count, total, entries, created=None, archive_dir=None):
+    """Archive a generated billing CSV gzip-compressed and index it with the (accID, member, amount) it bills.
+
+    The amount is what the file bills the member for the record: its amount on an
+    invoice, the change since on a supplement or credit note.
+
+    The index rows are added to the current transaction and left for the caller
+    to commit. Returns the BillingFile and whether its archive file was created
+    by this call, so a caller rolling back knows whether to remove it.
+    """
+    digest = file_digest(path)
+    target = archive_path(digest, archive_dir)
+    created_archive = not os.path.exists(target)
+    if created_archive:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(path, 'rb') as source, gzip.open(target + '.part', 'wb') as compressed:
+            shutil.copyfileobj(source, compressed, COPY_CHUNK)
+        os.replace(target + '.part', target)
+
+    billing_file = BillingFile(
+        bfFilename=filename,
+        bfCreated=created or datetime.now(),
+        bfHash=digest,
+        bfSize=os.path.getsize(path),
+        bfStoredSize=os.path.getsize(target),
+        bfRowCount=row_count,
+        bfTotal=total
+    )
+    db.session.add(billing_file)
+    db.session.flush()
+    entries = [{'billingFileID': billing_file.bfID, 'accID': accid, 'bfeMember': member_id, 'bfeAmount': amount}
+               for accid, member_id, amount in entries]
+    for start in range(0, len(entries), ENTRY_BATCH_SIZE):
+        db.session.execute(insert(BillingFileEntry), entries[start:start + ENTRY_BATCH_SIZE])
+    return billing_file, created_archive
+
+
+def open_billing_file(billing_file, archive_dir=None):
+    """Binary stream of the uncompressed CSV."""
+    return gzip.open(archive_path(billing_file.bfHash, archive_dir), 'rb')
+
+
+def iter_billing_file(billing_file, archive_dir=None):
+    with open_billing_file(billing_file, archive_dir) as stream:
+        for chunk in iter(lambda: stream.read(COPY_CHUNK), b''):
+            yield chunk
+
+
+def _summarise_legacy(path):
+    rows = 0
+    total = Decimal(0)
+    with open(path, newline='') as csv_file:
+        reader = csv.reader(csv_file, delimiter=';')
+        next(reader, None)
+        for row in reader:
+            rows += 1
+            try:
+                total += Decimal(row[-1])
+            except (InvalidOperation, IndexError):
+                pass
+    return rows, total
+
+
+def import_legacy_files(data_dir=DATA_DIR, archive_dir=ARCHIVE_DIR):
+    """Index the decompte-*.csv files written before the archive existed.
+
+    Their accIDs were never recorded, so they are archived without entries.
+    The originals are removed once committed.
+    """
+    if not os.path.isdir(data_dir):
+        return 0
+    known = set(db.session.scalars(select(BillingFile.bfFilename)))
+    imported = []
+    for filename in sorted(os.listdir(data_dir)):
+        path = os.path.join(data_dir, filename)
+        if filename in known or not filename.endswith('.csv') or not os.path.isfile(path):
+            continue
+        rows, total = _summarise_legacy(path)
+        store_billing_file(path, filename, rows, total, [],
+                           created=datetime.fromtimestamp(os.path.getmtime(path)), archive_dir=archive_dir)
+        imported.append(path)
+    db.session.commit()
+    for path in imported:
+        os.remove(path)
+    return len(imported)
+
+
+def save_upload(storage):
+    """Keep an uploaded sheet on disk until its import job ran, returns the path."""
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    path = os.path.join(UPLOAD_DIR, f'{uuid.uuid4().hex}-{secure_filename(storage.filename) or "upload.csv"}')
+    storage.save(path)
+    return path
@@ -0,0 +1,415 @@
+from sqlalchemy import insert, select
+from decimal import Decimal
+from datetime import date, datetime
+from models import db, Member, Pod, SharingGroup, PodSharingGroup, MemberFee, MemberFeePayment, Accounting, BillingFile
+from flask import got_request_exception
+from jobs import submit, wait
+from artifacts import archive_path
+from instrumentation import count_queries
+from summary import mark_stale, FULL_REBUILD
+import pagecache
+import subprocess
+import statistics
+import threading
+import platform
+import random
+import time
+import json
+import sys
+import os
+
+INSERT_BATCH_SIZE = 5000
+BILLING_TIMEOUT = 3600
+
+# Modules a booting web worker should not pay for
+HEAVY_MODULES = ('pandas', 'numpy')
+STARTUP_SCRIPT = f'''
+import json, sys, time
+start = time.perf_counter()
+from app import create_app
+create_app()
+print(json.dumps({{'seconds': time.perf_counter() - start,
+                  'heavy': [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+'''
+
+DEFAULT_SCALE = {
+    'members': 1000,
+    'pods_per_member': 2,
+    'sharing_groups': 10,
+    'groups_per_pod': 1,
+    'months': 12,
+    'unbilled_months': 1,
+    'fee_years': 3,
+}
+
+
+def _insert_returning_ids(model, key, records):
+    ids = []
+    for start in range(0, len(records), INSERT_BATCH_SIZE):
+        ids.extend(db.session.scalars(
+            insert(model).returning(key, sort_by_parameter_order=True),
+            records[start:start + INSERT_BATCH_SIZE]
+        ))
+    return ids
+
+
+def _insert(model, records):
+    for start in range(0, len(records), INSERT_BATCH_SIZE):
+        db.session.execute(insert(model), records[start:start + INSERT_BATCH_SIZE])
+
+
+def generate_community(members=1000, pods_per_member=2, sharing_groups=10, groups_per_pod=1,
+                       months=12, unbilled_months=1, fee_years=3, seed=0):
+    """Fill the database with a synthetic community and return the number of rows per table.
+
+    Every pod belongs to groups_per_pod sharing groups and has one accounting
+    record per group and month, ending with the current month. All months but
+    the last unbilled_months are billed. Every member has a payment row for each
+    of the last fee_years member fees.
+    """
+    rng = random.Random(seed)
+    today = date.today()
+    periods = []
+    year, month = today.year, today.month
+    for _ in range(months):
+        periods.append((year, month))
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    periods.reverse()
+
+    group_ids = _insert_returning_ids(SharingGroup, SharingGroup.sgID, [
+        {'sgName': f'Group {g}', 'sgNumber': f'SG-{g:04d}', 'sgPrice': Decimal(rng.randint(8, 16)) / 100,
+         'sgType': 'Local' if g % 4 else 'National'}
+        for g in range(1, sharing_groups + 1)
+    ])
+    member_ids = _insert_returning_ids(Member, Member.id, [
+        {'name': f'Name{i}', 'firstname': f'First{i}', 'nationalId': f'{1950 + i % 50}{i:08d}',
+         'address': f'{i} rue de la Gare, Luxembourg', 'phoneNumber': f'+352 6{i:08d}',
+         'email': f'member{i}@example.lu', 'energyID': f'E{i:08d}'}
+        for i in range(1, members + 1)
+    ])
+    pod_records = []
+    for member_id in member_ids:
+        for p in range(pods_per_member):
+            production = p == 0 and rng.random() < 0.3
+            pod_records.append({
+                'podlabel': f'{"Roof" if production else "Home"} {member_id}-{p}',
+                'podType': 'Production' if production else 'Consumption',
+                'memberID': member_id,
+                'podNumber': f'LU{member_id:08d}{p:02d}',
+                'energyproduction': Decimal(rng.randint(2000, 9000)) if production else None,
+                'energystorage': None,
+            })
+    pod_ids = _insert_returning_ids(Pod, Pod.podsID, pod_records)
+
+    memberships = []
+    accounting = []
+    for pod_id, pod in zip(pod_ids, pod_records):
+        for group_id in rng.sample(group_ids, min(groups_per_pod, len(group_ids))):
+            memberships.append({'podID': pod_id, 'sharingGroupID': group_id})
+            sign = -1 if pod['podType'] == 'Production' else 1
+            for index, (year, month) in enumerate(periods):
+                billed = index < len(periods) - unbilled_months
+                accounting.append({
+                    'accYear': year, 'accMonth': month, 'accMember': pod['memberID'], 'accPod': pod_id,
+                    'accSGId': group_id, 'accAmount': sign * Decimal(rng.randint(100, 9000)) / 100,
+                    'accBillingDate': date(year + month // 12, month % 12 + 1, 1) if billed else None,
+                })
+    _insert(PodSharingGroup, memberships)
+    # Through the table: the ORM would replace the unbilled None by the accBillingDate default
+    _insert(Accounting.__table__, accounting)
+    mark_stale(db.session, FULL_REBUILD)
+
+    fee_ids = _insert_returning_ids(MemberFee, MemberFee.mfID, [
+        {'mfamount': Decimal('50.00'), 'mfYear': today.year - offset} for offset in range(fee_years)
+    ])
+    payments = []
+    for fee_id in fee_ids:
+        for member_id in member_ids:
+            status = rng.choices(('paid', 'pending', 'overdue'), (8, 1, 1))[0]
+            payments.append({'memberID': member_id, 'memberFeeID': fee_id, 'paymentStatus': status,
+                             'paymentDate': date(today.year, 1, rng.randint(1, 28)) if status == 'paid' else None})
+    _insert(MemberFeePayment, payments)
+    db.session.commit()
+    return {
+        'members': len(member_ids),
+        'pods': len(pod_ids),
+        'sharing_groups': len(group_ids),
+        'pod_sharing_groups': len(memberships),
+        'accounting': len(accounting),
+        'member_fees': len(fee_ids),
+        'member_fee_payments': len(payments),
+    }
+
+
+def _summary(timings, statements, statuses):
+    timings = sorted(timings)
+    return {
+        'runs': len(timings),
+        'min_ms': round(timings[0] * 1000, 3),
+        'median_ms': round(statistics.median(timings) * 1000, 3),
+        'mean_ms': round(statistics.fmean(timings) * 1000, 3),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000, 3),
+        'max_ms': round(timings[-1] * 1000, 3),
+        'statements': max(statements),
+        'status': sorted(set(statuses)),
+    }
+
+
+def _timed(client, method, url, data=None):
+    with count_queries() as statements:
+        start = time.perf_counter()
+        response = getattr(client, method)(url, data=data)
+        elapsed = time.perf_counter() - start
+    return elapsed, len(statements), response
+
+
+def _measure(client, requests):
+    timings, statements, statuses = [], [], []
+    for method, url, data in requests:
+        elapsed, count, response = _timed(client, method, url, data)
+        timings.append(elapsed)
+        statements.append(count)
+        statuses.append(response.status_code)
+    return _summary(timings, statements, statuses)
+
+
+def _member_form(i):
+    return {'name': f'Bench{i}', 'firstname': f'Mark{i}', 'nationalId': f'B{i:08d}',
+            'address': 'Bench street', 'phoneNumber': '+352 000', 'email': f'bench{i}@example.lu',
+            'energyID': f'BE{i:06d}'}
+
+
+def _pod_form(i, member_id):
+    return {'podlabel': f'Bench pod {i}', 'podType': 'Consumption', 'memberID': member_id,
+            'podNumber': f'BENCH{i:06d}', 'energyproduction': '', 'energystorage': ''}
+
+
+def _crud_cases(client, repeat):
+    """Create, read, update and delete members and pods created by the benchmark itself."""
+    results = {}
+    results['create_member'] = _measure(
+        client, [('post', '/members/new', _member_form(i)) for i in range(repeat)])
+    member_ids = db.session.scalars(
+        select(Member.id).where(Member.nationalId.like('B%')).order_by(Member.id)
+    ).all()
+    results['detail_member'] = _measure(client, [('get', f'/members/{m}', None) for m in member_ids])
+    results['update_member'] = _measure(client, [
+        ('post', f'/members/{m}/edit', dict(_member_form(i), name=f'Updated{i}', member_submit='1'))
+        for i, m in enumerate(member_ids)
+    ])
+
+    results['create_pod'] = _measure(
+        client, [('post', '/pods/new', _pod_form(i, member_ids[0])) for i in range(repeat)])
+    pod_ids = db.session.scalars(
+        select(Pod.podsID).where(Pod.podNumber.like('BENCH%')).order_by(Pod.podsID)
+    ).all()
+    results['detail_pod'] = _measure(client, [('get', f'/pods/{p}', None) for p in pod_ids])
+    results['update_pod'] = _measure(client, [
+        ('post', f'/pods/{p}/edit', dict(_pod_form(i, member_ids[0]), podlabel=f'Updated pod {i}'))
+        for i, p in enumerate(pod_ids)
+    ])
+    results['delete_pod'] = _measure(client, [('post', f'/pods/{p}/delete', None) for p in pod_ids])
+    results['delete_member'] = _measure(client, [('post', f'/members/{m}/delete', None) for m in member_ids])
+    return results
+
+
+def _billing_case(client):
+    """One billing run over all unbilled rows, from the request to the archived file."""
+    known = set(db.session.scalars(select(BillingFile.bfID)))
+    start = time.perf_counter()
+    response = client.post('/accounting/createbilling')
+    job = wait(response.location.rsplit('/', 1)[-1], timeout=BILLING_TIMEOUT, interval=0.01)
+    elapsed = time.perf_counter() - start
+    if job.jobStatus != 'done':
+        raise RuntimeError(f'Billing run failed: {job.jobError}')
+    # The archived file is only a by-product of the run, leave no trace in the data directory
+    for billing_file in BillingFile.query.filter(BillingFile.bfID.notin_(known)):
+        path = archive_path(billing_file.bfHash)
+        if os.path.exists(path):
+            os.remove(path)
+            try:
+                os.removedirs(os.path.dirname(path))
+            except OSError:
+                pass
+    summary = _summary([elapsed], [0], [response.status_code])
+    summary.update(rows=job.jobResult['billed_rows'], members=job.jobResult['members'])
+    summary.pop('statements')
+    return summary
+
+
+def run_benchmarks(client, repeat=5):
+    """Time the main pages and operations against the generated community.
+
+    Read-only pages run first, then the CRUD paths on their own records and
+    finally the billing run, which bills every unbilled record.
+    """
+    sharing_group_id = db.session.scalar(select(SharingGroup.sgID).order_by(SharingGroup.sgID))
+    member_fee_id = db.session.scalar(select(MemberFee.mfID).order_by(MemberFee.mfYear.desc()))
+    pages = {
+        'list_members': '/members',
+        'list_pods': '/pods',
+        'list_accounting': '/accounting',
+        'list_accounting_unbilled': '/accounting/unbilled',
+        'detail_member_fee': f'/member_fees/{member_fee_id}',
+        'detail_sharing_group': f'/sharing_groups/{sharing_group_id}',
+    }
+    results = {}
+    for name, url in pages.items():
+        client.get(url)  # warm up caches and compiled statements
+        # Rendered from the database each time, then served from the page cache
+        timings, statements, statuses = [], [], []
+        for _ in range(repeat):
+            pagecache.clear()
+            elapsed, count, response = _timed(client, 'get', url)
+            timings.append(elapsed)
+            statements.append(count)
+            statuses.append(response.status_code)
+        results[name] = _summary(timings, statements, statuses)
+        results[f'{name}_cached'] = _measure(client, [('get', url, None)] * repeat)
+    results.update(_crud_cases(client, repeat))
+    results['create_billing_file'] = _billing_case(client)
+    return results
+
+
+def measure_startup(repeat=5):
+    """Time importing and creating the app in fresh interpreters, as a gunicorn worker boots.
+
+    Also returns which of HEAVY_MODULES the startup imported.
+    """
+    timings = []
+    heavy = set()
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.splitlines()[-1])
+        timings.append(result['seconds'])
+        heavy.update(result['heavy'])
+    summary = _summary(timings, [0], [0])
+    summary.pop('statements')
+    summary.pop('status')
+    summary['heavy_modules'] = sorted(heavy)
+    return summary
+
+
+def benchmark_report(client, scale, repeat=5, seed=0):
+    """Generate the community, run the benchmarks and return a JSON-serialisable report."""
+    start = time.perf_counter()
+    rows = generate_community(seed=seed, **scale)
+    generate_seconds = time.perf_counter() - start
+    results = run_benchmarks(client, repeat=repeat)
+    results['cold_start'] = measure_startup(repeat)
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'database': db.engine.dialect.name,
+        'scale': dict(scale, seed=seed),
+        'rows': rows,
+        'generate_seconds': round(generate_seconds, 3),
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def compare_reports(baseline, current, tolerance=0.25):
+    """Cases whose median got slower than the baseline by more than tolerance."""
+    regressions = []
+    for name, result in current['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if before is None or not before['median_ms']:
+            continue
+        ratio = result['median_ms'] / before['median_ms']
+        if ratio > 1 + tolerance:
+            regressions.append({'case': name, 'baseline_ms': before['median_ms'],
+                                'median_ms': result['median_ms'], 'ratio': round(ratio, 2)})
+    return regressions
+
+
+def _lost_writes(created, edited):
+    """Names of the members created, and ids of the members edited, not found as written."""
+    stored = dict(db.session.execute(select(Member.id, Member.name)).all())
+    names = set(stored.values())
+    lost = [name for name in created if name not in names]
+    lost += [member_id for member_id, name in edited.items() if stored.get(member_id) != name]
+    db.session.remove()
+    return lost
+
+
+READ_URLS = ('/members', '/pods', '/accounting', '/accounting/unbilled', '/accounting/summary', '/member_fees/1')
+
+
+def run_concurrency_check(app, seconds=10, readers=4, writers=2, seed=0):
+    """Hammer the app with concurrent page reads, member writes and a billing run.
+
+    Every thread has its own test client, so requests really run side by side on
+    the connection pool. Each writer edits members of its own, so the members
+    created and the last name given to each edited one must all be found in the
+    database afterwards. Returns the operations, latencies and errors per kind;
+    a healthy database setup has no errors and no lost writes at all.
+    """
+    member_ids = db.session.scalars(select(Member.id)).all()
+    db.session.remove()
+    lock = threading.Lock()
+    stats = {kind: {'timings': [], 'statuses': []} for kind in ('read', 'write')}
+    errors = {}
+    created, edited = [], {}
+
+    def record_exception(sender, exception, **extra):
+        with lock:
+            message = f'{type(exception).__name__}: {str(exception).splitlines()[0]}'
+            errors[message] = errors.get(message, 0) + 1
+
+    def worker(kind, number, deadline):
+        client = app.test_client()
+        rng = random.Random(seed * 1000 + number)
+        i = 0
+        while time.perf_counter() < deadline:
+            if kind == 'read':
+                method, url, data = 'get', READ_URLS[i % len(READ_URLS)], None
+            elif i % 2:
+                member_id = rng.choice(member_ids[number::writers])
+                method, url, data = 'post', f'/members/{member_id}/edit', \
+                    dict(_member_form(i), name=f'Concurrent{number}-{i}', member_submit='1')
+            else:
+                method, url, data = 'post', '/members/new', _member_form(number * 1000000 + i)
+            start = time.perf_counter()
+            response = getattr(client, method)(url, data=data)
+            elapsed = time.perf_counter() - start
+            with lock:
+                stats[kind]['timings'].append(elapsed)
+                stats[kind]['statuses'].append(response.status_code)
+                # Saved once redirected to the member list or page
+                if kind == 'write' and response.status_code == 302:
+                    if url.endswith('/edit'):
+                        edited[member_id] = data['name']
+                    else:
+                        created.append(data['name'])
+            i += 1
+
+    got_request_exception.connect(record_exception, app)
+    try:
+        deadline = time.perf_counter() + seconds
+        threads = [threading.Thread(target=worker, args=('read', n, deadline)) for n in range(readers)]
+        threads += [threading.Thread(target=worker, args=('write', n, deadline)) for n in range(writers)]
+        for thread in threads:
+            thread.start()
+        billing = submit('billing', key='billing')
+        for thread in threads:
+            thread.join()
+        billing = wait(billing.jobID)
+    finally:
+        got_request_exception.disconnect(record_exception, app)
+
+    results = {kind: _summary(s['timings'], [0], s['statuses']) for kind, s in stats.items() if s['timings']}
+    for kind, result in results.items():
+        result.pop('statements')
+        result['errors'] = sum(status >= 500 for status in stats[kind]['statuses'])
+    results['billing'] = {'status': billing.jobStatus, 'rows': (billing.jobResult or {}).get('billed_rows'),
+                          'error': billing.jobError}
+    if billing.jobError:
+        errors[billing.jobError] = errors.get(billing.jobError, 0) + 1
+    lost = _lost_writes(created, edited)
+    results['writes'] = {'created': len(created), 'edited': len(edited), 'lost': len(lost)}
+    if lost:
+        errors['Lost writes'] = len(lost)
+    return {'database': db.engine.dialect.name, 'seconds': seconds, 'readers': readers, 'writers': writers,
+            'results': results, 'errors': errors}
@@ -0,0 +1,322 @@
+from sqlalchemy import update, func, select, bindparam, event, inspect
+from models import db, Member, Accounting
+from artifacts import store_billing_file, archive_path
+from summary import mark_stale_ids
+from jobs import job_handler, submit, ClaimLost
+from statements import statements_job_key
+import pagecache
+from datetime import datetime
+import logging
+import uuid
+import os
+import csv
+
+logger = logging.getLogger('comener.billing')
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+# Rows fetched per round trip from the server-side cursor
+CHUNK_SIZE = 1000
+# accIDs per UPDATE statement, kept below SQLite's bound-parameter limit
+BILL_BATCH_SIZE = 500
+
+# Kinds of the billing file lines: the first invoice of records, then the
+# adjustments of records corrected after they were invoiced
+INVOICE = 'Facture'
+SUPPLEMENT = 'Supplément'
+CREDIT_NOTE = 'Note de crédit'
+
+# Changing one of these on an invoiced record makes the next billing run adjust it
+BILLED_VALUES = ('accAmount', 'accMember')
+
+
+@event.listens_for(Accounting, 'before_update')
+def _bump_version(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in BILLED_VALUES):
+        target.accVersion = (target.accVersion or 1) + 1
+
+
+def is_invoiced(accounting):
+    # Invoiced records are corrected, never deleted, so the correction reaches the member
+    return accounting.accBilledVersion is not None
+
+
+class BillingRun:
+    """State and progress of one billing run."""
+
+    def __init__(self, filename=None, on_progress=None):
+        self.id = uuid.uuid4().hex
+        self.status = 'pending'  # 'pending', 'running', 'done', 'failed'
+        self.started = datetime.now()
+        self.finished = None
+        self.filename = filename or f"decompte-{self.started.strftime('%Y-%m-%d-%H-%M-%S')}.csv"
+        self.on_progress = on_progress
+        self.total_rows = 0
+        self.rows_done = 0
+        self.billed_rows = 0
+        self.adjusted_rows = 0
+        self.adjustments_total = 0
+        self.grandtotal = 0
+        self.billing_data = []
+        self.error = None
+        self.file_id = None
+
+    @property
+    def percent(self):
+        if self.status == 'done':
+            return 100
+        if not self.total_rows:
+            return 0
+        return int(self.rows_done * 100 / self.total_rows)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'filename': self.filename,
+            'file_id': self.file_id,
+            'total_rows': self.total_rows,
+            'rows_done': self.rows_done,
+            'billed_rows': self.billed_rows,
+            'adjusted_rows': self.adjusted_rows,
+            'adjustments_total': float(self.adjustments_total),
+            'members': len(self.billing_data),
+            'grandtotal': float(self.grandtotal),
+            'percent': self.percent,
+            'error': self.error,
+        }
+
+
+def _unbilled_rows_query():
+    # Ordered by member so the per-member totals can be folded while streaming
+    return (
+        select(
+            Accounting.accID,
+            Accounting.accMember,
+            Accounting.accAmount,
+            Accounting.accVersion,
+            Member.name,
+            Member.firstname
+        )
+        .join(Member, Accounting.accMember == Member.id)
+        .where(Accounting.accBillingDate.is_(None))
+        .order_by(Accounting.accMember, Accounting.accID)
+    )
+
+
+def _changed_rows_query():
+    # Served by the partial index of the invoiced records whose version moved on
+    return (
+        select(
+            Accounting.accID,
+            Accounting.accMember,
+            Accounting.accAmount,
+            Accounting.accVersion,
+            Accounting.accBilledMember,
+            Accounting.accBilledAmount
+        )
+        .where(Accounting.accBilledVersion < Accounting.accVersion)
+        .order_by(Accounting.accMember, Accounting.accID)
+    )
+
+
+def _billed(row, entries):
+    # Parameters of the UPDATE recording what a record is invoiced at, with the
+    # (member, amount) file entries of what this run bills of it
+    return {'_id': row.accID, '_version': row.accVersion, '_amount': row.accAmount,
+            '_member': row.accMember, 'entries': entries}
+
+
+def _member_totals(run, rows, billed):
+    """Fold the streamed accounting rows into one (member_id, name, firstname, total) per member."""
+    current = None
+    for row in rows:
+        if current is None or current[0] != row.accMember:
+            if current is not None:
+                yield current
+            current = [row.accMember, row.name, row.firstname, 0]
+        current[3] += row.accAmount or 0
+        billed.append(_billed(row, [(row.accMember, row.accAmount)]))
+        run.rows_done += 1
+        if run.on_progress is not None and run.rows_done % CHUNK_SIZE == 0:
+            run.on_progress(run)
+    if current is not None:
+        yield current
+
+
+def _adjustments(run, rows, adjusted):
+    """Net change of each member's invoiced records since they were invoiced, as {member_id: delta}.
+
+    The cost follows the number of changed records, read from their partial index.
+    Records without the member they were invoiced to cannot be adjusted: they are
+    logged and left for a later run, once their accBilledMember is set.
+    """
+    deltas = {}
+    skipped = []
+    for row in rows:
+        if row.accBilledMember is None:
+            skipped.append(row.accID)
+            continue
+        amount, billed = row.accAmount or 0, row.accBilledAmount or 0
+        if row.accBilledMember == row.accMember:
+            entries = [(row.accMember, amount - billed)]
+        else:
+            # Moved to another member: the first one is credited, the other one charged
+            entries = [(row.accBilledMember, -billed), (row.accMember, amount)]
+        for member_id, delta in entries:
+            deltas[member_id] = deltas.get(member_id, 0) + delta
+        adjusted.append(_billed(row, entries))
+        run.rows_done += 1
+        if run.on_progress is not None and run.rows_done % CHUNK_SIZE == 0:
+            run.on_progress(run)
+    if skipped:
+        logger.warning('Accounting records without a billed member not adjusted: %s',
+                       ', '.join(map(str, skipped)))
+    return deltas
+
+
+def _member_names(member_ids):
+    names = {}
+    for start in range(0, len(member_ids), BILL_BATCH_SIZE):
+        for member_id, name, firstname in db.session.execute(
+            select(Member.id, Member.name, Member.firstname)
+            .where(Member.id.in_(member_ids[start:start + BILL_BATCH_SIZE]))
+        ):
+            names[member_id] = (name, firstname)
+    return names
+
+
+def _record_billed(records, first_invoice, billing_date=None):
+    """Store the version, amount and member each record is now invoiced at, one statement per batch."""
+    stmt = update(Accounting.__table__).where(Accounting.accID == bindparam('_id')).values(
+        accBilledVersion=bindparam('_version'), accBilledAmount=bindparam('_amount'),
+        accBilledMember=bindparam('_member')
+    )
+    if first_invoice:
+        # Only the exported accIDs get a billing date, rows inserted during the run stay unbilled
+        stmt = stmt.where(Accounting.accBillingDate.is_(None)).values(accBillingDate=billing_date)
+    done = 0
+    connection = db.session.connection()
+    for start in range(0, len(records), BILL_BATCH_SIZE):
+        batch = records[start:start + BILL_BATCH_SIZE]
+        mark_stale_ids(db.session, [record['_id'] for record in batch])
+        pagecache.mark_stale(db.session, Accounting)
+        result = connection.execute(stmt, [{k: v for k, v in record.items() if k != 'entries'} for record in batch])
+        done += result.rowcount
+    return done
+
+
+def execute_billing(run, data_dir=DATA_DIR, chunk_size=CHUNK_SIZE, adjustments_only=False):
+    """Stream the unbilled accounting rows into the billing CSV and mark exactly those rows as billed.
+
+    Invoiced records corrected since follow as one supplement or credit note per
+    member, the net change of that member's records; ``adjustments_only`` leaves
+    the unbilled rows for a later run. The CSV is written to a temporary file and
+    archived once complete; the archive index and the billing dates are committed
+    in a single transaction afterwards, so a failed run leaves neither a partial
+    file nor partially billed rows behind.
+    """
+    run.status = 'running'
+    os.makedirs(data_dir, exist_ok=True)
+    partpath = os.path.join(data_dir, run.filename + '.part')
+    billed, adjusted = [], []
+    archived = None
+    try:
+        unbilled = 0 if adjustments_only else db.session.scalar(
+            select(func.count(Accounting.accID)).where(Accounting.accBillingDate.is_(None))
+        )
+        run.total_rows = unbilled + db.session.scalar(
+            select(func.count(Accounting.accID)).where(Accounting.accBilledVersion < Accounting.accVersion)
+        )
+        with open(partpath, 'w', newline='') as csv_file:
+            csv_writer = csv.writer(csv_file, delimiter=';')
+            csv_writer.writerow(["Nom", "Prénom", "Montant", "Type"])
+            if not adjustments_only:
+                rows = db.session.execute(
+                    _unbilled_rows_query().execution_options(yield_per=chunk_size)
+                )
+                for member_id, name, firstname, total in _member_totals(run, rows, billed):
+                    csv_writer.writerow([name, firstname, round(total, 2), INVOICE])
+                    run.grandtotal += total
+                    run.billing_data.append({
+                        'member_id': member_id,
+                        'name': name,
+                        'firstname': firstname,
+                        'total_amount': total,
+                        'kind': INVOICE
+                    })
+
+            # Adjustments come after the invoices, on lines of their own
+            deltas = _adjustments(run, db.session.execute(
+                _changed_rows_query().execution_options(yield_per=chunk_size)
+            ), adjusted)
+            names = _member_names(sorted(deltas))
+            for member_id in sorted(deltas):
+                delta = deltas[member_id]
+                if not delta:
+                    continue
+                name, firstname = names.get(member_id, (None, None))
+                kind = SUPPLEMENT if delta > 0 else CREDIT_NOTE
+                csv_writer.writerow([name, firstname, round(delta, 2), kind])
+                run.adjustments_total += delta
+                run.grandtotal += delta
+                run.billing_data.append({
+                    'member_id': member_id,
+                    'name': name,
+                    'firstname': firstname,
+                    'total_amount': delta,
+                    'kind': kind
+                })
+
+        entries = [(record['_id'], member_id, amount)
+                   for record in billed + adjusted for member_id, amount in record['entries']]
+        billing_file, created_archive = store_billing_file(
+            partpath, run.filename, len(run.billing_data), run.grandtotal, entries, created=run.started
+        )
+        if created_archive:
+            archived = archive_path(billing_file.bfHash)
+        run.file_id = billing_file.bfID
+        run.billed_rows = _record_billed(billed, True, datetime.now().date())
+        run.adjusted_rows = _record_billed(adjusted, False)
+        db.session.commit()
+        run.status = 'done'
+    except Exception as e:
+        db.session.rollback()
+        # Unless the job runs again elsewhere, its archive may have the same content
+        if archived is not None and not isinstance(e, ClaimLost):
+            os.remove(archived)
+        run.file_id = None
+        run.status = 'failed'
+        run.error = str(e)
+    finally:
+        if os.path.exists(partpath):
+            os.remove(partpath)
+        run.finished = datetime.now()
+        db.session.remove()
+    return run
+
+
+def _result(run):
+    result = run.to_dict()
+    result['billing_data'] = [
+        [line['member_id'], line['name'], line['firstname'], str(line['total_amount']), line['kind']]
+        for line in run.billing_data
+    ]
+    return result
+
+
+@job_handler('billing')
+def billing_job(job, filename=None, adjustments_only=False):
+    """Billing run as a background job, the job is marked done by the billing commit itself."""
+    def progress(run):
+        job.progress(run.percent, f'{run.rows_done} / {run.total_rows} records')
+
+    run = BillingRun(filename=filename, on_progress=progress)
+    job.complete_on_commit(lambda: dict(_result(run), status='done', percent=100))
+    execute_billing(run, adjustments_only=adjustments_only)
+    if run.status == 'failed':
+        raise RuntimeError(f'Billing run failed, no record has been billed: {run.error}')
+    # The statements of the members billed follow in a job of their own
+    submit('statements', {'billing_file_id': run.file_id}, key=statements_job_key(run.file_id))
+    return _result(run)
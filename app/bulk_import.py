@@ -0,0 +1,189 @@
+from sqlalchemy import insert, select
+from models import db, Member, Pod
+from jobs import job_handler
+import pandas as pd
+import os
+
+# Rows per executemany batch
+INSERT_BATCH_SIZE = 500
+
+MEMBER_COLUMNS = ['name', 'firstname', 'nationalId', 'address', 'phoneNumber', 'email', 'energyID']
+POD_COLUMNS = ['podlabel', 'podType', 'podNumber', 'energyproduction', 'energystorage']
+POD_TYPES = ('Production', 'Consumption')
+
+EMAIL_PATTERN = r'[^@\s]+@[^@\s]+\.[^@\s]+'
+
+
+def read_sheet(source, filename=None):
+    """Read a CSV (';' or ',' separated) or ODS file into a DataFrame of strings."""
+    filename = filename or getattr(source, 'filename', None) or str(source)
+    if os.path.splitext(filename)[1].lower() == '.ods':
+        df = pd.read_excel(source, engine='odf', dtype=str)
+    else:
+        df = pd.read_csv(source, sep=None, engine='python', dtype=str, encoding='utf-8-sig')
+    df.columns = [str(c).strip() for c in df.columns]
+    for column in MEMBER_COLUMNS + POD_COLUMNS:
+        if column not in df.columns:
+            df[column] = None
+    df = df[MEMBER_COLUMNS + POD_COLUMNS]
+    df = df.apply(lambda col: col.str.strip()).replace('', None)
+    # Line numbers as the user sees them in the file, after the header
+    df.index = pd.RangeIndex(2, len(df) + 2)
+    return df
+
+
+class ImportReport:
+    def __init__(self):
+        self.errors = []  # (line, message)
+        self.rows = 0
+        self.members_created = 0
+        self.members_reused = 0
+        self.pods_created = 0
+
+    def reject(self, mask, message):
+        for line in mask[mask].index:
+            self.errors.append((int(line), message))
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def to_dict(self):
+        return {
+            'rows': self.rows,
+            'members_created': self.members_created,
+            'members_reused': self.members_reused,
+            'pods_created': self.pods_created,
+            'errors': [list(error) for error in self.errors],
+            'ok': self.ok,
+        }
+
+
+def validate(df, report):
+    """Vectorised validation, returns the mask of rows that can be imported."""
+    has_pod = df['podNumber'].notna() | df['podlabel'].notna() | df['podType'].notna()
+    has_member = df[MEMBER_COLUMNS].notna().any(axis=1)
+
+    empty = ~has_pod & ~has_member
+    bad_email = df['email'].notna() & ~df['email'].fillna('').str.fullmatch(EMAIL_PATTERN)
+    bad_type = has_pod & ~df['podType'].isin(POD_TYPES)
+    bad_numbers = pd.Series(False, index=df.index)
+    for column in ('energyproduction', 'energystorage'):
+        parsed = pd.to_numeric(df[column], errors='coerce')
+        bad_numbers |= df[column].notna() & parsed.isna()
+
+    report.reject(empty, 'Empty row')
+    report.reject(bad_email, 'Invalid email address')
+    report.reject(bad_type, "podType must be 'Production' or 'Consumption'")
+    report.reject(bad_numbers, 'energyproduction and energystorage must be numbers')
+
+    # Pod numbers must be unique, both within the file and against the database
+    numbers = df['podNumber'].dropna().unique().tolist()
+    existing = set()
+    for start in range(0, len(numbers), INSERT_BATCH_SIZE):
+        existing.update(db.session.scalars(
+            select(Pod.podNumber).where(Pod.podNumber.in_(numbers[start:start + INSERT_BATCH_SIZE]))
+        ))
+    known_pod = df['podNumber'].isin(existing)
+    repeated_pod = df['podNumber'].notna() & df['podNumber'].duplicated(keep='first')
+    report.reject(known_pod, 'podNumber already exists')
+    report.reject(repeated_pod & ~known_pod, 'podNumber repeated in the file')
+
+    return ~(empty | bad_email | bad_type | bad_numbers | known_pod | repeated_pod)
+
+
+def _existing_members(national_ids):
+    found = {}
+    for start in range(0, len(national_ids), INSERT_BATCH_SIZE):
+        batch = national_ids[start:start + INSERT_BATCH_SIZE]
+        for member_id, national_id in db.session.execute(
+            select(Member.id, Member.nationalId).where(Member.nationalId.in_(batch))
+        ):
+            found.setdefault(national_id, member_id)
+    return found
+
+
+def _insert_members(records):
+    ids = []
+    for start in range(0, len(records), INSERT_BATCH_SIZE):
+        ids.extend(db.session.scalars(
+            insert(Member).returning(Member.id, sort_by_parameter_order=True),
+            records[start:start + INSERT_BATCH_SIZE]
+        ))
+    return ids
+
+
+def _records(df):
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+def import_members(source, filename=None, dry_run=False, report=None):
+    """Import members and their pods from a CSV/ODS sheet with one row per pod.
+
+    Rows sharing a nationalId describe the same member; a nationalId already in
+    the database attaches the pods to that member instead of creating a new one.
+    Invalid rows are reported by line number and skipped, the valid ones are
+    inserted in batches inside a single transaction.
+    """
+    report = report if report is not None else ImportReport()
+    try:
+        df = read_sheet(source, filename)
+    except Exception as e:
+        report.errors.append((0, f'Unreadable file: {e}'))
+        return report
+    report.rows = len(df)
+    df = df[validate(df, report)]
+
+    # One member per nationalId, rows without one each create their own member
+    has_id = df['nationalId'].notna()
+    existing = _existing_members(df.loc[has_id, 'nationalId'].unique().tolist())
+    reused = has_id & df['nationalId'].isin(existing)
+    first_of_member = ~has_id | ~df['nationalId'].duplicated(keep='first')
+    new_members = df[first_of_member & ~reused]
+
+    try:
+        new_ids = _insert_members(_records(new_members[MEMBER_COLUMNS]))
+        member_ids = pd.Series(new_ids, index=new_members.index, dtype='Int64')
+        by_national_id = dict(existing)
+        by_national_id.update(
+            (national_id, member_id)
+            for national_id, member_id in zip(new_members['nationalId'], new_ids)
+            if national_id is not None
+        )
+        member_ids = member_ids.reindex(df.index)
+        member_ids = member_ids.fillna(df['nationalId'].map(by_national_id).astype('Int64'))
+
+        pods = df[df['podType'].notna()].copy()
+        pods['memberID'] = member_ids[pods.index]
+        for column in ('energyproduction', 'energystorage'):
+            pods[column] = pd.to_numeric(pods[column])
+        pod_records = _records(pods[POD_COLUMNS + ['memberID']])
+        for start in range(0, len(pod_records), INSERT_BATCH_SIZE):
+            db.session.execute(insert(Pod), pod_records[start:start + INSERT_BATCH_SIZE])
+
+        report.members_created = len(new_members)
+        report.members_reused = int(reused[first_of_member].sum())
+        report.pods_created = len(pods)
+        report.errors.sort()
+        if dry_run:
+            db.session.rollback()
+        else:
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        report.members_created = report.members_reused = report.pods_created = 0
+        report.errors.append((0, f'Import aborted, nothing was saved: {e}'))
+        return report
+    return report
+
+
+@job_handler('import_members')
+def import_members_job(job, path, filename=None, dry_run=False):
+    """Import an uploaded sheet, the job is marked done by the import commit itself."""
+    report = ImportReport()
+    job.complete_on_commit(report.to_dict)
+    try:
+        import_members(path, filename=filename, dry_run=dry_run, report=report)
+    finally:
+        os.remove(path)
+    return report.to_dict()
@@ -0,0 +1,132 @@
+from flask import url_for
+from markupsafe import Markup
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, object_session
+from wtforms import SelectField
+from models import db, Member, Pod, SharingGroup, MemberFee
+import threading
+import time
+
+# Above this many choices a select only renders the current option and is
+# completed through the autocomplete endpoint
+AUTOCOMPLETE_THRESHOLD = 200
+AUTOCOMPLETE_LIMIT = 20
+# Safety net for changes made by other worker processes
+CACHE_TTL = 300
+
+PROVIDERS = {
+    'members': (Member, lambda: select(Member.id, Member.firstname, Member.name).order_by(Member.name, Member.firstname),
+                lambda row: f"{row.firstname} {row.name}"),
+    'pods': (Pod, lambda: select(Pod.podsID, Pod.podlabel, Pod.podNumber).order_by(Pod.podlabel),
+             lambda row: f"{row.podlabel} {row.podNumber}"),
+    'sharing_groups': (SharingGroup, lambda: select(SharingGroup.sgID, SharingGroup.sgName).order_by(SharingGroup.sgName),
+                       lambda row: row.sgName),
+    'member_fees': (MemberFee, lambda: select(MemberFee.mfID, MemberFee.mfYear, MemberFee.mfamount).order_by(MemberFee.mfYear),
+                    lambda row: f"{row.mfYear} - {row.mfamount}"),
+}
+KIND_BY_MODEL = {model: kind for kind, (model, _, _) in PROVIDERS.items()}
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def get_choices(kind):
+    """(id, label) pairs for a select field, read from the (id, label) columns only and cached."""
+    with _cache_lock:
+        entry = _cache.get(kind)
+    if entry is not None and time.monotonic() - entry[0] < CACHE_TTL:
+        return entry[1]
+    _, query, label = PROVIDERS[kind]
+    choices = [(row[0], label(row)) for row in db.session.execute(query())]
+    with _cache_lock:
+        _cache[kind] = (time.monotonic(), choices)
+    return choices
+
+
+def invalidate(*kinds):
+    with _cache_lock:
+        for kind in kinds or list(_cache):
+            _cache.pop(kind, None)
+
+
+def search_choices(kind, term, limit=AUTOCOMPLETE_LIMIT):
+    term = term.strip().lower()
+    if not term:
+        return get_choices(kind)[:limit]
+    found = []
+    for choice in get_choices(kind):
+        if term in choice[1].lower():
+            found.append(choice)
+            if len(found) == limit:
+                break
+    return found
+
+
+# Changes are collected on the session and only invalidate the cache once
+# committed, so a concurrent request cannot cache the pre-commit rows again.
+def mark_stale(session, kind):
+    if session is not None:
+        session.info.setdefault('stale_choices', set()).add(kind)
+
+
+def _on_change(mapper, connection, target):
+    mark_stale(object_session(target), KIND_BY_MODEL[mapper.class_])
+
+
+for _model in KIND_BY_MODEL:
+    for _event in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _event, _on_change)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _on_bulk_statement(orm_execute_state):
+    # Bulk INSERT/UPDATE/DELETE statements bypass the mapper events
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.class_ in KIND_BY_MODEL:
+            mark_stale(orm_execute_state.session, KIND_BY_MODEL[mapper.class_])
+
+
+@event.listens_for(Session, 'after_commit')
+def _on_commit(session):
+    stale = session.info.pop('stale_choices', None)
+    if stale:
+        invalidate(*stale)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _on_rollback(session):
+    session.info.pop('stale_choices', None)
+
+
+class LookupSelectField(SelectField):
+    """SelectField fed from a cached provider that turns into an autocomplete for large tables.
+
+    All choices are kept for validation, but above AUTOCOMPLETE_THRESHOLD only the
+    selected option is rendered and the browser searches the rest.
+    """
+
+    def __init__(self, label=None, validators=None, kind=None, **kwargs):
+        super().__init__(label, validators, **kwargs)
+        self.kind = kind
+
+    def load_choices(self):
+        self.choices = get_choices(self.kind)
+        return self
+
+    @property
+    def autocomplete(self):
+        return self.choices is not None and len(self.choices) > AUTOCOMPLETE_THRESHOLD
+
+    def iter_choices(self):
+        if not self.autocomplete:
+            yield from super().iter_choices()
+            return
+        for value, label in self.choices:
+            if self.coerce(value) == self.data:
+                yield (value, label, True, {})
+
+    def __call__(self, **kwargs):
+        if self.autocomplete:
+            kwargs['data-autocomplete'] = url_for('main.autocomplete', kind=self.kind)
+        return Markup(super().__call__(**kwargs))
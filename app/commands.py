@@ -0,0 +1,276 @@
+from flask import current_app
+from flask.cli import with_appcontext
+from models import db, Member, BillingFile
+from artifacts import import_legacy_files
+from querybudget import seed_sample_community, measure_query_counts, over_budget
+from benchmark import (
+    DEFAULT_SCALE, benchmark_report, compare_reports, generate_community, run_concurrency_check, measure_startup
+)
+from summary import rebuild_summary
+from migrations import upgrade, current_version, check_query_plans, MigrationError, HEAD
+from jobs import run_worker_pool, work
+from payments import create_fee_cycle, mark_overdue, reconcile_payments
+from statements import generate_statements, generate_statement
+import json
+import click
+
+# The allocation, energy flow, member import and load curve commands import their pandas based
+# modules when they run, the other commands and the web application never load them
+
+@click.command('allocate')
+@with_appcontext
+@click.argument('year', type=int)
+@click.argument('month', type=int)
+@click.option('--replace-unbilled', is_flag=True, help='Recompute unbilled amounts already allocated.')
+def allocate_command(year, month, replace_unbilled):
+    """Generate the accounting records of a month from the sharing groups."""
+    from allocation import run_allocation
+    summary = run_allocation(year, month, replace_unbilled=replace_unbilled)
+    click.echo(f"{summary['rows']} records allocated over {summary['groups']} sharing groups, "
+               f"{summary['written']} written, balance {summary['balance']:.2f}")
+
+@click.command('energy-flows')
+@with_appcontext
+@click.argument('year', type=int)
+@click.argument('month', type=int)
+def energy_flows_command(year, month):
+    """Record the energy flows of a month allocated before the analytics existed."""
+    from allocation import refresh_energy_flows
+    count = refresh_energy_flows(year, month)
+    click.echo(f'{count} energy flows recorded for {year}-{month:02d}')
+
+@click.command('import-members')
+@with_appcontext
+@click.argument('source', type=click.Path(exists=True, dir_okay=False))
+@click.option('--dry-run', is_flag=True, help='Only check the file, do not save.')
+def import_members_command(source, dry_run):
+    """Import members and pods from a CSV or ODS file, one row per pod."""
+    from bulk_import import import_members
+    report = import_members(source, dry_run=dry_run)
+    for line, message in report.errors:
+        click.echo(f'line {line}: {message}', err=True)
+    click.echo(f'{report.rows} rows read, {report.members_created} members created, '
+               f'{report.members_reused} existing members reused, {report.pods_created} pods created')
+
+@click.command('ingest-loadcurve')
+@with_appcontext
+@click.argument('source', type=click.Path(exists=True, dir_okay=False))
+@click.option('--pod-column', default='podNumber', show_default=True)
+@click.option('--time-column', default='timestamp', show_default=True)
+@click.option('--value-column', default='value', show_default=True)
+@click.option('--delimiter', default=';', show_default=True)
+@click.option('--time-format', default=None, help='strftime format of the timestamps, inferred if omitted.')
+def ingest_loadcurve_command(source, pod_column, time_column, value_column, delimiter, time_format):
+    """Import a 15-minute load curve export into the load-curve store."""
+    from loadcurves import ingest_csv
+    stats = ingest_csv(source, pod_column=pod_column, time_column=time_column,
+                       value_column=value_column, delimiter=delimiter, time_format=time_format)
+    click.echo(f"{stats['rows']} readings read, {stats['stored']} stored in {stats['partitions']} partitions, "
+               f"{stats['unknown_pod']} for unknown pods, {stats['invalid']} invalid")
+
+@click.command('fee-cycle')
+@with_appcontext
+@click.argument('year', type=int)
+@click.option('--amount', type=float, help='Amount of a new member fee.')
+@click.option('--due', type=click.DateTime(['%Y-%m-%d']), help='Due date of the payments, today if omitted.')
+def fee_cycle_command(year, amount, due):
+    """Create the member fee of a year with a pending payment for every member."""
+    member_fee, created = create_fee_cycle(year, amount=amount, due=due.date() if due else None)
+    db.session.commit()
+    click.echo(f'Member fee {member_fee.mfID} ({year}): {created} pending payments created')
+
+@click.command('mark-overdue')
+@with_appcontext
+@click.option('--days', default=30, show_default=True, help='Days after the due date.')
+@click.option('--member-fee', type=int, help='Only the payments of this member fee.')
+def mark_overdue_command(days, member_fee):
+    """Mark overdue the pending payments due more than DAYS ago."""
+    changed = mark_overdue(days, member_fee_id=member_fee)
+    db.session.commit()
+    click.echo(f'{changed} payments marked overdue')
+
+@click.command('statements')
+@with_appcontext
+@click.argument('billing_file_id', type=int)
+@click.option('--member', type=int, help='Only this member, rendered in this process.')
+@click.option('--workers', type=int, help='Processes rendering the statements, one per CPU by default.')
+def statements_command(billing_file_id, member, workers):
+    """Render the member statements of a billing file into the archive directory."""
+    billing_file = db.session.get(BillingFile, billing_file_id)
+    if billing_file is None:
+        raise click.ClickException(f'No billing file {billing_file_id}')
+    if member is not None:
+        click.echo(generate_statement(billing_file, member))
+        return
+    count = generate_statements(billing_file, workers=workers)
+    click.echo(f'{count} statements written')
+
+@click.command('reconcile-payments')
+@with_appcontext
+@click.argument('source', type=click.Path(exists=True, dir_okay=False))
+@click.option('--dry-run', is_flag=True, help='Only check the file, do not save.')
+def reconcile_payments_command(source, dry_run):
+    """Mark paid the member fee payments whose reference appears in a bank export."""
+    report = reconcile_payments(source, dry_run=dry_run)
+    for line, message in report.errors:
+        click.echo(f'line {line}: {message}', err=True)
+    click.echo(f'{report.lines} lines read, {report.paid} payments marked paid, '
+               f'{report.already_paid} already paid, {report.ignored} without a fee reference')
+
+@click.command('check-query-budgets')
+@with_appcontext
+def check_query_budgets_command():
+    """Seed an empty database and check the SQL statements per page against their budget."""
+    upgrade()
+    if db.session.query(Member.id).first() is not None:
+        raise click.ClickException('Needs an empty database, e.g. DATABASE_URL=sqlite:// flask check-query-budgets')
+    seed_sample_community()
+    results = measure_query_counts(current_app.test_client())
+    for result in results:
+        click.echo(f"{result['endpoint']:<28} {result['statements']:>3} / {result['budget']:<3} HTTP {result['status']}")
+    failed = over_budget(results)
+    if failed:
+        raise click.ClickException(f"Over budget: {', '.join(r['endpoint'] for r in failed)}")
+
+@click.command('benchmark')
+@with_appcontext
+@click.option('--members', default=DEFAULT_SCALE['members'], show_default=True)
+@click.option('--pods-per-member', default=DEFAULT_SCALE['pods_per_member'], show_default=True)
+@click.option('--sharing-groups', default=DEFAULT_SCALE['sharing_groups'], show_default=True)
+@click.option('--groups-per-pod', default=DEFAULT_SCALE['groups_per_pod'], show_default=True)
+@click.option('--months', default=DEFAULT_SCALE['months'], show_default=True, help='Months of accounting history.')
+@click.option('--unbilled-months', default=DEFAULT_SCALE['unbilled_months'], show_default=True)
+@click.option('--fee-years', default=DEFAULT_SCALE['fee_years'], show_default=True)
+@click.option('--repeat', default=5, show_default=True, help='Requests per timed case.')
+@click.option('--seed', default=0, show_default=True)
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the JSON report to a file instead of stdout.')
+@click.option('--baseline', type=click.File(), help='Earlier JSON report to check for regressions.')
+@click.option('--tolerance', default=0.25, show_default=True, help='Allowed slowdown of the median against the baseline.')
+def benchmark_command(repeat, seed, output, baseline, tolerance, **scale):
+    """Generate a synthetic community in an empty database and time the main pages and operations."""
+    upgrade()
+    if db.session.query(Member.id).first() is not None:
+        raise click.ClickException('Needs an empty database, e.g. DATABASE_URL=sqlite:////tmp/benchmark.db flask benchmark')
+    current_app.config['WTF_CSRF_ENABLED'] = False
+    report = benchmark_report(current_app.test_client(), scale, repeat=repeat, seed=seed)
+    if output:
+        with open(output, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+    else:
+        click.echo(json.dumps(report, indent=2))
+    if baseline:
+        regressions = compare_reports(json.load(baseline), report, tolerance=tolerance)
+        for regression in regressions:
+            click.echo(f"{regression['case']:<28} {regression['baseline_ms']:>10.1f} ms -> "
+                       f"{regression['median_ms']:>10.1f} ms  x{regression['ratio']}", err=True)
+        if regressions:
+            raise click.ClickException(f'{len(regressions)} cases slower than the baseline')
+
+@click.command('check-concurrency')
+@with_appcontext
+@click.option('--seconds', default=10, show_default=True)
+@click.option('--readers', default=4, show_default=True, help='Threads reading list pages.')
+@click.option('--writers', default=2, show_default=True, help='Threads creating and editing members.')
+@click.option('--members', default=500, show_default=True, help='Members of the generated community.')
+def check_concurrency_command(seconds, readers, writers, members):
+    """Read and write concurrently, with a billing run, in an empty database and fail on any error."""
+    upgrade()
+    if db.session.query(Member.id).first() is not None:
+        raise click.ClickException('Needs an empty database, e.g. DATABASE_URL=sqlite:////tmp/concurrency.db '
+                                   'COMENER_DATABASE_MODE=production flask check-concurrency')
+    current_app.config['WTF_CSRF_ENABLED'] = False
+    generate_community(members=members)
+    report = run_concurrency_check(current_app._get_current_object(), seconds=seconds, readers=readers, writers=writers)
+    click.echo(json.dumps(report, indent=2))
+    if report['errors']:
+        raise click.ClickException(f"{sum(report['errors'].values())} errors under concurrent load")
+
+@click.command('jobs-worker')
+@with_appcontext
+@click.option('--processes', default=2, show_default=True, help='Worker processes, 1 runs in this process.')
+@click.option('--once', is_flag=True, help='Run the queued jobs, then stop.')
+def jobs_worker_command(processes, once):
+    """Run the background jobs queued by the web application."""
+    if once:
+        work(current_app._get_current_object(), once=True)
+    else:
+        run_worker_pool(current_app._get_current_object(), processes=processes)
+
+@click.command('rebuild-summary')
+@with_appcontext
+def rebuild_summary_command():
+    """Recompute the accounting summary table from all accounting records."""
+    upgrade()
+    rebuild_summary()
+    db.session.commit()
+    click.echo('Accounting summary rebuilt')
+
+@click.command('db-upgrade')
+@with_appcontext
+@click.option('--no-backup', is_flag=True, help='Do not copy the SQLite file before migrating.')
+def db_upgrade_command(no_backup):
+    """Create the database, or migrate an existing one to the current schema."""
+    try:
+        applied = upgrade(backup=not no_backup)
+    except MigrationError as e:
+        raise click.ClickException(str(e))
+    for number, description in applied:
+        click.echo(f'Applied migration {number}: {description}')
+    click.echo(f'Database at schema version {HEAD}')
+
+@click.command('db-version')
+@with_appcontext
+def db_version_command():
+    """Show the schema version of the database."""
+    with db.engine.connect() as connection:
+        version = current_version(connection)
+    click.echo('No database' if version is None else f'Schema version {version}, current is {HEAD}')
+
+@click.command('check-query-plans')
+@with_appcontext
+def check_query_plans_command():
+    """EXPLAIN the hot queries and fail when one does not read its table through the expected index."""
+    upgrade(backup=False)
+    with db.engine.connect() as connection:
+        results = check_query_plans(connection)
+        connection.rollback()
+    for name, index, plan, problems in results:
+        click.echo(f"{'FAIL' if problems else 'ok':<10} {name} ({index})")
+        for line in plan + problems:
+            click.echo(f'           {line}')
+    failed = [name for name, _, _, problems in results if problems]
+    if failed:
+        raise click.ClickException(f"Not using the expected index: {', '.join(failed)}")
+
+@click.command('archive-legacy-files')
+@with_appcontext
+def archive_legacy_files_command():
+    """Move the billing files written before the archive into it."""
+    count = import_legacy_files()
+    click.echo(f'{count} billing files archived')
+
+
+@click.command('check-startup')
+@click.option('--repeat', default=5, show_default=True)
+@click.option('--max-ms', type=float, help='Also fail when the median startup is slower.')
+def check_startup_command(repeat, max_ms):
+    """Time the application startup in fresh interpreters and fail if it loads pandas or numpy."""
+    result = measure_startup(repeat)
+    click.echo(f"startup median {result['median_ms']:.1f} ms, min {result['min_ms']:.1f} ms, max {result['max_ms']:.1f} ms")
+    if result['heavy_modules']:
+        raise click.ClickException(f"Startup imports {', '.join(result['heavy_modules'])}")
+    if max_ms is not None and result['median_ms'] > max_ms:
+        raise click.ClickException(f'Startup slower than {max_ms} ms')
+
+COMMANDS = (
+    allocate_command, energy_flows_command, import_members_command, ingest_loadcurve_command, fee_cycle_command,
+    mark_overdue_command, reconcile_payments_command, check_query_budgets_command,
+    benchmark_command, check_concurrency_command, check_startup_command, jobs_worker_command,
+    rebuild_summary_command, db_upgrade_command, db_version_command, check_query_plans_command,
+    archive_legacy_files_command, statements_command,
+)
+
+
+def init_commands(app):
+    for command in COMMANDS:
+        app.cli.add_command(command)
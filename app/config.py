@@ -0,0 +1,17 @@
+import os
+from pathlib import Path
+
+basedir = Path(__file__).resolve().parent.parent
+
+class Config:
+    SECRET_KEY = os.environ.get('SECRET_KEY') or 'your-secret-key'
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
+        'sqlite:///' + str(basedir / 'database' / 'commEnergy.db')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Bearer token required by the JSON API, which is open like the pages when unset
+    API_TOKEN = os.environ.get('COMENER_API_TOKEN')
+    # Shared by the web and job worker processes, each has its own in-memory cache when unset
+    PAGE_CACHE_DIR = os.environ.get('COMENER_PAGE_CACHE_DIR')
+    # On with a PAGE_CACHE_DIR when unset; COMENER_PAGE_CACHE=1 without one suits a single process only
+    PAGE_CACHE_ENABLED = os.environ['COMENER_PAGE_CACHE'] == '1' if 'COMENER_PAGE_CACHE' in os.environ else None
+    JOBS_LOCAL_WORKER = os.environ.get('COMENER_JOBS_LOCAL_WORKER', '1') == '1'
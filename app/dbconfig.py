@@ -0,0 +1,89 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from models import db
+import logging
+import os
+
+logger = logging.getLogger('comener.database')
+
+# Applied to every new SQLite connection in production mode
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',  # readers no longer block the writer, nor the writer the readers
+    'synchronous': 'NORMAL',  # safe with WAL, fsync only at checkpoints
+    'cache_size': -64000,  # KiB, negative means a size rather than a page count
+    'mmap_size': 256 * 1024 * 1024,
+    'busy_timeout': 10000,  # ms to wait for the write lock instead of failing with "database is locked"
+    'temp_store': 'MEMORY',
+}
+
+POOL_DEFAULTS = {
+    'DATABASE_POOL_SIZE': 10,
+    'DATABASE_MAX_OVERFLOW': 20,
+    'DATABASE_POOL_TIMEOUT': 30,
+    'DATABASE_POOL_RECYCLE': 1800,
+}
+
+
+def _in_memory(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(app):
+    """Pool settings shared by SQLite files and Postgres."""
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    if _in_memory(url):
+        # Flask-SQLAlchemy keeps a single static connection for in-memory databases
+        return {}
+    options = {
+        'pool_size': app.config['DATABASE_POOL_SIZE'],
+        'max_overflow': app.config['DATABASE_MAX_OVERFLOW'],
+        'pool_timeout': app.config['DATABASE_POOL_TIMEOUT'],
+        'pool_recycle': app.config['DATABASE_POOL_RECYCLE'],
+        'pool_pre_ping': True,
+    }
+    if url.get_backend_name() == 'sqlite':
+        # The pool hands connections to other threads, the busy timeout does the locking
+        options['connect_args'] = {
+            'check_same_thread': False,
+            'timeout': app.config['SQLITE_PRAGMAS']['busy_timeout'] / 1000,
+        }
+    return options
+
+
+def _set_sqlite_pragmas(pragmas):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name} = {value}')
+        finally:
+            cursor.close()
+    return on_connect
+
+
+def init_database(app):
+    """Bind the SQLAlchemy extension to the app, tuned for concurrent use in production mode.
+
+    Production mode is enabled with DATABASE_MODE or COMENER_DATABASE_MODE set to
+    'production'. It configures the connection pool for SQLite files and Postgres
+    alike, and sets SQLITE_PRAGMAS on every new SQLite connection. Otherwise the
+    SQLAlchemy defaults are kept.
+    """
+    app.config.setdefault('DATABASE_MODE', os.environ.get('COMENER_DATABASE_MODE', 'default'))
+    for key, default in POOL_DEFAULTS.items():
+        app.config.setdefault(key, int(os.environ.get(f'COMENER_{key}', default)))
+    app.config.setdefault('SQLITE_PRAGMAS', dict(SQLITE_PRAGMAS))
+    production = app.config['DATABASE_MODE'] == 'production'
+    if production:
+        options = engine_options(app)
+        options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    db.init_app(app)
+
+    if production:
+        with app.app_context():
+            engine = db.engine
+        if engine.dialect.name == 'sqlite' and not _in_memory(engine.url):
+            event.listen(engine, 'connect', _set_sqlite_pragmas(app.config['SQLITE_PRAGMAS']))
+        logger.info('Production database mode on %s', engine.dialect.name)
@@ -0,0 +1,293 @@
+from sqlalchemy import select, exists, Integer, Numeric, Date, DateTime
+from models import db, Member, Pod, SharingGroup, PodSharingGroup, MemberFee, MemberFeePayment, Accounting
+from payments import STATUS_FILTERS
+from queries import member_name_filter
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+from xml.sax.saxutils import escape
+import importlib.util
+import csv
+import io
+import zipfile
+
+# Rows fetched per round trip from the server-side cursor, and per Parquet row group
+EXPORT_CHUNK_SIZE = 5000
+
+
+class Export:
+    """A table accountants can download: labelled columns, the rows' FROM clause and the filters it accepts.
+
+    ``filters`` maps a query argument to a function turning its value into a
+    WHERE criterion, the arguments are the ones of the matching list page.
+    """
+
+    def __init__(self, columns, joins, filters, order_by):
+        self.columns = columns
+        self.joins = joins
+        self.filters = filters
+        self.order_by = order_by
+
+    @property
+    def headers(self):
+        return [column.key for column in self.columns]
+
+    def query(self, args):
+        stmt = select(*self.columns)
+        for target, onclause in self.joins:
+            stmt = stmt.join(target, onclause)
+        for arg, criterion in self.filters.items():
+            value = args.get(arg, '').strip()
+            if value:
+                stmt = stmt.where(criterion(value))
+        return stmt.order_by(*self.order_by)
+
+
+def _int(column):
+    return lambda value: column == int(value)
+
+
+def _in_sharing_group(value):
+    return exists(
+        select(Pod.podsID)
+        .join(PodSharingGroup, PodSharingGroup.podID == Pod.podsID)
+        .where(Pod.memberID == Member.id, PodSharingGroup.sharingGroupID == int(value))
+    )
+
+
+EXPORTS = {
+    'accounting': Export(
+        columns=[
+            Accounting.accID.label('id'),
+            Accounting.accYear.label('year'),
+            Accounting.accMonth.label('month'),
+            Accounting.accMember.label('member_id'),
+            Member.name.label('name'),
+            Member.firstname.label('firstname'),
+            Pod.podNumber.label('pod'),
+            SharingGroup.sgName.label('sharing_group'),
+            Accounting.accAmount.label('amount'),
+            Accounting.accBillingDate.label('billing_date'),
+        ],
+        joins=[
+            (Member, Accounting.accMember == Member.id),
+            (Pod, Accounting.accPod == Pod.podsID),
+            (SharingGroup, Accounting.accSGId == SharingGroup.sgID),
+        ],
+        filters={
+            'year': _int(Accounting.accYear),
+            'month': _int(Accounting.accMonth),
+            'member': _int(Accounting.accMember),
+            'sharing_group': _int(Accounting.accSGId),
+        },
+        order_by=[Accounting.accID],
+    ),
+    'members': Export(
+        columns=[
+            Member.id.label('id'),
+            Member.name.label('name'),
+            Member.firstname.label('firstname'),
+            Member.nationalId.label('national_id'),
+            Member.address.label('address'),
+            Member.phoneNumber.label('phone'),
+            Member.email.label('email'),
+            Member.energyID.label('energy_id'),
+        ],
+        joins=[],
+        filters={
+            'q': member_name_filter,
+            'member': _int(Member.id),
+            'sharing_group': _in_sharing_group,
+        },
+        order_by=[Member.id],
+    ),
+    'payments': Export(
+        columns=[
+            MemberFeePayment.mfpID.label('id'),
+            MemberFee.mfYear.label('year'),
+            MemberFeePayment.memberID.label('member_id'),
+            Member.name.label('name'),
+            Member.firstname.label('firstname'),
+            MemberFee.mfamount.label('amount'),
+            MemberFeePayment.paymentStatus.label('status'),
+            MemberFeePayment.paymentDue.label('due'),
+            MemberFeePayment.paymentDate.label('paid_on'),
+        ],
+        joins=[
+            (MemberFee, MemberFeePayment.memberFeeID == MemberFee.mfID),
+            (Member, MemberFeePayment.memberID == Member.id),
+        ],
+        filters={
+            'year': _int(MemberFee.mfYear),
+            'member_fee': _int(MemberFeePayment.memberFeeID),
+            'member': _int(MemberFeePayment.memberID),
+            # A status, or one of the member fee page's filters such as 'open'
+            'status': lambda value: MemberFeePayment.paymentStatus.in_(STATUS_FILTERS.get(value, (value,))),
+            'sharing_group': _in_sharing_group,
+        },
+        order_by=[MemberFeePayment.mfpID],
+    ),
+}
+
+
+def _cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _chunks(stmt):
+    # Partitions of the server-side cursor: only one chunk of rows is held at a time
+    result = db.session.execute(stmt.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+    yield from result.partitions()
+
+
+def write_csv(export, stmt):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+    writer.writerow(export.headers)
+    for rows in _chunks(stmt):
+        writer.writerows([_cell(value) for value in row] for row in rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+class _Output(io.RawIOBase):
+    """A write-only stream collecting what a writer produced since the last ``take``.
+
+    It tells its position, as the Parquet writer needs, but cannot seek.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+ODS_MIMETYPE = 'application/vnd.oasis.opendocument.spreadsheet'
+ODS_MANIFEST = f'''<?xml version="1.0" encoding="UTF-8"?>
+<manifest:manifest xmlns:manifest="urn:oasis:names:tc:opendocument:xmlns:manifest:1.0" manifest:version="1.2">
+<manifest:file-entry manifest:full-path="/" manifest:media-type="{ODS_MIMETYPE}"/>
+<manifest:file-entry manifest:full-path="content.xml" manifest:media-type="text/xml"/>
+</manifest:manifest>
+'''
+ODS_CONTENT_START = '''<?xml version="1.0" encoding="UTF-8"?>
+<office:document-content xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0"
+ xmlns:table="urn:oasis:names:tc:opendocument:xmlns:table:1.0"
+ xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0" office:version="1.2">
+<office:body><office:spreadsheet><table:table table:name="{name}">'''
+ODS_CONTENT_END = '</table:table></office:spreadsheet></office:body></office:document-content>\n'
+
+
+def _ods_cell(value):
+    if value is None:
+        return '<table:table-cell/>'
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return (f'<table:table-cell office:value-type="float" office:value="{value}">'
+                f'<text:p>{value}</text:p></table:table-cell>')
+    if isinstance(value, (date, datetime)):
+        return (f'<table:table-cell office:value-type="date" office:date-value="{value.isoformat()}">'
+                f'<text:p>{value.isoformat()}</text:p></table:table-cell>')
+    return f'<table:table-cell office:value-type="string"><text:p>{escape(str(value))}</text:p></table:table-cell>'
+
+
+def _ods_row(values):
+    return '<table:table-row>' + ''.join(_ods_cell(value) for value in values) + '</table:table-row>'
+
+
+def write_ods(export, stmt, name):
+    """The spreadsheet written by hand, not with odfpy: odfpy builds the whole document in memory.
+
+    The zip is written to an unseekable output, each entry's sizes follow its data,
+    so the content is compressed and sent as the rows are read.
+    """
+    output = _Output()
+    with zipfile.ZipFile(output, 'w') as ods:
+        # The mimetype comes first and uncompressed, where readers look for it
+        ods.writestr('mimetype', ODS_MIMETYPE, compress_type=zipfile.ZIP_STORED)
+        ods.writestr('META-INF/manifest.xml', ODS_MANIFEST, compress_type=zipfile.ZIP_DEFLATED)
+        info = zipfile.ZipInfo('content.xml')
+        info.compress_type = zipfile.ZIP_DEFLATED
+        with ods.open(info, 'w') as content:
+            content.write((ODS_CONTENT_START.format(name=escape(name)) + _ods_row(export.headers)).encode())
+            for rows in _chunks(stmt):
+                content.write(''.join(_ods_row(row) for row in rows).encode())
+                yield output.take()
+            content.write(ODS_CONTENT_END.encode())
+    yield output.take()
+
+
+def _arrow_type(pa, column):
+    kind = column.type
+    if isinstance(kind, Integer):
+        return pa.int64()
+    if isinstance(kind, Numeric):
+        return pa.decimal128(kind.precision or 18, kind.scale or 2)
+    if isinstance(kind, DateTime):
+        return pa.timestamp('us')
+    if isinstance(kind, Date):
+        return pa.date32()
+    return pa.string()
+
+
+def write_parquet(export, stmt):
+    """One row group per chunk of rows, with pyarrow, which only this format needs."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([(column.key, _arrow_type(pa, column)) for column in export.columns])
+    output = _Output()
+    with pq.ParquetWriter(pa.PythonFile(output, mode='w'), schema) as writer:
+        for rows in _chunks(stmt):
+            columns = list(zip(*rows))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema
+            ))
+            yield output.take()
+    yield output.take()
+
+
+# Format: (file extension, mimetype)
+FORMATS = {
+    'csv': ('csv', 'text/csv'),
+    'ods': ('ods', ODS_MIMETYPE),
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+
+
+@lru_cache(maxsize=None)
+def available_formats():
+    """The formats this installation can write, Parquet only when pyarrow is installed."""
+    return tuple(fmt for fmt in FORMATS if fmt != 'parquet' or importlib.util.find_spec('pyarrow') is not None)
+
+
+def stream_export(name, fmt, args):
+    """Chunks of the export file of ``name`` in ``fmt``, filtered by the query arguments ``args``.
+
+    Raises ValueError on a filter value that is not a number.
+    """
+    export = EXPORTS[name]
+    stmt = export.query(args)
+    if fmt == 'csv':
+        return write_csv(export, stmt)
+    if fmt == 'ods':
+        return write_ods(export, stmt, name)
+    return write_parquet(export, stmt)
@@ -0,0 +1,73 @@
+from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileRequired, FileAllowed
+from wtforms import StringField, SelectField, FloatField, IntegerField, TextAreaField, DateField, BooleanField
+from wtforms.validators import DataRequired, Email, AnyOf, Optional, NumberRange
+from choices import LookupSelectField
+from datetime import date
+
+class MemberForm(FlaskForm):
+    name = StringField('Name', validators=[Optional()])
+    firstname = StringField('Firstname', validators=[Optional()])
+    nationalId = StringField('National ID', validators=[Optional()])
+    address = TextAreaField('Address', validators=[Optional()])
+    phoneNumber = StringField('Phone Number', validators=[Optional()])
+    email = StringField('Email', validators=[Optional(), Email()])
+    energyID = StringField('Energy ID', validators=[Optional()])
+
+class MemberImportForm(FlaskForm):
+    file = FileField('CSV or ODS file', validators=[FileRequired(), FileAllowed(['csv', 'ods'], 'CSV or ODS files only')])
+    dryRun = BooleanField('Only check the file, do not save')
+
+class PodForm(FlaskForm):
+    podlabel = StringField('Pod Label', validators=[Optional()])
+    podType = SelectField('Pod Type', choices=[('Production', 'Production'), ('Consumption', 'Consumption')], validators=[DataRequired()])
+    memberID = LookupSelectField('Member', kind='members', coerce=int, validators=[DataRequired()])
+    podNumber = StringField('Pod Number', validators=[Optional()])
+    energyproduction = FloatField('Energy Production', validators=[Optional()])
+    energystorage = FloatField('Energy Storage', validators=[Optional()])
+
+class SharingGroupForm(FlaskForm):
+    sgName = StringField('Sharing Group Name', validators=[Optional()])
+    sgNumber = StringField('Sharing Group Number', validators=[Optional()])
+    sgType = SelectField('Pod Type', choices=[('National', 'National'), ('Local', 'Local')], validators=[DataRequired()])
+    sgPrice = FloatField('Price', validators=[Optional()])
+
+class PodSharingGroupForm(FlaskForm):
+    podID = LookupSelectField('Pod', kind='pods', coerce=int, validators=[DataRequired()])
+    sharingGroupID = LookupSelectField('Sharing Group', kind='sharing_groups', coerce=int, validators=[DataRequired()])
+
+class MemberFeeForm(FlaskForm):
+    mfamount = FloatField('Amount', validators=[Optional()])
+    mfYear = IntegerField('Year', validators=[Optional()])
+    generatePayments = BooleanField('Create a pending payment for every member', default=True)
+
+class MemberFeePaymentForm(FlaskForm):
+    memberID = LookupSelectField('Member', kind='members', coerce=int, validators=[DataRequired()])
+    memberFeeID = LookupSelectField('Member Fee', kind='member_fees', coerce=int, validators=[DataRequired()])
+    paymentDate = DateField('Payment Date', validators=[Optional()])
+    paymentStatus = SelectField('Payment Status', choices=[('pending', 'Pending'), ('paid', 'Paid'), ('overdue', 'Overdue')], validators=[DataRequired()])
+    paymentDue = DateField('Due Date', validators=[Optional()])
+
+class OverduePaymentsForm(FlaskForm):
+    days = IntegerField('Days after the due date', default=30, validators=[NumberRange(min=0)])
+
+class PaymentStatusForm(FlaskForm):
+    status = SelectField('New status', choices=[('pending', 'Pending'), ('paid', 'Paid'), ('overdue', 'Overdue')], validators=[DataRequired()])
+
+class BankReconciliationForm(FlaskForm):
+    file = FileField('Bank export (CSV)', validators=[FileRequired(), FileAllowed(['csv', 'txt'], 'CSV files only')])
+    dryRun = BooleanField('Only check the file, do not save')
+
+class AccountingForm(FlaskForm):
+    accYear = IntegerField('Year', validators=[DataRequired()])
+    accMonth = IntegerField('Month', validators=[DataRequired()])
+    accMember = LookupSelectField('Member', kind='members', coerce=int, validators=[DataRequired()])
+    accPod = LookupSelectField('Pod', kind='pods', coerce=int, validators=[DataRequired()])
+    accAmount = FloatField('Amount', validators=[Optional()])
+    accBillingDate = DateField('Billing Date', default=date.today, validators=[Optional()])
+    accSGId = LookupSelectField('Sharing Group', kind='sharing_groups', coerce=int, validators=[DataRequired()]) 
+
+class AllocationForm(FlaskForm):
+    accYear = IntegerField('Year', validators=[DataRequired()])
+    accMonth = IntegerField('Month', validators=[DataRequired(), NumberRange(min=1, max=12)])
+    replaceUnbilled = BooleanField('Recompute unbilled amounts already allocated')
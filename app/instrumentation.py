@@ -0,0 +1,156 @@
+from flask import g, current_app, has_app_context, has_request_context, request, Response, abort
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from contextlib import contextmanager
+import logging
+import threading
+import time
+import os
+
+logger = logging.getLogger('comener.instrumentation')
+slow_query_logger = logging.getLogger('comener.slowquery')
+
+DEFAULT_SLOW_QUERY_MS = 100
+
+
+class Metrics:
+    """Per-endpoint request and SQL statistics, accumulated since startup."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+        self.background = {'statements': 0, 'sql_seconds': 0.0}
+        self.slow_queries = 0
+
+    def record_request(self, endpoint, seconds, statements, sql_seconds, status):
+        with self.lock:
+            stats = self.endpoints.setdefault(endpoint, {
+                'requests': 0, 'errors': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+                'statements': 0, 'sql_seconds': 0.0
+            })
+            stats['requests'] += 1
+            stats['errors'] += status >= 500
+            stats['seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            stats['statements'] += statements
+            stats['sql_seconds'] += sql_seconds
+
+    def record_background(self, seconds):
+        with self.lock:
+            self.background['statements'] += 1
+            self.background['sql_seconds'] += seconds
+
+    def render(self):
+        """Prometheus text exposition of the collected metrics."""
+        lines = []
+        with self.lock:
+            for name, key, kind in (
+                ('comener_requests_total', 'requests', 'counter'),
+                ('comener_request_errors_total', 'errors', 'counter'),
+                ('comener_request_seconds_total', 'seconds', 'counter'),
+                ('comener_request_seconds_max', 'max_seconds', 'gauge'),
+                ('comener_sql_statements_total', 'statements', 'counter'),
+                ('comener_sql_seconds_total', 'sql_seconds', 'counter'),
+            ):
+                lines.append(f'# TYPE {name} {kind}')
+                for endpoint, stats in sorted(self.endpoints.items()):
+                    lines.append(f'{name}{{endpoint="{endpoint}"}} {stats[key]}')
+            lines.append('# TYPE comener_background_sql_statements_total counter')
+            lines.append(f"comener_background_sql_statements_total {self.background['statements']}")
+            lines.append('# TYPE comener_background_sql_seconds_total counter')
+            lines.append(f"comener_background_sql_seconds_total {self.background['sql_seconds']}")
+            lines.append('# TYPE comener_slow_queries_total counter')
+            lines.append(f'comener_slow_queries_total {self.slow_queries}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    if has_request_context():
+        g.sql_statements = g.get('sql_statements', 0) + 1
+        g.sql_seconds = g.get('sql_seconds', 0.0) + elapsed
+    else:
+        metrics.record_background(elapsed)
+    threshold = _slow_query_seconds()
+    if threshold is not None and elapsed >= threshold:
+        with metrics.lock:
+            metrics.slow_queries += 1
+        slow_query_logger.warning('%.1f ms %s%s', elapsed * 1000, statement,
+                                  f' [{request.endpoint}]' if has_request_context() else '')
+
+
+def _slow_query_seconds():
+    if not has_app_context():
+        return DEFAULT_SLOW_QUERY_MS / 1000
+    value = current_app.config.get('SLOW_QUERY_MS', DEFAULT_SLOW_QUERY_MS)
+    return None if value is None else value / 1000
+
+
+def _start_timer():
+    g.request_start = time.perf_counter()
+    g.sql_statements = 0
+    g.sql_seconds = 0.0
+
+
+def _record(response):
+    start = g.pop('request_start', None)
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    statements = g.get('sql_statements', 0)
+    sql_seconds = g.get('sql_seconds', 0.0)
+    metrics.record_request(request.endpoint or 'unmatched', elapsed, statements, sql_seconds,
+                           response.status_code)
+    response.headers['Server-Timing'] = (
+        f'app;dur={elapsed * 1000:.1f}, sql;dur={sql_seconds * 1000:.1f};desc="{statements} statements"'
+    )
+    return response
+
+
+def init_instrumentation(app):
+    """Collect request timings and SQL statement counts when INSTRUMENTATION is enabled.
+
+    Nothing is registered otherwise, so a disabled app pays no overhead at all.
+    Enabled apps expose the totals at /metrics in the Prometheus text format and
+    log statements slower than SLOW_QUERY_MS to the 'comener.slowquery' logger.
+    """
+    app.config.setdefault('INSTRUMENTATION', os.environ.get('COMENER_INSTRUMENTATION', '') == '1')
+    app.config.setdefault('SLOW_QUERY_MS', int(os.environ.get('COMENER_SLOW_QUERY_MS', DEFAULT_SLOW_QUERY_MS)))
+    if not app.config['INSTRUMENTATION']:
+        return
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    app.before_request(_start_timer)
+    app.after_request(_record)
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        if not app.config['INSTRUMENTATION']:
+            abort(404)
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    logger.info('Instrumentation enabled, slow query threshold %s ms', app.config['SLOW_QUERY_MS'])
+
+
+@contextmanager
+def count_queries():
+    """Collect the SQL statements executed inside the block, whether instrumentation is enabled or not."""
+    statements = []
+
+    def collect(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, 'after_cursor_execute', collect)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, 'after_cursor_execute', collect)
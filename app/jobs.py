@@ -0,0 +1,292 @@
+from flask import current_app
+from sqlalchemy import event, select, update, or_, and_
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session
+from models import db, Job
+from datetime import datetime, timedelta
+import multiprocessing
+import importlib
+import traceback
+import threading
+import logging
+import socket
+import time
+import uuid
+import os
+
+logger = logging.getLogger('comener.jobs')
+
+ACTIVE = ('queued', 'running')
+# A running job whose worker stopped beating for this long is taken over by another worker;
+# a worker only slowed down, e.g. its heartbeats blocked by a long SQLite transaction, then
+# fails to commit its work with ClaimLost
+STALE_AFTER = 300
+HEARTBEAT_INTERVAL = 15
+PROGRESS_INTERVAL = 1.0
+MAX_ATTEMPTS = 3
+POLL_INTERVAL = 1.0
+
+HANDLERS = {}
+# Modules registering the handlers, imported when a worker first runs their job type:
+# queueing a job does not load the pandas based importers into the web process
+HANDLER_MODULES = {
+    'billing': 'billing',
+    'allocation': 'allocation',
+    'import_members': 'bulk_import',
+    'reconcile_payments': 'payments',
+    'rebuild_summary': 'summary',
+    'statements': 'statements',
+}
+
+_local_worker = None
+_local_worker_lock = threading.Lock()
+
+
+class ClaimLost(Exception):
+    """The job was claimed again by another worker, e.g. after missing heartbeats: this run must not commit."""
+
+
+def job_handler(job_type):
+    """Register ``fn(job, **params)`` as the handler of ``job_type``, it returns the JSON result.
+
+    A handler may run more than once for the same job when a worker dies, so it
+    must be idempotent: either all its work is committed together with the job
+    through ``job.complete_on_commit``, or running it again is harmless.
+    """
+    def register(fn):
+        HANDLERS[job_type] = fn
+        return fn
+    return register
+
+
+def get_handler(job_type):
+    if job_type not in HANDLERS and job_type in HANDLER_MODULES:
+        importlib.import_module(HANDLER_MODULES[job_type])
+    return HANDLERS.get(job_type)
+
+
+class JobContext:
+    """What a handler sees of its job: the id, the attempt and the progress reporting."""
+
+    def __init__(self, job_id, attempt, engine):
+        self.id = job_id
+        self.attempt = attempt
+        self.engine = engine
+        self.last_progress = 0.0
+
+    def progress(self, percent, message=None, force=False):
+        # Out of the handler's transaction and throttled; best effort while it holds the write lock
+        now = time.monotonic()
+        if not force and now - self.last_progress < PROGRESS_INTERVAL:
+            return
+        self.last_progress = now
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(update(Job).where(_claimed(self.id, self.attempt)).values(
+                    jobProgress=int(percent), jobMessage=message and message[:200], jobHeartbeat=datetime.now()
+                ))
+        except OperationalError as e:
+            logger.debug('Progress of job %s not saved: %s', self.id, e)
+
+    def complete_on_commit(self, result):
+        """Mark the job done in the same transaction as the handler's next commit.
+
+        ``result`` is a function called at commit time, returning the job result.
+        A crash before that commit leaves both the work and the job undone, and
+        the commit raises ClaimLost when another worker claimed the job since.
+        """
+        db.session.info['complete_job'] = (self.id, self.attempt, result)
+
+
+def _claimed(job_id, attempt):
+    # Every claim counts an attempt: the number tells this run from a later claim of the same job
+    return and_(Job.jobID == job_id, Job.jobStatus == 'running', Job.jobAttempts == attempt)
+
+
+@event.listens_for(Session, 'before_commit')
+def _complete_job(session):
+    pending = session.info.pop('complete_job', None)
+    if pending is not None:
+        job_id, attempt, result = pending
+        done = session.connection().execute(update(Job).where(_claimed(job_id, attempt)).values(
+            jobStatus='done', jobResult=result(), jobProgress=100, jobFinished=datetime.now()
+        )).rowcount
+        if not done:
+            raise ClaimLost(f'Job {job_id} was claimed by another worker, attempt {attempt} is not committed')
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_job(session):
+    session.info.pop('complete_job', None)
+
+
+def submit(job_type, params=None, key=None):
+    """Queue a job, or return the queued or running job with the same key."""
+    if job_type not in HANDLERS and job_type not in HANDLER_MODULES:
+        raise ValueError(f'Unknown job type {job_type}')
+    job = Job(jobID=uuid.uuid4().hex, jobType=job_type, jobKey=key, jobParams=params or {},
+              jobStatus='queued', jobCreated=datetime.now())
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        job = Job.query.filter(Job.jobKey == key, Job.jobStatus.in_(ACTIVE)).first()
+        if job is None:
+            raise
+    ensure_local_worker(current_app._get_current_object())
+    return job
+
+
+def wait(job_id, timeout=None, interval=0.05):
+    """Poll until the job finished, returns it."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        job = db.session.get(Job, job_id, populate_existing=True)
+        db.session.commit()
+        if job is None or not job.active:
+            return job
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError(f'Job {job_id} still {job.jobStatus}')
+        time.sleep(interval)
+
+
+def _claimable(now, stale_after):
+    return or_(
+        Job.jobStatus == 'queued',
+        and_(Job.jobStatus == 'running', Job.jobHeartbeat < now - timedelta(seconds=stale_after))
+    )
+
+
+def claim_next_job(worker, stale_after=STALE_AFTER):
+    """Atomically take the oldest queued job, or a running one whose worker died."""
+    while True:
+        now = datetime.now()
+        job_id = db.session.scalar(
+            select(Job.jobID).where(_claimable(now, stale_after)).order_by(Job.jobCreated).limit(1)
+        )
+        if job_id is None:
+            db.session.commit()
+            return None
+        # Compare and set: only one worker sees its update match the row
+        claimed = db.session.connection().execute(
+            update(Job).where(Job.jobID == job_id, _claimable(now, stale_after)).values(
+                jobStatus='running', jobWorker=worker, jobStarted=now, jobHeartbeat=now,
+                jobAttempts=Job.jobAttempts + 1, jobError=None
+            )
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return job_id
+
+
+def _finish(job_id, attempt, status, result=None, error=None):
+    db.session.connection().execute(
+        update(Job).where(_claimed(job_id, attempt)).values(
+            jobStatus=status, jobResult=result, jobError=error, jobFinished=datetime.now(),
+            **({'jobProgress': 100} if status == 'done' else {})
+        )
+    )
+    db.session.commit()
+
+
+def _heartbeat(engine, job_id, attempt, stop):
+    while not stop.wait(HEARTBEAT_INTERVAL):
+        try:
+            with engine.begin() as connection:
+                connection.execute(update(Job).where(_claimed(job_id, attempt)).values(jobHeartbeat=datetime.now()))
+        except OperationalError as e:
+            logger.debug('Heartbeat of job %s not saved: %s', job_id, e)
+
+
+def run_job(job_id):
+    """Run a claimed job to completion, recording its result or its error."""
+    job = db.session.get(Job, job_id)
+    handler = get_handler(job.jobType)
+    params = dict(job.jobParams or {})
+    attempt = job.jobAttempts
+    db.session.commit()
+    if handler is None:
+        _finish(job_id, attempt, 'failed', error=f'Unknown job type {job.jobType}')
+        return
+    if attempt > MAX_ATTEMPTS:
+        _finish(job_id, attempt, 'failed', error=f'Gave up after {MAX_ATTEMPTS} attempts')
+        return
+
+    stop = threading.Event()
+    engine = db.engine
+    beat = threading.Thread(target=_heartbeat, args=(engine, job_id, attempt, stop), daemon=True)
+    beat.start()
+    try:
+        result = handler(JobContext(job_id, attempt, engine), **params)
+    except Exception as e:
+        db.session.rollback()
+        logger.error('Job %s failed: %s', job_id, traceback.format_exc())
+        # Left to the worker that claimed it since, if any
+        _finish(job_id, attempt, 'failed', error=str(e) or type(e).__name__)
+    else:
+        # Still running unless the handler completed it with its own commit
+        _finish(job_id, attempt, 'done', result=result)
+    finally:
+        stop.set()
+        db.session.remove()
+
+
+def work(app, worker=None, once=False, poll_interval=POLL_INTERVAL, stop=None):
+    """Claim and run jobs until ``stop`` is set, or until the queue is empty with ``once``."""
+    worker = worker or f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+    stop = stop or threading.Event()
+    with app.app_context():
+        while not stop.is_set():
+            try:
+                job_id = claim_next_job(worker)
+            except OperationalError as e:
+                db.session.rollback()
+                logger.warning('Could not poll the job queue: %s', e)
+                job_id = None
+            if job_id is not None:
+                run_job(job_id)
+                continue
+            db.session.remove()
+            if once:
+                return
+            stop.wait(poll_interval)
+
+
+def ensure_local_worker(app):
+    """Run queued jobs in a thread of this process unless JOBS_LOCAL_WORKER is disabled.
+
+    Production deployments disable it and run ``flask jobs-worker`` instead.
+    """
+    global _local_worker
+    if not app.config.get('JOBS_LOCAL_WORKER', True):
+        return
+    with _local_worker_lock:
+        if _local_worker is None or not _local_worker.is_alive():
+            _local_worker = threading.Thread(target=work, args=(app,), name='jobs-local-worker', daemon=True)
+            _local_worker.start()
+
+
+def _process_main(poll_interval):
+    from app import create_app
+    work(create_app(), poll_interval=poll_interval)
+
+
+def run_worker_pool(app, processes=2, poll_interval=POLL_INTERVAL):
+    """Run ``processes`` worker processes until interrupted; a single one runs in this process."""
+    if processes <= 1:
+        work(app, poll_interval=poll_interval)
+        return
+    context = multiprocessing.get_context('spawn')
+    pool = [context.Process(target=_process_main, args=(poll_interval,), name=f'jobs-worker-{n}')
+            for n in range(processes)]
+    for process in pool:
+        process.start()
+    try:
+        for process in pool:
+            process.join()
+    except KeyboardInterrupt:
+        for process in pool:
+            process.terminate()
+        for process in pool:
+            process.join()
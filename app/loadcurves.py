@@ -0,0 +1,144 @@
+from collections import OrderedDict
+from calendar import monthrange
+from sqlalchemy import select
+from models import db, Pod
+import numpy as np
+import pandas as pd
+import os
+
+STORE_DIR = os.path.join(os.path.dirname(__file__), 'data', 'loadcurves')
+# Partitions are stored by podsID: several pods may share a pod number
+POD_DIR = 'pods'
+
+SLOTS_PER_DAY = 96  # 15-minute resolution
+CHUNK_ROWS = 1_000_000
+# Partitions kept memory-mapped at once while ingesting
+OPEN_PARTITIONS = 256
+
+
+def slots_in_month(year, month):
+    return monthrange(year, month)[1] * SLOTS_PER_DAY
+
+
+def partition_path(pod_id, year, month, store_dir=STORE_DIR):
+    return os.path.join(store_dir, POD_DIR, str(int(pod_id)), f'{year:04d}-{month:02d}.npy')
+
+
+def open_partition(pod_id, year, month, store_dir=STORE_DIR, create=False):
+    """Memory-map the float32 load curve of one pod and UTC month, one value per 15-minute slot.
+
+    Missing slots hold NaN. Returns None when the partition does not exist and
+    ``create`` is false.
+    """
+    path = partition_path(pod_id, year, month, store_dir)
+    if os.path.exists(path):
+        return np.load(path, mmap_mode='r+' if create else 'r')
+    if not create:
+        return None
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    curve = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32,
+                                      shape=(slots_in_month(year, month),))
+    curve[:] = np.nan
+    return curve
+
+
+class _PartitionCache:
+    """Keeps the most recently written partitions mapped, flushing the ones it evicts."""
+
+    def __init__(self, store_dir, size=OPEN_PARTITIONS):
+        self.store_dir = store_dir
+        self.size = size
+        self.partitions = OrderedDict()
+
+    def get(self, pod_id, year, month):
+        key = (pod_id, year, month)
+        curve = self.partitions.get(key)
+        if curve is None:
+            curve = open_partition(pod_id, year, month, self.store_dir, create=True)
+            self.partitions[key] = curve
+            if len(self.partitions) > self.size:
+                _, evicted = self.partitions.popitem(last=False)
+                evicted.flush()
+        else:
+            self.partitions.move_to_end(key)
+        return curve
+
+    def close(self):
+        for curve in self.partitions.values():
+            curve.flush()
+        self.partitions.clear()
+
+
+def ingest_csv(source, pod_column='podNumber', time_column='timestamp', value_column='value',
+               delimiter=';', time_format=None, store_dir=STORE_DIR, chunk_rows=CHUNK_ROWS):
+    """Stream a grid-operator export of 15-minute readings into the load-curve store.
+
+    The file is read in chunks of ``chunk_rows`` rows, so its size is not bound by
+    memory. Timestamps are normalised to UTC, those without an offset are taken as
+    UTC, so the slots of a day do not move with daylight saving time. The readings
+    of a pod number go to every pod with that number; those of numbers unknown to
+    the database are skipped and counted. Re-ingesting a period overwrites the
+    slots it contains.
+    """
+    pods_by_number = {}
+    pods = db.session.execute(select(Pod.podsID, Pod.podNumber).where(Pod.podNumber.isnot(None)))
+    for pod_id, pod_number in pods:
+        pods_by_number.setdefault(pod_number, []).append(pod_id)
+    cache = _PartitionCache(store_dir)
+    stats = {'rows': 0, 'stored': 0, 'unknown_pod': 0, 'invalid': 0, 'partitions': set()}
+    reader = pd.read_csv(
+        source, sep=delimiter, usecols=[pod_column, time_column, value_column],
+        dtype={pod_column: str}, chunksize=chunk_rows
+    )
+    try:
+        for chunk in reader:
+            stats['rows'] += len(chunk)
+            known = chunk[pod_column].isin(list(pods_by_number))
+            stats['unknown_pod'] += int((~known).sum())
+            chunk = chunk[known]
+
+            # With utc=True mixed offsets still parse to one datetime64 column
+            ts = pd.to_datetime(chunk[time_column], format=time_format, errors='coerce', utc=True)
+            values = pd.to_numeric(chunk[value_column], errors='coerce')
+            valid = ts.notna() & values.notna()
+            stats['invalid'] += int((~valid).sum())
+
+            frame = pd.DataFrame({
+                'pod': chunk[pod_column][valid].to_numpy(),
+                'year': ts[valid].dt.year.to_numpy(),
+                'month': ts[valid].dt.month.to_numpy(),
+                'slot': ((ts[valid].dt.day.to_numpy() - 1) * SLOTS_PER_DAY
+                         + ts[valid].dt.hour.to_numpy() * 4
+                         + ts[valid].dt.minute.to_numpy() // 15),
+                'value': values[valid].to_numpy(dtype=np.float32)
+            })
+            for (pod_number, year, month), part in frame.groupby(['pod', 'year', 'month'], sort=False):
+                slots, readings = part['slot'].to_numpy(), part['value'].to_numpy()
+                for pod_id in pods_by_number[pod_number]:
+                    cache.get(pod_id, int(year), int(month))[slots] = readings
+                    stats['partitions'].add((pod_id, int(year), int(month)))
+                stats['stored'] += len(part)
+    finally:
+        cache.close()
+    stats['partitions'] = len(stats['partitions'])
+    return stats
+
+
+def monthly_totals(year, month, pod_ids=None, store_dir=STORE_DIR):
+    """Total energy per pod for a month, reduced from the memory-mapped partitions.
+
+    Returns a Series indexed by podsID; pods without a partition are left out.
+    """
+    if pod_ids is None:
+        pod_ids = db.session.scalars(select(Pod.podsID).where(Pod.podNumber.isnot(None)))
+    totals = {}
+    for pod_id in pod_ids:
+        curve = open_partition(pod_id, year, month, store_dir)
+        if curve is not None:
+            totals[pod_id] = float(np.nansum(curve, dtype=np.float64))
+    return pd.Series(totals, dtype=float)
+
+
+def monthly_energy_by_pod(year, month, store_dir=STORE_DIR):
+    """Monthly totals keyed by podsID, as consumed by the allocation engine."""
+    return monthly_totals(year, month, store_dir=store_dir)
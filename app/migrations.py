@@ -0,0 +1,504 @@
+from sqlalchemy import (inspect, select, insert, update, bindparam, func, text, MetaData, Table, Column, Index,
+                        ForeignKey, UniqueConstraint, Integer, String, Text, Numeric, Date, DateTime, Boolean, JSON)
+from models import db, Member, Pod, MemberFeePayment, Accounting, BillingFileEntry, AccountingSummary, EnergyFlow, SchemaVersion
+from summary import rebuild_summary
+from search import create_search_index
+from queries import sharing_group_pods_query
+from billing import _unbilled_rows_query, _changed_rows_query
+from datetime import date, datetime
+import logging
+
+logger = logging.getLogger('comener.migrations')
+
+# Indexes of the hand-written schema in database/db_create.txt, replaced by the model indexes
+LEGACY_INDEXES = (
+    'idx_memberFeePayment_member', 'idx_memberFeePayment_year', 'idx_memberSharingGroup_group',
+    'idx_memberSharingGroup_member', 'idx_pods_member', 'idx_pods_number',
+)
+
+
+class MigrationError(Exception):
+    pass
+
+
+def _columns(connection, table):
+    return {column['name'].lower() for column in inspect(connection).get_columns(table)}
+
+
+def _schema(version):
+    """The tables and indexes as of migration ``version``, version 0 being the schema before migrations.
+
+    Migrations create their tables and indexes from here rather than from the
+    models, which keep changing: an index is only created by the migration that
+    adds its columns, and a migrated database ends like a new one.
+    """
+    metadata = MetaData()
+    members = Table(
+        'members', metadata,
+        Column('id', Integer, primary_key=True, autoincrement=True),
+        Column('name', String(100)),
+        Column('firstname', String(100)),
+        Column('nationalId', String(50)),
+        Column('address', Text),
+        Column('phoneNumber', String(20)),
+        Column('email', String(255)),
+        Column('energyID', String(50)),
+    )
+    pods = Table(
+        'pods', metadata,
+        Column('podsID', Integer, primary_key=True, autoincrement=True),
+        Column('podlabel', String(100)),
+        Column('podType', String(20), nullable=False),
+        Column('memberID', Integer, ForeignKey('members.id'), nullable=False),
+        Column('podNumber', String(50)),
+        Column('energyproduction', Numeric(10, 2)),
+        Column('energystorage', Numeric(10, 2)),
+    )
+    Table(
+        'sharingGroup', metadata,
+        Column('sgID', Integer, primary_key=True, autoincrement=True),
+        Column('sgName', String(100)),
+        Column('sgNumber', String(50)),
+        Column('sgPrice', Numeric(10, 2)),
+        Column('sgType', String(20), nullable=False),
+    )
+    pod_sharing_group = Table(
+        'podSharingGroup', metadata,
+        Column('msgID', Integer, primary_key=True, autoincrement=True),
+        Column('podID', Integer, ForeignKey('pods.podsID'), nullable=False),
+        Column('sharingGroupID', Integer, ForeignKey('sharingGroup.sgID'), nullable=False),
+        UniqueConstraint('podID', 'sharingGroupID', name='uix_pod_sharing_group'),
+    )
+    Table(
+        'memberfee', metadata,
+        Column('mfID', Integer, primary_key=True, autoincrement=True),
+        Column('mfamount', Numeric(10, 2)),
+        Column('mfYear', Integer),
+    )
+    payment = Table(
+        'memberFeePayment', metadata,
+        Column('mfpID', Integer, primary_key=True, autoincrement=True),
+        Column('memberID', Integer, ForeignKey('members.id'), nullable=False),
+        Column('memberFeeID', Integer, ForeignKey('memberfee.mfID'), nullable=False),
+        Column('paymentDate', Date),
+        Column('paymentStatus', String(20)),
+        *([Column('paymentDue', Date)] if version >= 5 else []),
+        UniqueConstraint('memberID', 'memberFeeID', name='uix_member_fee_payment'),
+    )
+    accounting = Table(
+        'accounting', metadata,
+        Column('accID', Integer, primary_key=True, autoincrement=True),
+        Column('accYear', Integer),
+        Column('accMonth', Integer),
+        Column('accMember', Integer, ForeignKey('members.id'), nullable=False),
+        Column('accPod', Integer, ForeignKey('pods.podsID'), nullable=False),
+        Column('accAmount', Numeric(10, 2)),
+        Column('accBillingDate', Date),
+        Column('accSGId', Integer, ForeignKey('sharingGroup.sgID'), nullable=False),
+        *([Column('accVersion', Integer, nullable=False, server_default='1'),
+           Column('accBilledVersion', Integer),
+           Column('accBilledAmount', Numeric(10, 2)),
+           Column('accBilledMember', Integer)] if version >= 6 else []),
+        UniqueConstraint('accYear', 'accMonth', 'accMember', 'accPod', 'accSGId', name='uix_accounting'),
+    )
+    if version == 0:
+        return metadata
+
+    billing_file = Table(
+        'billingFile', metadata,
+        Column('bfID', Integer, primary_key=True, autoincrement=True),
+        Column('bfFilename', String(100), nullable=False, unique=True),
+        Column('bfCreated', DateTime),
+        Column('bfHash', String(64), nullable=False),
+        Column('bfSize', Integer),
+        Column('bfStoredSize', Integer),
+        Column('bfRowCount', Integer),
+        Column('bfTotal', Numeric(12, 2)),
+    )
+    entry = Table(
+        'billingFileEntry', metadata,
+        Column('billingFileID', Integer, ForeignKey('billingFile.bfID'), primary_key=True),
+        *([Column('bfeMember', Integer, primary_key=True)] if version >= 7 else []),
+        Column('accID', Integer, ForeignKey('accounting.accID'), primary_key=True),
+        *([Column('bfeAmount', Numeric(10, 2))] if version >= 6 else []),
+    )
+    summary = Table(
+        'accountingSummary', metadata,
+        Column('asYear', Integer, primary_key=True),
+        Column('asMonth', Integer, primary_key=True),
+        Column('asMember', Integer, ForeignKey('members.id'), primary_key=True),
+        Column('asSGId', Integer, ForeignKey('sharingGroup.sgID'), primary_key=True),
+        Column('asBilled', Boolean, primary_key=True),
+        Column('asRows', Integer, nullable=False),
+        Column('asAmount', Numeric(12, 2)),
+    )
+    if version >= 2:
+        Index('ix_members_name', members.c.name, members.c.firstname)
+        Index('ix_pods_memberID', pods.c.memberID)
+        Index('ix_pods_podNumber', pods.c.podNumber)
+        Index('ix_podSharingGroup_sharingGroupID', pod_sharing_group.c.sharingGroupID)
+        Index('ix_memberFeePayment_memberFeeID', payment.c.memberFeeID, payment.c.paymentStatus)
+        Index('ix_accounting_accMember', accounting.c.accMember)
+        Index('ix_accounting_accPod', accounting.c.accPod)
+        Index('ix_accounting_accSGId', accounting.c.accSGId)
+        Index('ix_accounting_unbilled', accounting.c.accMember, accounting.c.accID,
+              sqlite_where=text('"accBillingDate" IS NULL'), postgresql_where=text('"accBillingDate" IS NULL'))
+        Index('ix_billingFile_bfCreated', billing_file.c.bfCreated)
+        Index('ix_billingFileEntry_accID', entry.c.accID)
+        Index('ix_accountingSummary_asMember', summary.c.asMember)
+        Index('ix_accountingSummary_asSGId', summary.c.asSGId)
+    if version >= 4:
+        job = Table(
+            'job', metadata,
+            Column('jobID', String(32), primary_key=True),
+            Column('jobType', String(50), nullable=False),
+            Column('jobKey', String(200)),
+            Column('jobStatus', String(20), nullable=False),
+            Column('jobParams', JSON),
+            Column('jobResult', JSON),
+            Column('jobError', Text),
+            Column('jobProgress', Integer),
+            Column('jobMessage', String(200)),
+            Column('jobAttempts', Integer, nullable=False),
+            Column('jobWorker', String(100)),
+            Column('jobCreated', DateTime),
+            Column('jobStarted', DateTime),
+            Column('jobHeartbeat', DateTime),
+            Column('jobFinished', DateTime),
+        )
+        Index('ix_job_jobStatus', job.c.jobStatus, job.c.jobCreated)
+        Index('uix_job_active_key', job.c.jobKey, unique=True,
+              sqlite_where=text("\"jobStatus\" IN ('queued', 'running')"),
+              postgresql_where=text("\"jobStatus\" IN ('queued', 'running')"))
+    if version >= 5:
+        Index('ix_memberFeePayment_status_due', payment.c.paymentStatus, payment.c.paymentDue)
+    if version >= 6:
+        Index('ix_accounting_rebill', accounting.c.accMember, accounting.c.accID,
+              sqlite_where=text('"accBilledVersion" < "accVersion"'),
+              postgresql_where=text('"accBilledVersion" < "accVersion"'))
+    if version >= 8:
+        flow = Table(
+            'energyFlow', metadata,
+            Column('efYear', Integer, primary_key=True),
+            Column('efMonth', Integer, primary_key=True),
+            Column('efSGId', Integer, ForeignKey('sharingGroup.sgID'), primary_key=True),
+            Column('efMember', Integer, ForeignKey('members.id'), primary_key=True),
+            Column('efProduction', Numeric(14, 3)),
+            Column('efConsumption', Numeric(14, 3)),
+            Column('efShared', Numeric(14, 3)),
+            Column('efSupplied', Numeric(14, 3)),
+            Column('efComputed', DateTime),
+        )
+        Index('ix_energyFlow_efSGId', flow.c.efSGId)
+        Index('ix_energyFlow_efMember', flow.c.efMember)
+    return metadata
+
+
+def _index(version, name):
+    return next(index for table in _schema(version).sorted_tables for index in table.indexes if index.name == name)
+
+
+def _recreate_index(connection, version, name):
+    # For the indexes the earlier releases created before their columns, see migration 10
+    connection.execute(text(f'DROP INDEX IF EXISTS "{name}"'))
+    _index(version, name).create(connection)
+
+
+def _rebuild_legacy_accounting(connection):
+    # The legacy table references pods by podNumber and has neither a sharing group nor a
+    # billing date; rows are matched to their pod and to the pod's first sharing group
+    legacy = connection.execute(text(
+        'SELECT count(*) FROM accounting a '
+        'LEFT JOIN pods p ON p."podNumber" = a."accPod" '
+        'WHERE p."podsID" IS NULL OR NOT EXISTS '
+        '(SELECT 1 FROM "podSharingGroup" m WHERE m."podID" = p."podsID")'
+    )).scalar()
+    if legacy:
+        raise MigrationError(f'{legacy} accounting records have no pod or sharing group to migrate to, '
+                             'fix their accPod before upgrading')
+    connection.execute(text('ALTER TABLE accounting RENAME TO accounting_legacy'))
+    _schema(1).tables['accounting'].create(connection)
+    # Records from before billing dates existed were billed outside the application:
+    # date them today so the next billing run does not bill them a second time
+    connection.execute(text(
+        'INSERT INTO accounting ("accID", "accYear", "accMonth", "accMember", "accPod", "accAmount", '
+        '"accBillingDate", "accSGId") '
+        'SELECT a."accID", a."accYear", a."accMonth", a."accMember", p."podsID", a."accAmount", :today, '
+        '(SELECT min(m."sharingGroupID") FROM "podSharingGroup" m WHERE m."podID" = p."podsID") '
+        'FROM accounting_legacy a JOIN pods p ON p."podNumber" = a."accPod"'
+    ), {'today': date.today()})
+    connection.execute(text('DROP TABLE accounting_legacy'))
+
+
+def _legacy_schema_to_models(connection):
+    tables = inspect(connection).get_table_names()
+    if 'pods' in tables:
+        columns = _columns(connection, 'pods')
+        for column in ('energyproduction', 'energystorage'):
+            if column not in columns:
+                connection.execute(text(f'ALTER TABLE pods ADD COLUMN {column} NUMERIC(10, 2)'))
+    if 'accounting' in tables and 'accsgid' not in _columns(connection, 'accounting'):
+        _rebuild_legacy_accounting(connection)
+    # Tables added since, e.g. the billing file index; their indexes come with migration 2
+    _schema(1).create_all(connection)
+
+
+def _query_indexes(connection):
+    for name in LEGACY_INDEXES:
+        connection.execute(text(f'DROP INDEX IF EXISTS "{name}"'))
+    for table in _schema(2).sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def _fill_accounting_summary(connection):
+    rebuild_summary(connection)
+
+
+def _job_table(connection):
+    _schema(4).tables['job'].create(connection, checkfirst=True)
+
+
+def _payment_due_dates(connection):
+    schema = _schema(5)
+    fee, payment = schema.tables['memberfee'], schema.tables['memberFeePayment']
+    if 'paymentdue' not in _columns(connection, 'memberFeePayment'):
+        connection.execute(text('ALTER TABLE "memberFeePayment" ADD COLUMN "paymentDue" DATE'))
+    # Payments from before due dates existed were requested at the start of their fee year
+    years = connection.execute(select(fee.c.mfID, fee.c.mfYear).where(fee.c.mfYear.isnot(None))).all()
+    if years:
+        connection.execute(
+            update(payment)
+            .where(payment.c.memberFeeID == bindparam('fee'), payment.c.paymentDue.is_(None))
+            .values(paymentDue=bindparam('due')),
+            [{'fee': fee_id, 'due': date(year, 1, 1)} for fee_id, year in years]
+        )
+    connection.execute(update(payment).where(payment.c.paymentDue.is_(None)).values(paymentDue=date.today()))
+    _recreate_index(connection, 5, 'ix_memberFeePayment_status_due')
+
+
+def _billing_versions(connection):
+    schema = _schema(6)
+    accounting, entry = schema.tables['accounting'], schema.tables['billingFileEntry']
+    columns = _columns(connection, 'accounting')
+    for name, kind in (('accVersion', 'INTEGER NOT NULL DEFAULT 1'), ('accBilledVersion', 'INTEGER'),
+                       ('accBilledAmount', 'NUMERIC(10, 2)'), ('accBilledMember', 'INTEGER')):
+        if name.lower() not in columns:
+            connection.execute(text(f'ALTER TABLE accounting ADD COLUMN "{name}" {kind}'))
+    if 'bfeamount' not in _columns(connection, 'billingFileEntry'):
+        connection.execute(text('ALTER TABLE "billingFileEntry" ADD COLUMN "bfeAmount" NUMERIC(10, 2)'))
+    # Records billed until now were invoiced at their current amount, to their current member
+    connection.execute(
+        update(accounting)
+        .where(accounting.c.accBillingDate.isnot(None), accounting.c.accBilledVersion.is_(None))
+        .values(accBilledVersion=accounting.c.accVersion, accBilledAmount=accounting.c.accAmount,
+                accBilledMember=accounting.c.accMember)
+    )
+    connection.execute(
+        update(entry).where(entry.c.bfeAmount.is_(None))
+        .values(bfeAmount=select(accounting.c.accAmount).where(accounting.c.accID == entry.c.accID)
+                .scalar_subquery())
+    )
+    # Earlier releases created it in migration 2, before these columns: never keep that one
+    _recreate_index(connection, 6, 'ix_accounting_rebill')
+
+
+def _billing_entry_members(connection):
+    # The member becomes part of the primary key, which SQLite only changes by copying the table
+    if 'bfemember' in _columns(connection, 'billingFileEntry'):
+        return
+    entry = _schema(7).tables['billingFileEntry']
+    for index in entry.indexes:
+        connection.execute(text(f'DROP INDEX IF EXISTS "{index.name}"'))
+    connection.execute(text('ALTER TABLE "billingFileEntry" RENAME TO "billingFileEntry_old"'))
+    entry.create(connection)
+    # Entries written until now billed the member the record was invoiced to
+    connection.execute(text(
+        'INSERT INTO "billingFileEntry" ("billingFileID", "bfeMember", "accID", "bfeAmount") '
+        'SELECT e."billingFileID", coalesce(a."accBilledMember", a."accMember"), e."accID", e."bfeAmount" '
+        'FROM "billingFileEntry_old" e JOIN accounting a ON a."accID" = e."accID"'
+    ))
+    connection.execute(text('DROP TABLE "billingFileEntry_old"'))
+
+
+def _energy_flows(connection):
+    # Filled by the next allocations, or for past months by flask energy-flows
+    _schema(8).tables['energyFlow'].create(connection, checkfirst=True)
+
+
+def _search_index(connection):
+    # SQLite gets an FTS5 table filled from the current rows, PostgreSQL trigram indexes (pg_trgm)
+    create_search_index(connection)
+
+
+def _repair_early_indexes(connection):
+    # Migration 2 of earlier releases created these from the models, before migrations 5
+    # and 6 added their columns: SQLite indexed the column names as string constants,
+    # which left ix_accounting_rebill with wrong entries
+    _recreate_index(connection, 10, 'ix_memberFeePayment_status_due')
+    _recreate_index(connection, 10, 'ix_accounting_rebill')
+
+
+# Append only: a migration never changes once released
+MIGRATIONS = [
+    (1, 'Bring the hand-written schema up to the models', _legacy_schema_to_models),
+    (2, 'Indexes for the filters of the list, billing and fee pages', _query_indexes),
+    (3, 'Fill the accounting summary', _fill_accounting_summary),
+    (4, 'Background job queue', _job_table),
+    (5, 'Due dates of the member fee payments', _payment_due_dates),
+    (6, 'Versions of the accounting records for the billing adjustments', _billing_versions),
+    (7, 'Member of the billing file entries, for the member statements', _billing_entry_members),
+    (8, 'Monthly energy flows for the analytics', _energy_flows),
+    (9, 'Search index of the members and pods', _search_index),
+    (10, 'Recreate the indexes created before their columns', _repair_early_indexes),
+]
+HEAD = MIGRATIONS[-1][0]
+
+
+def current_version(connection):
+    tables = inspect(connection).get_table_names()
+    if SchemaVersion.__tablename__ not in tables:
+        # No version table: a new database, or one created before migrations existed
+        return None if not tables else 0
+    return connection.execute(select(func.max(SchemaVersion.svVersion))).scalar() or 0
+
+
+def backup_database(engine, version):
+    """Copy a SQLite database file next to itself before migrating it, returns the copy's path."""
+    if engine.dialect.name != 'sqlite' or not engine.url.database or engine.url.database == ':memory:':
+        return None
+    path = f"{engine.url.database}.v{version}-{datetime.now().strftime('%Y%m%d%H%M%S')}.bak"
+    with engine.connect() as connection:
+        connection.exec_driver_sql('VACUUM INTO ?', (path,))
+    return path
+
+
+def upgrade(engine=None, backup=True):
+    """Bring the database to the model schema, returns the versions applied.
+
+    A new database is created from the models and stamped with the last version.
+    An existing one gets each missing migration in its own transaction, after a
+    backup copy when it is a SQLite file.
+    """
+    engine = engine or db.engine
+    with engine.connect() as connection:
+        version = current_version(connection)
+    if version is None:
+        with engine.begin() as connection:
+            db.metadata.create_all(connection)
+            connection.execute(insert(SchemaVersion), [
+                {'svVersion': number, 'svDescription': description, 'svApplied': datetime.now()}
+                for number, description, _ in MIGRATIONS
+            ])
+        return []
+
+    pending = [migration for migration in MIGRATIONS if migration[0] > version]
+    if pending and backup:
+        path = backup_database(engine, version)
+        if path:
+            logger.info('Database backed up to %s', path)
+    applied = []
+    for number, description, migrate in pending:
+        with engine.begin() as connection:
+            SchemaVersion.__table__.create(connection, checkfirst=True)
+            migrate(connection)
+            connection.execute(insert(SchemaVersion).values(
+                svVersion=number, svDescription=description, svApplied=datetime.now()
+            ))
+        logger.info('Applied migration %s: %s', number, description)
+        applied.append((number, description))
+    return applied
+
+
+def _explain(connection, statement):
+    sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True}))
+    if connection.dialect.name == 'sqlite':
+        return [row[-1] for row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}')]
+    # Tiny test tables are cheaper to scan, make the planner show the index it would use
+    connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+    return [row[0] for row in connection.exec_driver_sql(f'EXPLAIN {sql}')]
+
+
+def _scans(plan, table):
+    """Plan lines reading the whole of ``table`` without an index."""
+    scans = []
+    for line in plan:
+        words = line.replace('"', '').split()
+        if len(words) > 1 and words[0] == 'SCAN' and words[1] == table and 'INDEX' not in words:
+            scans.append(line)
+        elif 'Seq Scan on' in line and f' {table} ' in f'{line} ':
+            scans.append(line)
+    return scans
+
+
+def _uses_index(plan, table, index):
+    """Whether the plan reads ``table`` through ``index``.
+
+    SQLite names the indexes of primary keys and unique constraints
+    sqlite_autoindex_<table>_<n>, they stand for the constraint names here.
+    """
+    autoindex = f'sqlite_autoindex_{table}_' if index.startswith('uix_') or index.endswith('_pkey') else None
+    for line in plan:
+        words = line.replace('"', '').split()
+        if any(word == index or autoindex and word.startswith(autoindex) for word in words):
+            return True
+    return False
+
+
+def hot_queries():
+    """The filters run on every list, billing and fee page, with the table each reads and the index it must use."""
+    return [
+        ('unbilled accounting rows (billing run)', 'accounting', 'ix_accounting_unbilled', _unbilled_rows_query()),
+        ('changed invoiced accounting rows (billing adjustments)', 'accounting', 'ix_accounting_rebill',
+         _changed_rows_query()),
+        ('billing file entries of a batch of members (statements)', 'billingFileEntry', 'billingFileEntry_pkey',
+         select(BillingFileEntry).where(BillingFileEntry.billingFileID == 1, BillingFileEntry.bfeMember.in_([1, 2]))),
+        ('unbilled accounting count', 'accounting', 'ix_accounting_unbilled',
+         select(func.count(Accounting.accID)).where(Accounting.accBillingDate.is_(None))),
+        ('accounting of a member', 'accounting', 'ix_accounting_accMember',
+         select(Accounting).where(Accounting.accMember == 1)),
+        ('accounting of a month', 'accounting', 'uix_accounting',
+         select(Accounting).where(Accounting.accYear == 2025, Accounting.accMonth == 1)),
+        ('payments of a member fee', 'memberFeePayment', 'ix_memberFeePayment_memberFeeID',
+         select(MemberFeePayment, Member).join(Member, MemberFeePayment.memberID == Member.id)
+         .where(MemberFeePayment.memberFeeID == 1)),
+        ('payment totals of a member fee', 'memberFeePayment', 'ix_memberFeePayment_memberFeeID',
+         select(MemberFeePayment.paymentStatus, func.count(MemberFeePayment.mfpID))
+         .where(MemberFeePayment.memberFeeID == 1).group_by(MemberFeePayment.paymentStatus)),
+        ('open payments of a member fee', 'memberFeePayment', 'ix_memberFeePayment_memberFeeID',
+         select(MemberFeePayment).where(MemberFeePayment.memberFeeID == 1,
+                                        MemberFeePayment.paymentStatus.in_(('pending', 'overdue')))
+         .order_by(MemberFeePayment.mfpID).limit(51)),
+        ('pending payments past due (mark overdue)', 'memberFeePayment', 'ix_memberFeePayment_status_due',
+         update(MemberFeePayment).where(MemberFeePayment.paymentStatus == 'pending',
+                                        MemberFeePayment.paymentDue < date(2025, 1, 1))
+         .values(paymentStatus='overdue')),
+        ('pods of a sharing group', 'podSharingGroup', 'ix_podSharingGroup_sharingGroupID',
+         sharing_group_pods_query(1).statement),
+        ('pods of a member', 'pods', 'ix_pods_memberID', select(Pod).where(Pod.memberID == 1)),
+        ('pod by number', 'pods', 'ix_pods_podNumber', select(Pod).where(Pod.podNumber == 'LU0001')),
+        ('energy flows of a sharing group (analytics)', 'energyFlow', 'ix_energyFlow_efSGId',
+         select(EnergyFlow).where(EnergyFlow.efSGId == 1)),
+        ('energy flows of a member (analytics)', 'energyFlow', 'ix_energyFlow_efMember',
+         select(EnergyFlow).where(EnergyFlow.efMember == 1)),
+        ('summary of a sharing group (analytics)', 'accountingSummary', 'ix_accountingSummary_asSGId',
+         select(AccountingSummary).where(AccountingSummary.asSGId == 1)),
+        ('summary of a member', 'accountingSummary', 'ix_accountingSummary_asMember',
+         select(AccountingSummary).where(AccountingSummary.asMember == 1)),
+    ]
+
+
+def check_query_plans(connection):
+    """EXPLAIN every hot query, returns (name, index, plan, problems) tuples.
+
+    The problems are the plan lines scanning the whole table, or a note when the
+    expected index is not used; none when the query plan is as intended.
+    """
+    results = []
+    for name, table, index, statement in hot_queries():
+        plan = _explain(connection, statement)
+        problems = _scans(plan, table)
+        if not _uses_index(plan, table, index):
+            problems.append(f'{index} not used')
+        results.append((name, index, plan, problems))
+    return results
@@ -1,5 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
-from datetime import date
+from datetime import date, datetime
 
 db = SQLAlchemy()
 
@@ -16,6 +16,9 @@ class Member(db.Model):
     pods = db.relationship('Pod', backref='member', lazy=True)
     member_fee_payments = db.relationship('MemberFeePayment', backref='member', lazy=True)
     accounting_records_member = db.relationship('Accounting', backref='member', lazy=True)
+    __table_args__ = (
+        db.Index('ix_members_name', 'name', 'firstname'),
+    )
 
     def __repr__(self):
         return f'<Member {self.firstname} {self.name}>'
@@ -32,6 +35,10 @@ class Pod(db.Model):
 
     sharing_groups = db.relationship('PodSharingGroup', backref='pod', lazy=True)
     accounting_records_pod = db.relationship('Accounting', backref='pod', lazy=True)
+    __table_args__ = (
+        db.Index('ix_pods_memberID', 'memberID'),
+        db.Index('ix_pods_podNumber', 'podNumber'),
+    )
     # esou funktioneiert dat
     '''
     The key part is backref='pod'. This creates a reverse relationship on the Accounting model, so:
@@ -75,6 +82,7 @@ class PodSharingGroup(db.Model):
     pod_detail = db.relationship('Pod', backref='pod_sharing_groups', lazy=True)
     __table_args__ = (
         db.UniqueConstraint('podID', 'sharingGroupID', name='uix_pod_sharing_group'),
+        db.Index('ix_podSharingGroup_sharingGroupID', 'sharingGroupID'),
     )
 
     def __repr__(self):
@@ -97,8 +105,12 @@ class MemberFeePayment(db.Model):
     memberFeeID = db.Column(db.Integer, db.ForeignKey('memberfee.mfID'), nullable=False)
     paymentDate = db.Column(db.Date)
     paymentStatus = db.Column(db.String(20), default='pending')  # 'pending', 'paid', 'overdue'
+    # When the payment was requested, pending payments become overdue some days after it
+    paymentDue = db.Column(db.Date, default=date.today)
     __table_args__ = (
         db.UniqueConstraint('memberID', 'memberFeeID', name='uix_member_fee_payment'),
+        db.Index('ix_memberFeePayment_memberFeeID', 'memberFeeID', 'paymentStatus'),
+        db.Index('ix_memberFeePayment_status_due', 'paymentStatus', 'paymentDue'),
     )
 
     def __repr__(self):
@@ -114,6 +126,12 @@ class Accounting(db.Model):
     accAmount = db.Column(db.Numeric(10, 2))
     accBillingDate = db.Column(db.Date, default=date.today) 
     accSGId = db.Column(db.Integer, db.ForeignKey('sharingGroup.sgID'), nullable=False)
+    # Incremented when the amount or the member changes, see billing.py
+    accVersion = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # What the billing runs have invoiced so far: the version, the amount and the member
+    accBilledVersion = db.Column(db.Integer)
+    accBilledAmount = db.Column(db.Numeric(10, 2))
+    accBilledMember = db.Column(db.Integer)
     # Relationships
     '''
     accMember = db.relationship('Member', backref='accountings')
@@ -122,7 +140,131 @@ class Accounting(db.Model):
     '''
     __table_args__ = (
         db.UniqueConstraint('accYear', 'accMonth', 'accMember', 'accPod', 'accSGId', name='uix_accounting'),
+        db.Index('ix_accounting_accMember', 'accMember'),
+        db.Index('ix_accounting_accPod', 'accPod'),
+        db.Index('ix_accounting_accSGId', 'accSGId'),
+        # Only the rows still to bill, in the order the billing run reads them
+        db.Index('ix_accounting_unbilled', 'accMember', 'accID',
+                 sqlite_where=db.text('"accBillingDate" IS NULL'),
+                 postgresql_where=db.text('"accBillingDate" IS NULL')),
+        # Invoiced records changed since, the adjustments of the next billing run
+        db.Index('ix_accounting_rebill', 'accMember', 'accID',
+                 sqlite_where=db.text('"accBilledVersion" < "accVersion"'),
+                 postgresql_where=db.text('"accBilledVersion" < "accVersion"')),
     )
 
     def __repr__(self):
         return f'<Accounting {self.accYear}-{self.accMonth} memberID={self.accMember} podID={self.accPod} amount={self.accAmount}>'
+
+class BillingFile(db.Model):
+    __tablename__ = 'billingFile'
+    bfID = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    bfFilename = db.Column(db.String(100), nullable=False, unique=True)
+    bfCreated = db.Column(db.DateTime, default=datetime.now)
+    bfHash = db.Column(db.String(64), nullable=False)  # sha256 of the uncompressed CSV, names the archived file
+    bfSize = db.Column(db.Integer)  # uncompressed bytes
+    bfStoredSize = db.Column(db.Integer)  # gzip bytes on disk
+    bfRowCount = db.Column(db.Integer)  # member lines in the file
+    bfTotal = db.Column(db.Numeric(12, 2))
+    entries = db.relationship('BillingFileEntry', backref='billing_file', lazy=True)
+    __table_args__ = (
+        db.Index('ix_billingFile_bfCreated', 'bfCreated'),
+    )
+
+    def __repr__(self):
+        return f'<BillingFile {self.bfFilename}>'
+
+class BillingFileEntry(db.Model):
+    # Accounting records billed by a billing file
+    __tablename__ = 'billingFileEntry'
+    billingFileID = db.Column(db.Integer, db.ForeignKey('billingFile.bfID'), primary_key=True)
+    # The member billed: a record moved to another member is credited to the first one and charged to the other
+    bfeMember = db.Column(db.Integer, primary_key=True)
+    accID = db.Column(db.Integer, db.ForeignKey('accounting.accID'), primary_key=True)
+    bfeAmount = db.Column(db.Numeric(10, 2))  # invoiced by the file, or the adjustment for a corrected record
+    __table_args__ = (
+        db.Index('ix_billingFileEntry_accID', 'accID'),
+    )
+
+    def __repr__(self):
+        return f'<BillingFileEntry billingFileID={self.billingFileID} member={self.bfeMember} accID={self.accID}>'
+
+class AccountingSummary(db.Model):
+    # Accounting totals per month, member, sharing group and billing state, maintained by summary.py
+    __tablename__ = 'accountingSummary'
+    asYear = db.Column(db.Integer, primary_key=True)
+    asMonth = db.Column(db.Integer, primary_key=True)
+    asMember = db.Column(db.Integer, db.ForeignKey('members.id'), primary_key=True)
+    asSGId = db.Column(db.Integer, db.ForeignKey('sharingGroup.sgID'), primary_key=True)
+    asBilled = db.Column(db.Boolean, primary_key=True)
+    asRows = db.Column(db.Integer, nullable=False)
+    asAmount = db.Column(db.Numeric(12, 2))
+    __table_args__ = (
+        db.Index('ix_accountingSummary_asMember', 'asMember'),
+        db.Index('ix_accountingSummary_asSGId', 'asSGId'),
+    )
+
+    def __repr__(self):
+        return f'<AccountingSummary {self.asYear}-{self.asMonth} memberID={self.asMember} amount={self.asAmount}>'
+
+class EnergyFlow(db.Model):
+    # Energy of each member in each sharing group per month, written by the allocation at month close (kWh)
+    __tablename__ = 'energyFlow'
+    efYear = db.Column(db.Integer, primary_key=True)
+    efMonth = db.Column(db.Integer, primary_key=True)
+    efSGId = db.Column(db.Integer, db.ForeignKey('sharingGroup.sgID'), primary_key=True)
+    efMember = db.Column(db.Integer, db.ForeignKey('members.id'), primary_key=True)
+    efProduction = db.Column(db.Numeric(14, 3))  # produced by the member's pods for the group
+    efConsumption = db.Column(db.Numeric(14, 3))  # metered consumption, NULL when unmetered
+    efShared = db.Column(db.Numeric(14, 3))  # received from the group's production
+    efSupplied = db.Column(db.Numeric(14, 3))  # of the production, shared with the group's consumers
+    efComputed = db.Column(db.DateTime, default=datetime.now)
+    __table_args__ = (
+        db.Index('ix_energyFlow_efSGId', 'efSGId'),
+        db.Index('ix_energyFlow_efMember', 'efMember'),
+    )
+
+    def __repr__(self):
+        return f'<EnergyFlow {self.efYear}-{self.efMonth} sgID={self.efSGId} memberID={self.efMember}>'
+
+class SchemaVersion(db.Model):
+    # Migrations applied to the database, see migrations.py
+    __tablename__ = 'schemaVersion'
+    svVersion = db.Column(db.Integer, primary_key=True)
+    svDescription = db.Column(db.String(200))
+    svApplied = db.Column(db.DateTime, default=datetime.now)
+
+    def __repr__(self):
+        return f'<SchemaVersion {self.svVersion}>'
+
+class Job(db.Model):
+    # Background job queue, see jobs.py
+    __tablename__ = 'job'
+    jobID = db.Column(db.String(32), primary_key=True)
+    jobType = db.Column(db.String(50), nullable=False)
+    jobKey = db.Column(db.String(200))  # at most one queued or running job per key
+    jobStatus = db.Column(db.String(20), nullable=False, default='queued')  # 'queued', 'running', 'done', 'failed'
+    jobParams = db.Column(db.JSON)
+    jobResult = db.Column(db.JSON)
+    jobError = db.Column(db.Text)
+    jobProgress = db.Column(db.Integer, default=0)  # percent
+    jobMessage = db.Column(db.String(200))
+    jobAttempts = db.Column(db.Integer, nullable=False, default=0)
+    jobWorker = db.Column(db.String(100))
+    jobCreated = db.Column(db.DateTime, default=datetime.now)
+    jobStarted = db.Column(db.DateTime)
+    jobHeartbeat = db.Column(db.DateTime)
+    jobFinished = db.Column(db.DateTime)
+    __table_args__ = (
+        db.Index('ix_job_jobStatus', 'jobStatus', 'jobCreated'),
+        db.Index('uix_job_active_key', 'jobKey', unique=True,
+                 sqlite_where=db.text("\"jobStatus\" IN ('queued', 'running')"),
+                 postgresql_where=db.text("\"jobStatus\" IN ('queued', 'running')")),
+    )
+
+    @property
+    def active(self):
+        return self.jobStatus in ('queued', 'running')
+
+    def __repr__(self):
+        return f'<Job {self.jobType} {self.jobID} {self.jobStatus}>'
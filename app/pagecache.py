@@ -0,0 +1,356 @@
+from flask import current_app, request, session as flask_session, g, make_response
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from models import Member, Pod, SharingGroup, PodSharingGroup, MemberFee, MemberFeePayment, Accounting
+from collections import OrderedDict, namedtuple
+from functools import wraps
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+import weakref
+
+logger = logging.getLogger('comener.pagecache')
+
+PAGE_CACHE_DEFAULTS = {
+    'PAGE_CACHE_MAX_ENTRIES': 2000,
+    'PAGE_CACHE_MAX_BYTES': 64 * 1024 * 1024,
+    'PAGE_CACHE_DISK_MAX_BYTES': 512 * 1024 * 1024,
+    # Safety net for changes made by other processes when the cache is not shared on disk
+    'PAGE_CACHE_TTL': 300,
+}
+
+# Rows whose changes invalidate the cached pages showing them
+TRACKED_MODELS = (Member, Pod, SharingGroup, PodSharingGroup, MemberFee, MemberFeePayment, Accounting)
+ALL_ROWS = 'all'
+
+CachedPage = namedtuple('CachedPage', 'body mimetype etag created')
+
+_caches = weakref.WeakSet()
+
+
+def table_tag(model):
+    return model.__table__.name
+
+
+def entity_tag(model, key):
+    return f'{model.__table__.name}-{key}'
+
+
+class LRUCache:
+    """Pages kept in this process, the least recently used go first beyond either limit."""
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        if len(entry.body) > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous.body)
+            self.entries[key] = entry
+            self.size += len(entry.body)
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted.body)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+def _write_atomic(path, data):
+    # Readers in other processes see the old file or the new one, never a partial write
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class DiskCache:
+    """Pages shared by the processes of a deployment, one file each under ``directory``.
+
+    A file is a JSON header line followed by the body; the oldest files are pruned
+    once the directory grows past ``max_bytes``.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = os.path.join(directory, 'pages')
+        self.max_bytes = max_bytes
+        self.written = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                header = json.loads(f.readline())
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        return CachedPage(body, header['mimetype'], header['etag'], header['created'])
+
+    def set(self, key, entry):
+        header = json.dumps({'mimetype': entry.mimetype, 'etag': entry.etag, 'created': entry.created})
+        try:
+            _write_atomic(self._path(key), header.encode() + b'\n' + entry.body)
+        except OSError as e:
+            logger.warning('Page not written to the disk cache: %s', e)
+            return
+        self.written += len(entry.body)
+        if self.written > self.max_bytes // 10:
+            self.prune()
+
+    def prune(self):
+        self.written = 0
+        files = []
+        with os.scandir(self.directory) as entries:
+            for item in entries:
+                try:
+                    stat = item.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, item.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+
+class TagVersions:
+    """The version of each tag in this process, bumped when its rows change."""
+
+    def __init__(self):
+        self.versions = {}
+        self.lock = threading.Lock()
+
+    def get(self, tags):
+        with self.lock:
+            return [str(self.versions.get(tag, 0)) for tag in tags]
+
+    def bump(self, tags):
+        with self.lock:
+            for tag in tags:
+                self.versions[tag] = self.versions.get(tag, 0) + 1
+
+
+class DiskTagVersions:
+    """Tag versions in files next to the shared pages, so every process sees the changes."""
+
+    def __init__(self, directory):
+        self.directory = os.path.join(directory, 'tags')
+        os.makedirs(self.directory, exist_ok=True)
+
+    def get(self, tags):
+        versions = []
+        for tag in tags:
+            try:
+                with open(os.path.join(self.directory, tag), 'rb') as f:
+                    versions.append(f.read().decode())
+            except OSError:
+                versions.append('0')
+        return versions
+
+    def bump(self, tags):
+        # A random version rather than a counter: two processes bumping at once still change it
+        for tag in tags:
+            _write_atomic(os.path.join(self.directory, tag), uuid.uuid4().hex.encode())
+
+
+class PageCache:
+    """Rendered pages keyed by their URL and the versions of the rows they show.
+
+    Committed changes bump the versions, so a page rendered before a change is
+    never served after it: it is simply no longer looked up and ages out.
+    """
+
+    def __init__(self, max_entries, max_bytes, ttl, directory=None, disk_max_bytes=None):
+        self.memory = LRUCache(max_entries, max_bytes)
+        self.disk = DiskCache(directory, disk_max_bytes) if directory else None
+        self.versions = DiskTagVersions(directory) if directory else TagVersions()
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, tags):
+        versions = self.versions.get(tags)
+        raw = '\n'.join([request.full_path] + [f'{tag}={version}' for tag, version in zip(tags, versions)])
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, key):
+        entry = self.memory.get(key)
+        if entry is None and self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                self.memory.set(key, entry)
+        if entry is not None and time.time() - entry.created > self.ttl:
+            entry = None
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def set(self, key, response):
+        body = response.get_data()
+        entry = CachedPage(body, response.mimetype, hashlib.sha1(body).hexdigest(), time.time())
+        self.memory.set(key, entry)
+        if self.disk is not None:
+            self.disk.set(key, entry)
+        return entry
+
+    def bump(self, tags):
+        self.versions.bump(sorted(tags))
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+
+def _respond(entry):
+    response = current_app.response_class(entry.body, mimetype=entry.mimetype)
+    response.set_etag(entry.etag)
+    # Browsers keep the page but ask again each time, an unchanged page costs a 304
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+
+def cached_page(*models, entity=None):
+    """Serve a GET page from the page cache while the rows of ``models`` are unchanged.
+
+    ``entity`` is the (model, view argument) of the row a detail page is about: the
+    page then depends on that row only, not on the whole table. Pages showing a
+    flashed message or a form's CSRF token are specific to a session and not cached.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = current_app.extensions.get('page_cache')
+            if cache is None or request.method != 'GET' or '_flashes' in flask_session:
+                return view(*args, **kwargs)
+            tags = [table_tag(model) for model in models]
+            if entity is not None:
+                model, arg = entity
+                tags += [entity_tag(model, kwargs[arg]), entity_tag(model, ALL_ROWS)]
+            # The versions are read before rendering: a change committed meanwhile bumps
+            # them, and the page stored under the old versions is never served
+            key = cache.key(tags)
+            entry = cache.get(key)
+            if entry is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed or 'csrf_token' in g:
+                    return response
+                entry = cache.set(key, response)
+            return _respond(entry)
+        return wrapper
+    return decorator
+
+
+def clear():
+    for cache in list(_caches):
+        cache.clear()
+
+
+# Changes are collected on the session and bump the versions once committed,
+# like the choices cache, so a concurrent request cannot cache the old rows again.
+def _mark(session, tags):
+    if session is not None:
+        session.info.setdefault('stale_pages', set()).update(tags)
+
+
+def mark_stale(session, *models):
+    """Invalidate the pages showing any row of ``models``, for Core statements the ORM events miss."""
+    _mark(session, [tag for model in models for tag in (table_tag(model), entity_tag(model, ALL_ROWS))])
+
+
+def _on_insert(mapper, connection, target):
+    _mark(object_session(target), [table_tag(mapper.class_)])
+
+
+def _on_change(mapper, connection, target):
+    key = mapper.primary_key_from_instance(target)[0]
+    _mark(object_session(target), [table_tag(mapper.class_), entity_tag(mapper.class_, key)])
+
+
+for _model in TRACKED_MODELS:
+    event.listen(_model, 'after_insert', _on_insert)
+    event.listen(_model, 'after_update', _on_change)
+    event.listen(_model, 'after_delete', _on_change)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _on_bulk_statement(orm_execute_state):
+    # Bulk INSERT/UPDATE/DELETE statements bypass the mapper events
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.class_ in TRACKED_MODELS:
+            mark_stale(orm_execute_state.session, mapper.class_)
+
+
+@event.listens_for(Session, 'after_commit')
+def _on_commit(session):
+    stale = session.info.pop('stale_pages', None)
+    if stale:
+        for cache in list(_caches):
+            cache.bump(stale)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _on_rollback(session):
+    session.info.pop('stale_pages', None)
+
+
+def init_page_cache(app):
+    """Cache rendered pages when PAGE_CACHE_ENABLED is on, by default when PAGE_CACHE_DIR is set.
+
+    PAGE_CACHE_DIR shares the pages and their invalidation between the processes
+    of a deployment (web workers, job workers and commands); without it each
+    process has its own cache and sees the others' changes after PAGE_CACHE_TTL,
+    so it is only enabled on request, for a single process.
+    """
+    for key, default in PAGE_CACHE_DEFAULTS.items():
+        app.config.setdefault(key, default)
+    directory = app.config.get('PAGE_CACHE_DIR')
+    enabled = app.config.get('PAGE_CACHE_ENABLED')
+    if not (bool(directory) if enabled is None else enabled):
+        return
+    if not directory:
+        logger.warning('Page cache without PAGE_CACHE_DIR: changes made by other processes show after %ss',
+                       app.config['PAGE_CACHE_TTL'])
+    cache = PageCache(app.config['PAGE_CACHE_MAX_ENTRIES'], app.config['PAGE_CACHE_MAX_BYTES'],
+                      app.config['PAGE_CACHE_TTL'], directory=directory,
+                      disk_max_bytes=app.config['PAGE_CACHE_DISK_MAX_BYTES'])
+    app.extensions['page_cache'] = cache
+    _caches.add(cache)
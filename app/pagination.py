@@ -0,0 +1,171 @@
+from flask import request, url_for
+from sqlalchemy import and_, or_, false
+from datetime import date, datetime
+from decimal import Decimal
+import base64
+import json
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 500
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'n': str(value)}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'd' in value:
+            return date.fromisoformat(value['d'])
+        if 'n' in value:
+            return Decimal(value['n'])
+    return value
+
+
+def encode_cursor(values):
+    raw = json.dumps([_encode_value(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        return [_decode_value(v) for v in json.loads(raw)]
+    except (ValueError, TypeError):
+        return None
+
+
+def _after(column, value, descending):
+    # NULL always sorts lowest: first in ascending order, last in descending order
+    if descending:
+        return false() if value is None else or_(column < value, column.is_(None))
+    return column.isnot(None) if value is None else column > value
+
+
+def _equal(column, value):
+    return column.is_(None) if value is None else column == value
+
+
+def keyset_filter(columns, values, descending):
+    """Rows strictly after ``values`` in the lexicographic (columns) order."""
+    clauses = []
+    for i, (column, value) in enumerate(zip(columns, values)):
+        prefix = [_equal(c, v) for c, v in zip(columns[:i], values[:i])]
+        clauses.append(and_(*prefix, _after(column, value, descending)))
+    return or_(*clauses)
+
+
+def _order_by(columns, descending):
+    if descending:
+        return [c.desc().nulls_last() for c in columns]
+    return [c.asc().nulls_first() for c in columns]
+
+
+class Page:
+    def __init__(self, items, sort, order, per_page, next_cursor, prev_cursor):
+        self.items = items
+        self.sort = sort
+        self.order = order
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def keyset_paginate(query, columns, key, after=None, before=None, descending=False,
+                    per_page=DEFAULT_PER_PAGE, sort=None):
+    """Fetch one page of ``query`` ordered by ``columns`` then the unique ``key``.
+
+    ``key(item)`` returns the values of ``columns`` for a fetched item, they make
+    the cursor of the neighbouring pages. Only ``per_page + 1`` rows are read
+    whatever the size of the table, provided the sort columns are indexed.
+    """
+    cursor = decode_cursor(before or after) if (before or after) else None
+    if cursor is not None and len(cursor) != len(columns):
+        cursor = None
+    backwards = cursor is not None and before is not None
+
+    scan_descending = descending != backwards
+    if cursor is not None:
+        query = query.filter(keyset_filter(columns, cursor, scan_descending))
+    rows = query.order_by(*_order_by(columns, scan_descending)).limit(per_page + 1).all()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if more or backwards:
+            next_cursor = encode_cursor(key(rows[-1]))
+        if cursor is not None and (more or not backwards):
+            prev_cursor = encode_cursor(key(rows[0]))
+    return Page(rows, sort, 'desc' if descending else 'asc', per_page, next_cursor, prev_cursor)
+
+
+def paginate_request(query, sortable, default_sort, primary_key, default_order='asc'):
+    """Paginate ``query`` from the ``sort``, ``order``, ``after``, ``before`` and ``per_page`` request arguments.
+
+    ``sortable`` maps a sort name to its tuple of model columns; the primary key is
+    appended to make the order total.
+    """
+    sort = request.args.get('sort', default_sort)
+    if sort not in sortable:
+        sort = default_sort
+    order = request.args.get('order', default_order)
+    per_page = min(max(request.args.get('per_page', DEFAULT_PER_PAGE, type=int), 1), MAX_PER_PAGE)
+
+    columns = list(sortable[sort]) + [primary_key]
+    keys = [c.key for c in columns]
+    return keyset_paginate(
+        query, columns, key=lambda item: [getattr(item, k) for k in keys],
+        after=request.args.get('after'), before=request.args.get('before'),
+        descending=order == 'desc', per_page=per_page, sort=sort
+    )
+
+
+def page_url(**changes):
+    """URL of the current list view with some query arguments changed, ``None`` removes one.
+
+    Changing anything but the cursor restarts from the first page.
+    """
+    args = request.args.to_dict()
+    if 'after' in changes:
+        changes.setdefault('before', None)
+    elif 'before' in changes:
+        changes.setdefault('after', None)
+    else:
+        changes.update(after=None, before=None)
+    for name, value in changes.items():
+        if value is None:
+            args.pop(name, None)
+        else:
+            args[name] = value
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+
+def sort_url(page, sort):
+    """Sort on ``sort``, or flip the order when the page is already sorted on it."""
+    order = 'desc' if page.sort == sort and page.order == 'asc' else 'asc'
+    return page_url(sort=sort, order=order)
@@ -0,0 +1,329 @@
+from sqlalchemy import select, insert, update, exists, literal, bindparam, func, case, Date, String
+from models import db, Member, MemberFee, MemberFeePayment
+from jobs import job_handler
+import pagecache
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+import csv
+import os
+import re
+
+# Payments per UPDATE batch of the status transitions and the reconciliation
+UPDATE_BATCH_SIZE = 500
+
+# The structured reference members quote on their transfer, FEE-<fee year>-<payment id>
+REFERENCE_PATTERN = re.compile(r'FEE[\s/-]*(\d{4})[\s/-]*(\d+)', re.IGNORECASE)
+
+# Header names of the bank exports, compared lowercased
+REFERENCE_COLUMNS = ('reference', 'communication', 'message', 'description', 'details')
+AMOUNT_COLUMNS = ('amount', 'montant', 'betrag', 'credit')
+DATE_COLUMNS = ('date', 'value date', 'booking date', 'execution date', 'date valeur')
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d.%m.%Y', '%d-%m-%Y')
+
+
+def payment_reference(year, payment_id):
+    return f'FEE-{year}-{payment_id}'
+
+
+def generate_fee_payments(member_fee_id, due=None):
+    """Add the pending payment of every member who has none for this fee, returns how many.
+
+    One INSERT ... SELECT: members already holding a payment are left out, so running
+    it again only adds the members created since. The caller commits.
+    """
+    already = select(MemberFeePayment.mfpID).where(
+        MemberFeePayment.memberFeeID == member_fee_id, MemberFeePayment.memberID == Member.id
+    )
+    members = select(
+        Member.id, literal(member_fee_id), literal('pending', String), literal(due or date.today(), Date)
+    ).where(~exists(already))
+    pagecache.mark_stale(db.session, MemberFeePayment)
+    result = db.session.execute(insert(MemberFeePayment.__table__).from_select(
+        ['memberID', 'memberFeeID', 'paymentStatus', 'paymentDue'], members
+    ))
+    return result.rowcount
+
+
+def create_fee_cycle(year, amount=None, due=None):
+    """Create the member fee of a year, or reuse it, with the pending payments of all members.
+
+    Returns (member_fee, payments created); the caller commits.
+    """
+    member_fee = MemberFee.query.filter_by(mfYear=year).order_by(MemberFee.mfID).first()
+    if member_fee is None:
+        member_fee = MemberFee(mfYear=year, mfamount=amount)
+        db.session.add(member_fee)
+        db.session.flush()
+    return member_fee, generate_fee_payments(member_fee.mfID, due=due)
+
+
+def mark_overdue(days, member_fee_id=None, today=None):
+    """Mark overdue the pending payments due more than ``days`` ago, in one UPDATE.
+
+    Returns how many changed; the caller commits.
+    """
+    cutoff = (today or date.today()) - timedelta(days=days)
+    stmt = update(MemberFeePayment).where(
+        MemberFeePayment.paymentStatus == 'pending', MemberFeePayment.paymentDue < cutoff
+    )
+    if member_fee_id is not None:
+        stmt = stmt.where(MemberFeePayment.memberFeeID == member_fee_id)
+    stmt = stmt.values(paymentStatus='overdue').execution_options(synchronize_session=False)
+    return db.session.execute(stmt).rowcount
+
+
+def transition_payments(payment_ids, status, paid_on=None):
+    """Set the status of the given payments, one UPDATE per batch, returns how many changed.
+
+    Payments marked paid keep the payment date they already have, the others get
+    ``paid_on`` or today. The caller commits.
+    """
+    values = {'paymentStatus': status}
+    if status == 'paid':
+        values['paymentDate'] = func.coalesce(MemberFeePayment.paymentDate, paid_on or date.today())
+    changed = 0
+    for start in range(0, len(payment_ids), UPDATE_BATCH_SIZE):
+        stmt = (
+            update(MemberFeePayment)
+            .where(MemberFeePayment.mfpID.in_(payment_ids[start:start + UPDATE_BATCH_SIZE]),
+                   MemberFeePayment.paymentStatus != status)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        changed += db.session.execute(stmt).rowcount
+    return changed
+
+
+# Status filters of the member fee page, 'open' being what is still to collect
+STATUS_FILTERS = {
+    'open': ('pending', 'overdue'),
+    'pending': ('pending',),
+    'overdue': ('overdue',),
+    'paid': ('paid',),
+}
+
+
+def payment_totals(member_fee_id):
+    """Count and amount of the payments of a fee by status, from one GROUP BY on the fee's index."""
+    rows = db.session.execute(
+        select(MemberFeePayment.paymentStatus, func.count(MemberFeePayment.mfpID), func.sum(MemberFee.mfamount))
+        .join(MemberFee, MemberFeePayment.memberFeeID == MemberFee.mfID)
+        .where(MemberFeePayment.memberFeeID == member_fee_id)
+        .group_by(MemberFeePayment.paymentStatus)
+    )
+    totals = {status: {'count': 0, 'amount': 0} for status in ('pending', 'paid', 'overdue')}
+    for status, count, amount in rows:
+        totals[status] = {'count': count, 'amount': amount or 0}
+    return totals
+
+
+class FeeCollection:
+    """One member fee with the number of its payments by status."""
+
+    def __init__(self, row):
+        self.mfID, self.mfYear, self.mfamount = row.mfID, row.mfYear, row.mfamount
+        self.payments, self.paid, self.pending, self.overdue = row.payments, row.paid, row.pending, row.overdue
+
+    @property
+    def expected(self):
+        return (self.mfamount or 0) * self.payments
+
+    @property
+    def collected(self):
+        return (self.mfamount or 0) * self.paid
+
+    @property
+    def rate(self):
+        return self.paid / self.payments if self.payments else None
+
+
+def collection_report():
+    """The collection of every member fee, newest year first, in a single statement."""
+    def count(status):
+        return func.coalesce(func.sum(case((MemberFeePayment.paymentStatus == status, 1), else_=0)), 0)
+
+    rows = db.session.execute(
+        select(MemberFee.mfID, MemberFee.mfYear, MemberFee.mfamount,
+               func.count(MemberFeePayment.mfpID).label('payments'),
+               count('paid').label('paid'), count('pending').label('pending'), count('overdue').label('overdue'))
+        .outerjoin(MemberFeePayment, MemberFeePayment.memberFeeID == MemberFee.mfID)
+        .group_by(MemberFee.mfID, MemberFee.mfYear, MemberFee.mfamount)
+        .order_by(MemberFee.mfYear.desc(), MemberFee.mfID)
+    )
+    return [FeeCollection(row) for row in rows]
+
+
+class ReconciliationReport:
+    def __init__(self):
+        self.errors = []  # (line, message)
+        self.lines = 0
+        self.ignored = 0
+        self.paid = 0
+        self.already_paid = 0
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def to_dict(self):
+        return {
+            'lines': self.lines,
+            'ignored': self.ignored,
+            'paid': self.paid,
+            'already_paid': self.already_paid,
+            'errors': [list(error) for error in self.errors],
+            'ok': self.ok,
+        }
+
+
+def _column(header, names):
+    for index, name in enumerate(header):
+        if name.strip().lower() in names:
+            return index
+    return None
+
+
+def parse_amount(text):
+    """Read an amount as banks write it: 1234.56, 1.234,56, 1,234.56 or 50,00 EUR."""
+    text = re.sub(r'[^\d,.-]', '', text or '')
+    if ',' in text and '.' in text:
+        thousands = ',' if text.rfind(',') < text.rfind('.') else '.'
+        text = text.replace(thousands, '')
+    text = text.replace(',', '.')
+    try:
+        return Decimal(text)
+    except InvalidOperation:
+        raise ValueError(f'Invalid amount {text!r}')
+
+
+def parse_date(text):
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text.strip(), fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(f'Invalid date {text!r}')
+
+
+def read_bank_file(source, errors=None):
+    """Yield (line, payment id, fee year, amount or None, date or None) of the transfers quoting a fee reference.
+
+    Lines without a reference are other transactions of the account, they yield a
+    payment id of None. A line with an invalid amount or date is skipped and
+    appended to ``errors`` as (line, message); without ``errors`` it raises
+    ValueError with the line.
+    """
+    with open(source, newline='', encoding='utf-8-sig') as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=';,\t')
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(f, dialect)
+        header = next(reader, [])
+        reference, amount, paid_on = (_column(header, names)
+                                      for names in (REFERENCE_COLUMNS, AMOUNT_COLUMNS, DATE_COLUMNS))
+        for line, row in enumerate(reader, start=2):
+            if not any(cell.strip() for cell in row):
+                continue
+            # Without a reference column the communication can be in any cell
+            text = row[reference] if reference is not None and reference < len(row) else ' '.join(row)
+            match = REFERENCE_PATTERN.search(text)
+            if match is None:
+                yield line, None, None, None, None
+                continue
+            try:
+                value = parse_amount(row[amount]) if amount is not None and row[amount].strip() else None
+                day = parse_date(row[paid_on]) if paid_on is not None and row[paid_on].strip() else None
+            except (ValueError, IndexError) as e:
+                if errors is None:
+                    raise ValueError(f'line {line}: {e}')
+                errors.append((line, str(e) or 'Missing amount or date'))
+                continue
+            yield line, int(match.group(2)), int(match.group(1)), value, day
+
+
+def _payments(payment_ids):
+    found = {}
+    for start in range(0, len(payment_ids), UPDATE_BATCH_SIZE):
+        for row in db.session.execute(
+            select(MemberFeePayment.mfpID, MemberFeePayment.paymentStatus, MemberFee.mfYear, MemberFee.mfamount)
+            .join(MemberFee, MemberFeePayment.memberFeeID == MemberFee.mfID)
+            .where(MemberFeePayment.mfpID.in_(payment_ids[start:start + UPDATE_BATCH_SIZE]))
+        ):
+            found[row.mfpID] = row
+    return found
+
+
+def reconcile_payments(source, dry_run=False, report=None):
+    """Mark paid the payments whose reference appears in a bank export (CSV).
+
+    Transfers quoting an unknown reference, or less than the fee, and lines with
+    an invalid amount or date are reported by line and left unpaid. The payments
+    found are updated in batches of one statement inside a single transaction.
+    """
+    report = report if report is not None else ReconciliationReport()
+    transfers = {}
+    invalid = []
+    try:
+        for line, payment_id, year, amount, day in read_bank_file(source, errors=invalid):
+            report.lines += 1
+            if payment_id is None:
+                report.ignored += 1
+            elif payment_id in transfers:
+                report.errors.append((line, f'{payment_reference(year, payment_id)} repeated in the file'))
+            else:
+                transfers[payment_id] = (line, year, amount, day)
+    except (OSError, UnicodeDecodeError, csv.Error, ValueError) as e:
+        report.errors.append((0, f'Unreadable file: {e}'))
+        return report
+    report.lines += len(invalid)
+    report.errors.extend(invalid)
+
+    payments = _payments(list(transfers))
+    records = []
+    for payment_id, (line, year, amount, day) in transfers.items():
+        payment = payments.get(payment_id)
+        if payment is None or payment.mfYear != year:
+            report.errors.append((line, f'{payment_reference(year, payment_id)} matches no member fee payment'))
+        elif payment.paymentStatus == 'paid':
+            report.already_paid += 1
+        elif amount is not None and payment.mfamount is not None and amount < payment.mfamount:
+            report.errors.append((line, f'{amount} paid for a fee of {payment.mfamount}'))
+        else:
+            records.append({'_id': payment_id, '_paid_on': day or date.today()})
+
+    stmt = (
+        update(MemberFeePayment.__table__)
+        .where(MemberFeePayment.mfpID == bindparam('_id'), MemberFeePayment.paymentStatus != 'paid')
+        .values(paymentStatus='paid', paymentDate=bindparam('_paid_on'))
+    )
+    try:
+        connection = db.session.connection()
+        pagecache.mark_stale(db.session, MemberFeePayment)
+        for start in range(0, len(records), UPDATE_BATCH_SIZE):
+            connection.execute(stmt, records[start:start + UPDATE_BATCH_SIZE])
+        report.paid = len(records)
+        report.errors.sort()
+        if dry_run:
+            db.session.rollback()
+        else:
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        report.paid = 0
+        report.errors.append((0, f'Reconciliation aborted, nothing was saved: {e}'))
+    return report
+
+
+@job_handler('reconcile_payments')
+def reconcile_payments_job(job, path, dry_run=False):
+    """Reconcile an uploaded bank export, the job is marked done by the reconciliation commit."""
+    report = ReconciliationReport()
+    job.complete_on_commit(report.to_dict)
+    try:
+        reconcile_payments(path, dry_run=dry_run, report=report)
+    finally:
+        os.remove(path)
+    return report.to_dict()
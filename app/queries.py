@@ -0,0 +1,58 @@
+from sqlalchemy import or_
+from sqlalchemy.orm import joinedload, selectinload
+from models import Member, Pod, PodSharingGroup, MemberFeePayment, Accounting
+
+# Query builders loading up front every relationship their template renders,
+# so a page costs a fixed number of statements instead of one per row.
+
+
+def accounting_query():
+    return Accounting.query.options(
+        joinedload(Accounting.member),
+        joinedload(Accounting.pod),
+        joinedload(Accounting.sharingGroup)
+    )
+
+
+def pods_query():
+    return Pod.query.options(joinedload(Pod.member))
+
+
+def pod_sharing_groups_query():
+    return PodSharingGroup.query.options(
+        joinedload(PodSharingGroup.pod),
+        joinedload(PodSharingGroup.sharing_group)
+    )
+
+
+def sharing_group_pods_query(sharing_group_id):
+    return PodSharingGroup.query.options(
+        joinedload(PodSharingGroup.pod_detail).joinedload(Pod.member)
+    ).filter(PodSharingGroup.sharingGroupID == sharing_group_id)
+
+
+def member_fee_payments_query():
+    return MemberFeePayment.query.options(
+        joinedload(MemberFeePayment.member),
+        joinedload(MemberFeePayment.member_fee)
+    )
+
+
+def member_detail_query():
+    return Member.query.options(
+        selectinload(Member.pods).selectinload(Pod.sharing_groups).joinedload(PodSharingGroup.sharing_group),
+        selectinload(Member.member_fee_payments).joinedload(MemberFeePayment.member_fee)
+    )
+
+
+def member_edit_query():
+    return Member.query.options(selectinload(Member.pods))
+
+
+def member_name_filter(term):
+    """Members whose name or first name starts with ``term``, case-insensitively.
+
+    The term's % and _ match themselves, not any characters.
+    """
+    pattern = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    return or_(Member.name.ilike(pattern, escape='\\'), Member.firstname.ilike(pattern, escape='\\'))
@@ -0,0 +1,100 @@
+from sqlalchemy import update
+from decimal import Decimal
+from datetime import date
+from models import db, Member, Pod, SharingGroup, PodSharingGroup, MemberFee, MemberFeePayment, Accounting
+from instrumentation import count_queries
+import choices
+import pagecache
+
+# Maximum SQL statements per page against the seeded community. Every page
+# renders many rows with relationships, so an N+1 regression goes far above.
+QUERY_BUDGETS = {
+    'list_members': ('/members', 1),
+    'detail_member': ('/members/1', 4),
+    'update_member': ('/members/1/edit', 3),
+    'list_pods': ('/pods', 1),
+    'detail_sharing_group': ('/sharing_groups/1', 2),
+    'list_pod_sharing_groups': ('/pod_sharing_groups', 2),
+    'detail_pod_sharing_group': ('/pod_sharing_groups/1', 1),
+    'list_member_fee_payments': ('/member_fee_payments', 2),
+    'detail_member_fee_payment': ('/member_fee_payments/1', 1),
+    'list_member_fees': ('/member_fees', 1),
+    'detail_member_fee': ('/member_fees/1', 3),
+    'detail_member_fee_paid': ('/member_fees/1?status=paid', 3),
+    'list_accounting': ('/accounting', 2),
+    'list_accounting_unbilled': ('/accounting/unbilled', 3),
+    'detail_accounting': ('/accounting/1', 1),
+    'accounting_summary': ('/accounting/summary', 3),
+    'analytics': ('/analytics', 2),
+    'sharing_group_analytics': ('/analytics/sharing_groups/1', 3),
+    'member_analytics': ('/analytics/members/1', 3),
+    'search': ('/search?q=name1', 2),
+    'search_typeahead': ('/search/typeahead?q=nmae', 2),
+    'api_list_accounting': ('/api/v1/accounting?fields=accID,accAmount', 1),
+    'api_list_members': ('/api/v1/members', 1),
+}
+
+
+def seed_sample_community(members=30, months=3):
+    """A small community where every page lists many rows with relationships."""
+    groups = [
+        SharingGroup(sgName='Local', sgNumber='SG-1', sgPrice=Decimal('0.12'), sgType='Local'),
+        SharingGroup(sgName='National', sgNumber='SG-2', sgPrice=Decimal('0.10'), sgType='National'),
+    ]
+    db.session.add_all(groups)
+    fee = MemberFee(mfamount=Decimal('50.00'), mfYear=2025)
+    db.session.add(fee)
+    for i in range(1, members + 1):
+        member = Member(name=f'Name{i}', firstname=f'First{i}', nationalId=f'N{i:06d}',
+                        email=f'member{i}@example.lu', energyID=f'E{i:06d}')
+        db.session.add(member)
+        db.session.flush()
+        pods = [
+            Pod(podlabel=f'Home {i}', podType='Consumption', memberID=member.id, podNumber=f'LU-C-{i:06d}'),
+            Pod(podlabel=f'Roof {i}', podType='Production', memberID=member.id, podNumber=f'LU-P-{i:06d}',
+                energyproduction=Decimal('300.00')),
+        ]
+        db.session.add_all(pods)
+        db.session.flush()
+        for pod in pods:
+            for group in groups:
+                db.session.add(PodSharingGroup(podID=pod.podsID, sharingGroupID=group.sgID))
+                for month in range(1, months + 1):
+                    db.session.add(Accounting(accYear=2025, accMonth=month, accMember=member.id,
+                                              accPod=pod.podsID, accSGId=group.sgID,
+                                              accAmount=Decimal('1.00'), accBillingDate=None))
+        db.session.add(MemberFeePayment(memberID=member.id, memberFeeID=fee.mfID,
+                                        paymentStatus='paid' if i % 2 else 'pending',
+                                        paymentDate=date(2025, 3, 1) if i % 2 else None))
+    db.session.commit()
+    # The accBillingDate default dated every record on insert, the last month stays unbilled
+    db.session.execute(update(Accounting).where(Accounting.accMonth == months).values(accBillingDate=None))
+    db.session.commit()
+
+
+def measure_page(client, url):
+    """Status and SQL statements of one page, rendered from cold choices and page caches."""
+    choices.invalidate()
+    pagecache.clear()
+    with count_queries() as statements:
+        response = client.get(url)
+    return response.status_code, statements
+
+
+def measure_query_counts(client):
+    """SQL statements per endpoint, starting each page from cold choices and page caches."""
+    results = []
+    for endpoint, (url, budget) in QUERY_BUDGETS.items():
+        status, statements = measure_page(client, url)
+        results.append({
+            'endpoint': endpoint,
+            'url': url,
+            'status': status,
+            'statements': len(statements),
+            'budget': budget,
+        })
+    return results
+
+
+def over_budget(results):
+    return [r for r in results if r['status'] != 200 or r['statements'] > r['budget']]
@@ -0,0 +1,301 @@
+from sqlalchemy import (select, update, bindparam, tuple_, case, or_, UniqueConstraint, Integer, Numeric, String, Text,
+                        Date, DateTime)
+from models import db, Member, Pod, SharingGroup, PodSharingGroup, MemberFee, MemberFeePayment, Accounting
+from summary import mark_stale_ids
+from billing import BILLED_VALUES
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+import choices
+import pagecache
+
+# Models of the simulation's membership index, simulation.WATCHED_MODELS
+MEMBERSHIP_MODELS = (Member, Pod, SharingGroup, PodSharingGroup)
+
+# Rows per executemany batch, all batches of a call share one transaction
+BULK_BATCH_SIZE = 1000
+MAX_BULK_ROWS = 10000
+MAX_ERRORS = 100
+
+
+class ValidationError(Exception):
+    def __init__(self, errors):
+        super().__init__(f'{len(errors)} invalid values')
+        self.errors = errors
+
+
+class Resource:
+    """A model exposed by the JSON API: its fields are the table columns, under their attribute names.
+
+    The columns of the table's unique constraint, if any, make the natural key bulk
+    writes upsert on.
+    """
+
+    def __init__(self, model, choices=None, defaults=None, keep_billed=False, read_only=()):
+        self.model = model
+        self.table = model.__table__
+        self.columns = {column.key: column for column in self.table.columns}
+        self.primary_key = self.table.primary_key.columns.values()[0]
+        unique = [c for c in self.table.constraints if isinstance(c, UniqueConstraint)]
+        self.natural_key = tuple(column.key for column in unique[0].columns) if unique else None
+        self.choices = choices or {}
+        # Insert values of the fields a new row leaves out, never applied to an update
+        self.defaults = defaults or {}
+        self.keep_billed = keep_billed
+        # Fields the application maintains, listed but never written through the API
+        self.read_only = set(read_only)
+
+    @property
+    def fields(self):
+        return list(self.columns)
+
+    def column(self, name):
+        return self.columns[name]
+
+    def parse(self, name, value):
+        """Convert a JSON or query string value to the column's Python type, raises ValueError."""
+        column = self.columns[name]
+        if value is None:
+            if not column.nullable and not column.primary_key:
+                raise ValueError('is required')
+            return None
+        if isinstance(value, bool):
+            raise ValueError('must not be a boolean')
+        kind = column.type
+        if isinstance(kind, Integer):
+            if isinstance(value, float) and not value.is_integer():
+                raise ValueError('must be an integer')
+            value = int(value)
+        elif isinstance(kind, Numeric):
+            try:
+                value = Decimal(str(value))
+            except InvalidOperation:
+                raise ValueError('must be a number')
+            if not value.is_finite():
+                raise ValueError('must be a number')
+        elif isinstance(kind, DateTime):
+            value = datetime.fromisoformat(value)
+        elif isinstance(kind, Date):
+            value = date.fromisoformat(value)
+        elif isinstance(kind, (String, Text)):
+            if not isinstance(value, str):
+                raise ValueError('must be a string')
+            if getattr(kind, 'length', None) and len(value) > kind.length:
+                raise ValueError(f'is longer than {kind.length} characters')
+        if name in self.choices and value not in self.choices[name]:
+            raise ValueError(f"must be one of {', '.join(self.choices[name])}")
+        return value
+
+    def validate(self, data):
+        """Parse a JSON object into column values, returns (values, [(field, message)])."""
+        values, errors = {}, []
+        if not isinstance(data, dict):
+            return values, [(None, 'must be an object')]
+        for name, value in data.items():
+            if name not in self.columns:
+                errors.append((name, 'is not a field'))
+                continue
+            if name in self.read_only:
+                errors.append((name, 'is read-only'))
+                continue
+            try:
+                values[name] = self.parse(name, value)
+            except (ValueError, TypeError) as e:
+                errors.append((name, str(e) or 'is invalid'))
+        return values, errors
+
+    def missing(self, values):
+        """Fields a new row must set: neither nullable nor defaulted."""
+        return [name for name, column in self.columns.items()
+                if not column.nullable and not column.primary_key and column.default is None
+                and name not in values and name not in self.defaults]
+
+    def has_key(self, values):
+        if self.primary_key.key in values:
+            return 'primary'
+        if self.natural_key and all(values.get(name) is not None for name in self.natural_key):
+            return 'natural'
+        return None
+
+    def dump(self, row, fields):
+        return {name: _json_value(getattr(row, name)) for name in fields}
+
+
+def _json_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+PAYMENT_STATUSES = ('pending', 'paid', 'overdue')
+
+RESOURCES = {
+    'members': Resource(Member),
+    'pods': Resource(Pod, choices={'podType': ('Production', 'Consumption')}),
+    'sharing_groups': Resource(SharingGroup, choices={'sgType': ('National', 'Local')}),
+    'pod_sharing_groups': Resource(PodSharingGroup),
+    'member_fees': Resource(MemberFee),
+    'member_fee_payments': Resource(MemberFeePayment, choices={'paymentStatus': PAYMENT_STATUSES},
+                                    defaults={'paymentStatus': 'pending'}),
+    # New records are unbilled, whatever the form's default; invoiced ones keep their billing date
+    # and their corrections are billed as adjustments, like the edit form does
+    'accounting': Resource(Accounting, defaults={'accBillingDate': None}, keep_billed=True,
+                           read_only=('accVersion', 'accBilledVersion', 'accBilledAmount', 'accBilledMember')),
+}
+
+
+def _insert(resource):
+    # Imported here, the dialect modules are not needed to start the application
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert(resource.table)
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(resource.table)
+    raise NotImplementedError(f'Bulk upsert is not supported on {dialect}')
+
+
+def _upsert(resource, fields):
+    stmt = _insert(resource)
+    key = resource.natural_key
+    update = [name for name in fields if name not in key]
+    # A row made of its key only still updates, so the statement behaves the same for every row
+    set_ = {name: stmt.excluded[name] for name in (update or key[:1])}
+    billed = [name for name in BILLED_VALUES if name in update]
+    if resource.keep_billed and billed:
+        # Like the ORM's before_update event, so the next billing run adjusts invoiced records
+        table = resource.table
+        changed = or_(*(table.c[name].is_distinct_from(stmt.excluded[name]) for name in billed))
+        set_['accVersion'] = case((changed, table.c.accVersion + 1), else_=table.c.accVersion)
+    return stmt.on_conflict_do_update(index_elements=list(key), set_=set_)
+
+
+def _update(resource, fields):
+    # The parameters go by another name than their column, the version compares the old values to them
+    table, pk = resource.table, resource.primary_key
+    set_ = {name: bindparam(f'_{name}') for name in fields if name != pk.key}
+    billed = [name for name in BILLED_VALUES if name in set_]
+    if resource.keep_billed and billed:
+        # Like the ORM's before_update event, so the next billing run adjusts invoiced records
+        changed = or_(*(table.c[name].is_distinct_from(set_[name]) for name in billed))
+        set_['accVersion'] = case((changed, table.c.accVersion + 1), else_=table.c.accVersion)
+    return update(table).where(pk == bindparam(f'_{pk.key}')).values(set_)
+
+
+def _groups(rows):
+    # executemany needs the same columns in every row of a statement
+    groups = {}
+    for index, kind, fields, values in rows:
+        groups.setdefault((kind, fields), []).append((index, values))
+    return groups.items()
+
+
+def _existing_ids(resource, ids):
+    known = set()
+    for start in range(0, len(ids), BULK_BATCH_SIZE):
+        known.update(db.session.scalars(
+            select(resource.primary_key).where(resource.primary_key.in_(ids[start:start + BULK_BATCH_SIZE]))
+        ))
+    return known
+
+
+def _billing_date_errors(resource, rows):
+    """Rows changing the billing date of an invoiced record, which stays the date of its first invoice."""
+    dated = [(index, kind, values) for index, kind, fields, values in rows
+             if kind != 'insert' and 'accBillingDate' in fields]
+    if not dated:
+        return []
+    table, pk, key = resource.table, resource.primary_key, resource.natural_key
+    key_columns = [table.c[name] for name in key]
+    invoiced = select(pk, *key_columns, table.c.accBillingDate).where(table.c.accBilledVersion.isnot(None))
+    ids = [values[pk.key] for _, kind, values in dated if kind == 'primary']
+    keys = [tuple(values[name] for name in key) for _, kind, values in dated if kind == 'natural']
+    found = {}
+    for column, wanted in ((pk, ids), (tuple_(*key_columns), keys)):
+        for start in range(0, len(wanted), BULK_BATCH_SIZE):
+            for row in db.session.execute(invoiced.where(column.in_(wanted[start:start + BULK_BATCH_SIZE]))):
+                found[('primary', row[0])] = found[('natural', tuple(row[1:-1]))] = row[-1]
+    errors = []
+    for index, kind, values in dated:
+        row_key = (kind, values[pk.key] if kind == 'primary' else tuple(values[name] for name in key))
+        if row_key in found and values['accBillingDate'] != found[row_key]:
+            errors.append({'row': index, 'field': 'accBillingDate', 'error': 'is read-only once invoiced'})
+    return errors
+
+
+def bulk_upsert(resource, data):
+    """Validate ``data``, a list of JSON objects, and write them in the current transaction.
+
+    Rows with the primary key update that row, rows with the whole unique key are
+    upserted on it and the others are inserted. An invoiced accounting record
+    keeps its billing date and its new amount is billed as an adjustment. Returns
+    the ids of the rows in the order of ``data``. Raises ValidationError before writing anything when a row is
+    invalid; the caller commits, or rolls back on a database error.
+    """
+    pk = resource.primary_key.key
+    rows, errors = [], []
+    for index, item in enumerate(data):
+        values, row_errors = resource.validate(item)
+        kind = resource.has_key(values) or 'insert'
+        # The fields sent are the ones an upsert updates, the defaults only fill new rows
+        fields = tuple(sorted(values))
+        if not row_errors and kind != 'primary':
+            row_errors = [(name, 'is required') for name in resource.missing(values)]
+            values = dict(resource.defaults, **values)
+        errors.extend({'row': index, 'field': field, 'error': message} for field, message in row_errors)
+        rows.append((index, kind, fields, values))
+    updated_ids = [values[pk] for _, kind, _, values in rows if kind == 'primary']
+    if updated_ids and not errors:
+        known = _existing_ids(resource, updated_ids)
+        errors.extend({'row': index, 'field': pk, 'error': 'does not exist'}
+                      for index, kind, _, values in rows if kind == 'primary' and values[pk] not in known)
+    if resource.keep_billed and not errors:
+        errors.extend(_billing_date_errors(resource, rows))
+    if errors:
+        raise ValidationError(errors[:MAX_ERRORS])
+
+    session = db.session
+    connection = session.connection()
+    ids = [None] * len(rows)
+    if resource.model is Accounting:
+        # Core statements bypass the summary's ORM events: refresh the keys rows are moved from
+        mark_stale_ids(session, updated_ids)
+
+    for (kind, fields), group in _groups(rows):
+        for start in range(0, len(group), BULK_BATCH_SIZE):
+            batch = group[start:start + BULK_BATCH_SIZE]
+            records = [values for _, values in batch]
+            if kind == 'insert':
+                stmt = _insert(resource).returning(resource.primary_key, sort_by_parameter_order=True)
+                for (index, _), new_id in zip(batch, connection.execute(stmt, records).scalars()):
+                    ids[index] = new_id
+            elif kind == 'primary':
+                if len(fields) > 1:
+                    connection.execute(_update(resource, fields), [
+                        {f'_{name}': value for name, value in values.items()} for values in records
+                    ])
+                for index, values in batch:
+                    ids[index] = values[pk]
+            else:
+                key = resource.natural_key
+                connection.execute(_upsert(resource, fields), records)
+                key_columns = [resource.column(name) for name in key]
+                found = {tuple(row[:-1]): row[-1] for row in connection.execute(
+                    select(*key_columns, resource.primary_key)
+                    .where(tuple_(*key_columns).in_([tuple(values[name] for name in key) for values in records]))
+                )}
+                for index, values in batch:
+                    ids[index] = found.get(tuple(values[name] for name in key))
+
+    pagecache.mark_stale(session, resource.model)
+    if resource.model is Accounting:
+        mark_stale_ids(session, [row_id for row_id in ids if row_id is not None])
+    elif resource.model in choices.KIND_BY_MODEL:
+        choices.mark_stale(session, choices.KIND_BY_MODEL[resource.model])
+    if resource.model in MEMBERSHIP_MODELS:
+        # Imported here like on its page, pandas is not needed to start the application
+        import simulation
+        simulation.mark_stale(session)
+    return ids
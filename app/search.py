@@ -0,0 +1,172 @@
+from sqlalchemy import event, text
+from models import db
+import re
+
+# Typeahead results, and index candidates re-ranked for each of them
+SEARCH_LIMIT = 10
+SEARCH_CANDIDATES = 200
+# Trigram indexes only know terms of three characters or more
+MIN_QUERY_LENGTH = 3
+
+# SQLite: one FTS5 table with the trigram tokenizer over the searched columns of
+# both tables. The rowid tells the row apart: 2 * id for a member, 2 * id + 1
+# for a pod, so the triggers reach an entry by rowid instead of scanning.
+SQLITE_INDEX = (
+    'CREATE VIRTUAL TABLE IF NOT EXISTS "searchIndex" USING fts5(title, keys, tokenize=\'trigram\')',
+)
+SQLITE_ENTRIES = {
+    'member': (
+        '2 * {row}.id',
+        'coalesce({row}.firstname, \'\') || \' \' || coalesce({row}.name, \'\')',
+        'coalesce({row}.email, \'\') || \' \' || coalesce({row}."nationalId", \'\') || \' \' || '
+        'coalesce({row}."energyID", \'\')',
+        'members', 'name, firstname, email, "nationalId", "energyID"',
+    ),
+    'pod': (
+        '2 * {row}."podsID" + 1',
+        'coalesce({row}.podlabel, \'\')',
+        'coalesce({row}."podNumber", \'\')',
+        'pods', 'podlabel, "podNumber"',
+    ),
+}
+
+# PostgreSQL: trigram indexes on the searched text of the tables themselves, no copy to keep in sync
+MEMBER_TEXT = ('coalesce(firstname, \'\') || \' \' || coalesce(name, \'\') || \' \' || coalesce(email, \'\') '
+               '|| \' \' || coalesce("nationalId", \'\') || \' \' || coalesce("energyID", \'\')')
+POD_TEXT = 'coalesce(podlabel, \'\') || \' \' || coalesce("podNumber", \'\')'
+POSTGRES_INDEX = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    f'CREATE INDEX IF NOT EXISTS ix_members_search ON members USING gin (({MEMBER_TEXT}) gin_trgm_ops)',
+    f'CREATE INDEX IF NOT EXISTS ix_pods_search ON pods USING gin (({POD_TEXT}) gin_trgm_ops)',
+)
+
+
+def _sqlite_triggers():
+    statements = []
+    for kind, (rowid, title, keys, table, columns) in SQLITE_ENTRIES.items():
+        insert = ('INSERT INTO "searchIndex" (rowid, title, keys) VALUES '
+                  f'({rowid.format(row="new")}, {title.format(row="new")}, {keys.format(row="new")})')
+        delete = f'DELETE FROM "searchIndex" WHERE rowid = {rowid.format(row="old")}'
+        statements += [
+            f'CREATE TRIGGER IF NOT EXISTS "search_{kind}_insert" AFTER INSERT ON {table} BEGIN {insert}; END',
+            f'CREATE TRIGGER IF NOT EXISTS "search_{kind}_update" AFTER UPDATE OF {columns} ON {table} '
+            f'BEGIN {delete}; {insert}; END',
+            f'CREATE TRIGGER IF NOT EXISTS "search_{kind}_delete" AFTER DELETE ON {table} BEGIN {delete}; END',
+        ]
+    return statements
+
+
+def create_search_index(connection):
+    """Create the search index of the database's dialect and fill it with the current rows."""
+    if connection.dialect.name == 'postgresql':
+        for statement in POSTGRES_INDEX:
+            connection.execute(text(statement))
+        return
+    for statement in SQLITE_INDEX + tuple(_sqlite_triggers()):
+        connection.execute(text(statement))
+    rebuild_search_index(connection)
+
+
+def rebuild_search_index(connection):
+    """Fill the SQLite index again from the tables, the triggers keep it in sync afterwards."""
+    if connection.dialect.name != 'sqlite':
+        return
+    connection.execute(text('DELETE FROM "searchIndex"'))
+    for rowid, title, keys, table, _ in SQLITE_ENTRIES.values():
+        connection.execute(text(
+            f'INSERT INTO "searchIndex" (rowid, title, keys) '
+            f'SELECT {rowid.format(row=table)}, {title.format(row=table)}, {keys.format(row=table)} FROM {table}'
+        ))
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _on_create(metadata, connection, **kw):
+    # New databases, created from the models rather than migrated
+    create_search_index(connection)
+
+
+def _words(term):
+    return re.findall(r'\w+', term.lower())
+
+
+def trigrams(term):
+    """The trigrams of each word, padded like PostgreSQL's pg_trgm: '  d', ' du', 'dup', ..., 'nt '."""
+    found = set()
+    for word in _words(term):
+        padded = f'  {word} '
+        found.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return found
+
+
+def similarity(term, candidate):
+    """Part of the term's trigrams found in the candidate, 1.0 when each of its words is there."""
+    wanted = trigrams(term)
+    if not wanted:
+        return 0.0
+    return len(wanted & trigrams(candidate)) / len(wanted)
+
+
+def _sqlite_match(match, limit):
+    rows = db.session.execute(text(
+        'SELECT rowid, title, keys FROM "searchIndex" WHERE "searchIndex" MATCH :match '
+        'ORDER BY bm25("searchIndex", 10.0, 5.0) LIMIT :limit'
+    ), {'match': match, 'limit': limit})
+    return [('pod' if rowid % 2 else 'member', rowid // 2, title, keys) for rowid, title, keys in rows]
+
+
+def _phrase(value):
+    return '"{}"'.format(value.replace('"', '""'))
+
+
+def _sqlite_candidates(term, limit):
+    # The term itself first: a substring of a name or an identifier is selective and fast
+    candidates = _sqlite_match(_phrase(term.lower()), SEARCH_CANDIDATES)
+    if len(candidates) >= limit:
+        return candidates
+    # Then any trigram of any word, misspelled names still share most of theirs;
+    # bm25 brings the rows sharing the most, and the rarest, first
+    grams = {word[i:i + 3] for word in _words(term) for i in range(len(word) - 2)}
+    if not grams:
+        return candidates
+    found = {(kind, row_id) for kind, row_id, _, _ in candidates}
+    fuzzy = _sqlite_match(' OR '.join(_phrase(gram) for gram in sorted(grams)), SEARCH_CANDIDATES)
+    return candidates + [candidate for candidate in fuzzy if candidate[:2] not in found]
+
+
+def _postgres_candidates(term):
+    candidates = []
+    for kind, statement in (
+        ('member', f'SELECT id, coalesce(firstname, \'\') || \' \' || coalesce(name, \'\'), '
+                   f'concat_ws(\' \', email, "nationalId", "energyID") FROM members '
+                   f'WHERE :term <% ({MEMBER_TEXT}) ORDER BY word_similarity(:term, {MEMBER_TEXT}) DESC LIMIT :limit'),
+        ('pod', f'SELECT "podsID", coalesce(podlabel, \'\'), coalesce("podNumber", \'\') FROM pods '
+                f'WHERE :term <% ({POD_TEXT}) ORDER BY word_similarity(:term, {POD_TEXT}) DESC LIMIT :limit'),
+    ):
+        rows = db.session.execute(text(statement), {'term': term, 'limit': SEARCH_CANDIDATES})
+        candidates += [(kind, row_id, title, keys) for row_id, title, keys in rows]
+    return candidates
+
+
+def search(term, limit=SEARCH_LIMIT):
+    """Members and pods matching ``term``, best first, as (kind, id, title, keys, score) tuples.
+
+    The index finds the rows sharing trigrams with the term, so misspelled names
+    are found too; they are ranked on their trigram similarity to the title or
+    the identifiers, exact prefixes first.
+    """
+    term = term.strip()
+    if len(term) < MIN_QUERY_LENGTH:
+        return []
+    if db.engine.dialect.name == 'postgresql':
+        candidates = _postgres_candidates(term)
+    else:
+        candidates = _sqlite_candidates(term, limit)
+    lowered = term.lower()
+    ranked = []
+    for kind, row_id, title, keys in candidates:
+        score = max(similarity(term, title), similarity(term, keys))
+        if any(value.lower().startswith(lowered) for value in (title, keys, *title.split(), *keys.split())):
+            score += 1
+        ranked.append((kind, row_id, title, keys, round(score, 3)))
+    ranked.sort(key=lambda result: (-result[4], result[2].lower(), result[1]))
+    return ranked[:limit]
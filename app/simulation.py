@@ -0,0 +1,212 @@
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, object_session
+from models import db, Member, Pod, SharingGroup, PodSharingGroup
+from allocation import share_energy, _accounting_rows, _metered
+import numpy as np
+import pandas as pd
+import threading
+import time
+
+# Safety net for changes made by other processes, e.g. a member import job
+INDEX_TTL = 300
+# Metered months kept by the index, the load curves are read once per month
+METERED_MONTHS = 12
+
+WATCHED_MODELS = (Member, Pod, SharingGroup, PodSharingGroup)
+
+
+class MembershipIndex:
+    """The pod <-> sharing group graph in memory, for planning without a page load per group.
+
+    ``edges`` holds one (podsID, sgID) row per membership and ``pod_groups`` the
+    groups of each pod, ``pods`` and ``groups`` the attributes the allocation
+    needs, indexed by their id. A scenario is a set
+    of edges and prices: it is turned into the memberships of the allocation by
+    two merges, never by a query.
+    """
+
+    def __init__(self, edges, pods, groups, members):
+        self.edges = edges
+        self.pods = pods
+        self.groups = groups
+        self.members = members
+        self.pod_groups = {}
+        for pod_id, group_id in zip(edges['podsID'].tolist(), edges['sgID'].tolist()):
+            self.pod_groups.setdefault(pod_id, []).append(group_id)
+        self.built = time.monotonic()
+        self._metered = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls):
+        # The graph in one query, every pod with its groups if any; the groups apart, empty ones included
+        graph = pd.read_sql(
+            select(Pod.podsID, Pod.memberID, Pod.podType, Pod.podlabel, Pod.podNumber, Pod.energyproduction,
+                   PodSharingGroup.sharingGroupID.label('sgID'), Member.firstname, Member.name)
+            .join(Member, Pod.memberID == Member.id)
+            .outerjoin(PodSharingGroup, PodSharingGroup.podID == Pod.podsID),
+            db.session.connection()
+        )
+        groups = pd.read_sql(
+            select(SharingGroup.sgID, SharingGroup.sgName, SharingGroup.sgType, SharingGroup.sgPrice),
+            db.session.connection()
+        ).set_index('sgID')
+        groups['sgPrice'] = groups['sgPrice'].astype(float).fillna(0.0)
+        edges = graph.loc[graph['sgID'].notna(), ['podsID', 'sgID']].astype(int).reset_index(drop=True)
+        pods = graph.drop_duplicates('podsID').set_index('podsID')
+        members = dict(zip(pods['memberID'], (pods['firstname'].fillna('') + ' ' + pods['name'].fillna('')).str.strip()))
+        return cls(edges, pods[['memberID', 'podType', 'podlabel', 'podNumber', 'energyproduction']], groups, members)
+
+    def metered(self, year, month):
+        """The metered energy of a month by podsID, None without load curves; cached."""
+        with self._lock:
+            if (year, month) not in self._metered:
+                if len(self._metered) >= METERED_MONTHS:
+                    self._metered.pop(next(iter(self._metered)))
+                self._metered[(year, month)] = _metered(year, month)
+            return self._metered[(year, month)]
+
+    def move(self, edges, pod_id, from_group, to_group):
+        """The edges with ``pod_id`` moved, added when ``from_group`` is None, removed when ``to_group`` is.
+
+        Raises ValueError when the move does not fit the edges.
+        """
+        if pod_id not in self.pods.index:
+            raise ValueError(f'No pod {pod_id}')
+        for group in (from_group, to_group):
+            if group is not None and group not in self.groups.index:
+                raise ValueError(f'No sharing group {group}')
+        member_of = edges['podsID'] == pod_id
+        if from_group is not None:
+            leaving = member_of & (edges['sgID'] == from_group)
+            if not leaving.any():
+                raise ValueError(f'Pod {self.pod_label(pod_id)} is not in {self.groups.at[from_group, "sgName"]}')
+            edges = edges[~leaving]
+        if to_group is not None:
+            if (member_of & (edges['sgID'] == to_group)).any():
+                raise ValueError(f'Pod {self.pod_label(pod_id)} is already in {self.groups.at[to_group, "sgName"]}')
+            edges = pd.concat([edges, pd.DataFrame({'podsID': [pod_id], 'sgID': [to_group]})], ignore_index=True)
+        return edges
+
+    def memberships(self, edges=None, prices=None):
+        """The input of the allocation for a scenario, like ``allocation.load_memberships`` for the database."""
+        edges = self.edges if edges is None else edges
+        price = self.groups['sgPrice']
+        if prices:
+            price = price.copy()
+            for group, value in prices.items():
+                price.at[group] = value
+        df = edges.merge(price, left_on='sgID', right_index=True)
+        return df.merge(self.pods[['memberID', 'podType', 'energyproduction']], left_on='podsID', right_index=True)
+
+    def pod_label(self, pod_id):
+        pod = self.pods.loc[pod_id]
+        return f'{pod.podlabel} {pod.podNumber}' if pod.podlabel else str(pod.podNumber)
+
+
+def member_amounts(memberships, metered=None):
+    """The month's amount of every member for the memberships, vectorised like the allocation itself."""
+    if memberships.empty:
+        return pd.Series(dtype=float)
+    rows = _accounting_rows(share_energy(memberships, production=metered, consumption=metered), None, None)
+    return rows.groupby('accMember')['accAmount'].sum()
+
+
+def group_amounts(memberships, metered=None):
+    """Pods and amount charged to the consumers of each sharing group."""
+    if memberships.empty:
+        return pd.DataFrame(columns=['pods', 'charged'])
+    rows = _accounting_rows(share_energy(memberships, production=metered, consumption=metered), None, None)
+    charged = rows.loc[rows['accAmount'] > 0].groupby('accSGId')['accAmount'].sum()
+    return pd.DataFrame({'pods': memberships.groupby('sgID').size(), 'charged': charged}).fillna(0.0)
+
+
+def simulate(index, moves=(), prices=None, year=None, month=None):
+    """The monthly amounts of every member now and in the scenario of ``moves`` and ``prices``.
+
+    ``moves`` are (podsID, from sgID or None, to sgID or None) tuples applied in
+    order, ``prices`` maps a sgID to its new price. Without a month the static
+    production of the pods is shared equally, as the allocation does without
+    load curves. Raises ValueError on a move that does not fit the graph.
+    """
+    edges = index.edges
+    for pod_id, from_group, to_group in moves:
+        edges = index.move(edges, pod_id, from_group, to_group)
+    metered = index.metered(year, month) if year and month else None
+    current = index.memberships()
+    scenario = index.memberships(edges, prices)
+
+    members = pd.DataFrame({
+        'before': member_amounts(current, metered),
+        'after': member_amounts(scenario, metered),
+    }).fillna(0.0).round(2)
+    members['delta'] = (members['after'] - members['before']).round(2)
+    members['name'] = members.index.map(index.members)
+    members = members.iloc[np.lexsort((members.index, -members['delta'].abs().to_numpy()))]
+
+    groups = index.groups[['sgName', 'sgType', 'sgPrice']].join(
+        group_amounts(current, metered).add_suffix('_before')).join(
+        group_amounts(scenario, metered).add_suffix('_after')).fillna(0.0)
+    groups['price_after'] = [prices.get(group, price) if prices else price
+                             for group, price in zip(groups.index, groups['sgPrice'])]
+    return members, groups
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """The process' membership index, built on first use and again once stale."""
+    global _index
+    with _index_lock:
+        if _index is None or time.monotonic() - _index.built > INDEX_TTL:
+            _index = MembershipIndex.load()
+        return _index
+
+
+def invalidate():
+    global _index
+    with _index_lock:
+        _index = None
+
+
+# Changes are collected on the session and drop the index once committed, like
+# the choices cache, so a concurrent request cannot build it from the old rows.
+def _mark(session):
+    if session is not None:
+        session.info['stale_memberships'] = True
+
+
+def mark_stale(session):
+    """Drop the index when ``session`` commits, for the Core statements that bypass the ORM."""
+    _mark(session)
+
+
+def _on_change(mapper, connection, target):
+    _mark(object_session(target))
+
+
+for _model in WATCHED_MODELS:
+    for _event in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _event, _on_change)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _on_bulk_statement(orm_execute_state):
+    # Bulk INSERT/UPDATE/DELETE statements bypass the mapper events
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.class_ in WATCHED_MODELS:
+            _mark(orm_execute_state.session)
+
+
+@event.listens_for(Session, 'after_commit')
+def _on_commit(session):
+    if session.info.pop('stale_memberships', None):
+        invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _on_rollback(session):
+    session.info.pop('stale_memberships', None)
@@ -0,0 +1,141 @@
+from sqlalchemy import select
+from models import db, Member, Pod, SharingGroup, MemberFee, MemberFeePayment, Accounting, BillingFile, BillingFileEntry
+from jobs import job_handler
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+import artifacts
+import multiprocessing
+import os
+
+# Members per query, and per task of the process pool
+STATEMENT_BATCH_SIZE = 200
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), 'templates')
+
+
+def statement_dir(billing_file_id, archive_dir=None):
+    return os.path.join(archive_dir or artifacts.ARCHIVE_DIR, 'statements', str(billing_file_id))
+
+
+def statement_path(billing_file_id, member_id, archive_dir=None):
+    return os.path.join(statement_dir(billing_file_id, archive_dir), f'{member_id}.html')
+
+
+def statements_job_key(billing_file_id):
+    return f'statements:{billing_file_id}'
+
+
+def statement_members(billing_file_id):
+    """Ids of the members a billing file bills, in the order of its primary key."""
+    return list(db.session.scalars(
+        select(BillingFileEntry.bfeMember).where(BillingFileEntry.billingFileID == billing_file_id)
+        .group_by(BillingFileEntry.bfeMember).order_by(BillingFileEntry.bfeMember)
+    ))
+
+
+def _file_info(billing_file):
+    return {'id': billing_file.bfID, 'filename': billing_file.bfFilename, 'created': billing_file.bfCreated}
+
+
+def _statements(billing_file, member_ids):
+    """The statements of a batch of members as plain dicts, from one query per table for the whole batch."""
+    statements = {member_id: {'member': None, 'lines': [], 'total': 0, 'payments': [], 'file': _file_info(billing_file)}
+                  for member_id in member_ids}
+    for row in db.session.execute(
+        select(Member.id, Member.name, Member.firstname, Member.address, Member.email)
+        .where(Member.id.in_(member_ids))
+    ):
+        statements[row.id]['member'] = row._asdict()
+    # The entry amounts are what the file bills, corrections included, by the primary key of the entries
+    for row in db.session.execute(
+        select(BillingFileEntry.bfeMember, BillingFileEntry.bfeAmount, Accounting.accID, Accounting.accYear,
+               Accounting.accMonth, Accounting.accAmount, Pod.podNumber, Pod.podlabel, SharingGroup.sgName)
+        .join(Accounting, BillingFileEntry.accID == Accounting.accID)
+        .join(Pod, Accounting.accPod == Pod.podsID)
+        .join(SharingGroup, Accounting.accSGId == SharingGroup.sgID)
+        .where(BillingFileEntry.billingFileID == billing_file.bfID, BillingFileEntry.bfeMember.in_(member_ids))
+        .order_by(BillingFileEntry.bfeMember, Accounting.accYear, Accounting.accMonth, Pod.podNumber,
+                  SharingGroup.sgName)
+    ):
+        statement = statements[row.bfeMember]
+        statement['lines'].append(row._asdict())
+        statement['total'] += row.bfeAmount or 0
+    for row in db.session.execute(
+        select(MemberFeePayment.memberID, MemberFee.mfYear, MemberFee.mfamount, MemberFeePayment.paymentStatus,
+               MemberFeePayment.paymentDue, MemberFeePayment.paymentDate)
+        .join(MemberFee, MemberFeePayment.memberFeeID == MemberFee.mfID)
+        .where(MemberFeePayment.memberID.in_(member_ids))
+        .order_by(MemberFeePayment.memberID, MemberFee.mfYear.desc())
+    ):
+        statements[row.memberID]['payments'].append(row._asdict())
+    return statements
+
+
+_environment = None
+
+
+def _template():
+    # One environment per process, pool workers included
+    global _environment
+    if _environment is None:
+        _environment = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=select_autoescape())
+    return _environment.get_template('statements/statement.html')
+
+
+def render_statements(statements, directory):
+    """Write the HTML statement of each member, returns how many. Runs in the pool workers."""
+    template = _template()
+    os.makedirs(directory, exist_ok=True)
+    for member_id, statement in statements.items():
+        path = os.path.join(directory, f'{member_id}.html')
+        with open(f'{path}.part', 'w', encoding='utf-8') as f:
+            f.write(template.render(generated=datetime.now(), **statement))
+        os.replace(f'{path}.part', path)
+    return len(statements)
+
+
+def generate_statements(billing_file, workers=None, on_progress=None, archive_dir=None):
+    """Render the statements of every member billed by ``billing_file`` in a process pool.
+
+    This process reads the rows batch by batch while the workers render the
+    batches read before; at most two batches per worker wait, so memory does not
+    grow with the number of members. Returns the number of statements.
+    """
+    member_ids = statement_members(billing_file.bfID)
+    directory = statement_dir(billing_file.bfID, archive_dir)
+    workers = workers or os.cpu_count() or 1
+    done = 0
+    # Spawned, not forked: the workers only render and must not share this process' connections and threads
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        pending = set()
+        for start in range(0, len(member_ids), STATEMENT_BATCH_SIZE):
+            batch = _statements(billing_file, member_ids[start:start + STATEMENT_BATCH_SIZE])
+            pending.add(pool.submit(render_statements, batch, directory))
+            while len(pending) >= 2 * workers:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                done += sum(future.result() for future in finished)
+                if on_progress is not None:
+                    on_progress(done, len(member_ids))
+        for future in pending:
+            done += future.result()
+    return done
+
+
+def generate_statement(billing_file, member_id, archive_dir=None):
+    """Render one member's statement in this process, for a single regeneration on demand."""
+    render_statements(_statements(billing_file, [member_id]), statement_dir(billing_file.bfID, archive_dir))
+    return statement_path(billing_file.bfID, member_id, archive_dir)
+
+
+@job_handler('statements')
+def statements_job(job, billing_file_id):
+    """Render the member statements of a billing file, running it again rewrites them."""
+    billing_file = db.session.get(BillingFile, billing_file_id)
+    if billing_file is None:
+        raise ValueError(f'No billing file {billing_file_id}')
+
+    def progress(done, total):
+        job.progress(int(done * 100 / total), f'{done} / {total} statements')
+
+    count = generate_statements(billing_file, on_progress=progress)
+    return {'billing_file_id': billing_file_id, 'statements': count}
@@ -0,0 +1,165 @@
+from sqlalchemy import event, delete, insert, select, func, case, tuple_, inspect
+from sqlalchemy.orm import Session
+from models import db, Member, SharingGroup, Accounting, AccountingSummary
+from jobs import job_handler
+
+# Summary rows are recomputed per (year, month, member, sharing group) key
+# rather than adjusted by deltas, so they cannot drift from the accounting rows.
+REFRESH_BATCH_SIZE = 500
+FULL_REBUILD = 'all'
+
+KEY_COLUMNS = (Accounting.accYear, Accounting.accMonth, Accounting.accMember, Accounting.accSGId)
+SUMMARY_KEY = (AccountingSummary.asYear, AccountingSummary.asMonth, AccountingSummary.asMember, AccountingSummary.asSGId)
+
+
+def _aggregate():
+    billed = Accounting.accBillingDate.isnot(None)
+    return select(
+        *KEY_COLUMNS, billed, func.count(Accounting.accID), func.coalesce(func.sum(Accounting.accAmount), 0)
+    ).group_by(*KEY_COLUMNS, billed)
+
+
+def _insert_from(query):
+    return insert(AccountingSummary).from_select(
+        [*[c.key for c in SUMMARY_KEY], 'asBilled', 'asRows', 'asAmount'], query
+    )
+
+
+def rebuild_summary(connection=None):
+    """Recompute the whole summary table from the accounting rows, in the current transaction."""
+    connection = connection or db.session.connection()
+    connection.execute(delete(AccountingSummary))
+    connection.execute(_insert_from(_aggregate()))
+
+
+@job_handler('rebuild_summary')
+def rebuild_summary_job(job):
+    rebuild_summary()
+    db.session.commit()
+    return {'rows': db.session.scalar(select(func.count()).select_from(AccountingSummary))}
+
+
+def refresh_summary(keys, connection=None):
+    """Recompute the summary rows of the given (year, month, member, sharing group) keys."""
+    connection = connection or db.session.connection()
+    keys = list(keys)
+    for start in range(0, len(keys), REFRESH_BATCH_SIZE):
+        batch = keys[start:start + REFRESH_BATCH_SIZE]
+        connection.execute(delete(AccountingSummary).where(tuple_(*SUMMARY_KEY).in_(batch)))
+        connection.execute(_insert_from(_aggregate().where(tuple_(*KEY_COLUMNS).in_(batch))))
+
+
+def mark_stale(session, keys):
+    """Have the summary rows of ``keys`` refreshed when ``session`` commits.
+
+    Needed for the Core statements that bypass the ORM, such as the bulk
+    allocation insert. Passing FULL_REBUILD rebuilds the whole table instead.
+    """
+    stale = session.info.setdefault('stale_summary', set())
+    if keys == FULL_REBUILD:
+        stale.add(FULL_REBUILD)
+    else:
+        stale.update(tuple(key) for key in keys)
+
+
+def mark_stale_ids(session, accids):
+    """Mark the keys of the given accounting rows, before a bulk change to them."""
+    accids = list(accids)
+    keys = set()
+    for start in range(0, len(accids), REFRESH_BATCH_SIZE):
+        keys.update(session.execute(
+            select(*KEY_COLUMNS).distinct().where(Accounting.accID.in_(accids[start:start + REFRESH_BATCH_SIZE]))
+        ).tuples())
+    mark_stale(session, keys)
+
+
+def _keys_of(target):
+    # The key before the change and after it, when an update moved the row
+    state = inspect(target)
+    new = tuple(getattr(target, c.key) for c in KEY_COLUMNS)
+    old = []
+    for column in KEY_COLUMNS:
+        history = state.attrs[column.key].history
+        old.append(history.deleted[0] if history.deleted else getattr(target, column.key))
+    return {new, tuple(old)}
+
+
+def _on_change(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        mark_stale(session, _keys_of(target))
+
+
+for _event in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Accounting, _event, _on_change)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _on_bulk_statement(orm_execute_state):
+    # ORM bulk statements do not say which rows they touched
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.class_ is Accounting:
+            mark_stale(orm_execute_state.session, FULL_REBUILD)
+
+
+@event.listens_for(Session, 'before_commit')
+def _on_commit(session):
+    # Pending objects are only flushed after this hook, flush them first to see their keys
+    session.flush()
+    stale = session.info.pop('stale_summary', None)
+    if not stale:
+        return
+    if FULL_REBUILD in stale:
+        rebuild_summary(session.connection())
+    else:
+        refresh_summary(stale, session.connection())
+
+
+@event.listens_for(Session, 'after_rollback')
+def _on_rollback(session):
+    session.info.pop('stale_summary', None)
+
+
+def _filtered(query, year=None, month=None):
+    if year:
+        query = query.where(AccountingSummary.asYear == year)
+    if month:
+        query = query.where(AccountingSummary.asMonth == month)
+    return query
+
+
+def _totals():
+    return (
+        func.sum(AccountingSummary.asRows).label('rows'),
+        func.sum(AccountingSummary.asAmount).label('total'),
+        func.sum(case((AccountingSummary.asBilled, AccountingSummary.asAmount), else_=0)).label('billed'),
+    )
+
+
+def totals_by_month(year=None):
+    """Rows, amount and billed amount per month, newest first."""
+    query = select(AccountingSummary.asYear.label('year'), AccountingSummary.asMonth.label('month'), *_totals()) \
+        .group_by(AccountingSummary.asYear, AccountingSummary.asMonth) \
+        .order_by(AccountingSummary.asYear.desc(), AccountingSummary.asMonth.desc())
+    return db.session.execute(_filtered(query, year)).all()
+
+
+def totals_by_sharing_group(year=None, month=None):
+    query = select(SharingGroup.sgID, SharingGroup.sgName, SharingGroup.sgType, *_totals()) \
+        .join(AccountingSummary, AccountingSummary.asSGId == SharingGroup.sgID) \
+        .group_by(SharingGroup.sgID, SharingGroup.sgName, SharingGroup.sgType) \
+        .order_by(SharingGroup.sgName)
+    return db.session.execute(_filtered(query, year, month)).all()
+
+
+def totals_by_member_query(year=None, month=None):
+    """Per-member totals as a query to paginate on the member columns."""
+    query = db.session.query(Member.id, Member.name, Member.firstname, *_totals()) \
+        .join(AccountingSummary, AccountingSummary.asMember == Member.id) \
+        .group_by(Member.id, Member.name, Member.firstname)
+    if year:
+        query = query.filter(AccountingSummary.asYear == year)
+    if month:
+        query = query.filter(AccountingSummary.asMonth == month)
+    return query
@@ -0,0 +1,224 @@
+from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, Response, stream_with_context, abort
+from sqlalchemy import select, func
+from models import db, Member, Pod, SharingGroup, Accounting, BillingFile, BillingFileEntry, Job
+from forms import AccountingForm, AllocationForm
+from artifacts import archive_path, iter_billing_file
+from pagination import paginate_request
+from choices import get_choices
+from queries import accounting_query
+from summary import totals_by_month, totals_by_sharing_group, totals_by_member_query
+from jobs import submit
+from billing import is_invoiced
+from statements import statement_path, generate_statement, statements_job_key
+import os
+from pagecache import cached_page
+
+bp = Blueprint('accounting', __name__)
+
+ACCOUNTING_SORTS = {
+    'id': (),
+    'period': (Accounting.accYear, Accounting.accMonth),
+    'amount': (Accounting.accAmount,),
+    'billing_date': (Accounting.accBillingDate,)
+}
+
+def filter_accounting(query):
+    # Year, month, member and sharing group filters shared by the accounting lists
+    for arg, column in (('year', Accounting.accYear), ('month', Accounting.accMonth),
+                        ('member', Accounting.accMember), ('sharing_group', Accounting.accSGId)):
+        value = request.args.get(arg, type=int)
+        if value:
+            query = query.filter(column == value)
+    return query
+
+@bp.route('/accounting')
+@cached_page(Accounting, Member, Pod, SharingGroup)
+def list_accounting():
+    query = filter_accounting(accounting_query())
+    accounting_records = paginate_request(query, ACCOUNTING_SORTS, default_sort='id', primary_key=Accounting.accID)
+
+    return render_template('accounting/list.html', accounting_records=accounting_records,
+                           sharing_groups=get_choices('sharing_groups'))
+
+@bp.route('/accounting/new', methods=['GET', 'POST'])
+def create_accounting():
+    form = AccountingForm()
+    form.accMember.load_choices()
+    form.accPod.load_choices()
+    form.accSGId.load_choices()
+    if form.validate_on_submit():
+        accounting = Accounting(
+            accYear=form.accYear.data,
+            accMonth=form.accMonth.data,
+            accMember=form.accMember.data,
+            accPod=form.accPod.data,
+            accSGId=form.accSGId.data,
+            accAmount=form.accAmount.data,
+            accBillingDate=form.accBillingDate.data
+        )
+        db.session.add(accounting)
+        db.session.commit()
+        flash('Accounting record created successfully!', 'success')
+        return redirect(url_for('accounting.list_accounting'))
+    return render_template('accounting/form.html', form=form, title='Create Accounting Record')
+
+@bp.route('/accounting/<int:id>')
+@cached_page(Member, Pod, SharingGroup, entity=(Accounting, 'id'))
+def detail_accounting(id):
+    accounting = accounting_query().filter(Accounting.accID == id).first_or_404()
+    return render_template('accounting/detail.html', accounting=accounting)
+    
+
+@bp.route('/accounting/<int:id>/edit', methods=['GET', 'POST'])
+def update_accounting(id):
+    accounting = Accounting.query.get_or_404(id)
+    form = AccountingForm(obj=accounting)
+    form.accMember.load_choices()
+    form.accPod.load_choices()
+    form.accSGId.load_choices()
+
+    if form.validate_on_submit():
+        accounting.accYear = form.accYear.data
+        accounting.accMonth = form.accMonth.data
+        accounting.accMember = form.accMember.data
+        accounting.accPod = form.accPod.data
+        accounting.accSGId = form.accSGId.data
+        accounting.accAmount = form.accAmount.data
+        if not is_invoiced(accounting):
+            # An invoiced record keeps its first billing date, its changes are billed as adjustments
+            accounting.accBillingDate = form.accBillingDate.data
+        db.session.commit()
+        flash('Accounting record updated successfully!', 'success')
+        return redirect(url_for('accounting.detail_accounting', id=accounting.accID))
+    return render_template('accounting/form.html', form=form, title='Edit Accounting Record')
+
+@bp.route('/accounting/<int:id>/delete', methods=['POST'])
+def delete_accounting(id):
+    accounting = Accounting.query.get_or_404(id)
+    if is_invoiced(accounting):
+        flash('This record has been invoiced: set its amount to 0 to credit it on the next billing run.', 'danger')
+        return redirect(url_for('accounting.detail_accounting', id=id))
+    db.session.delete(accounting)
+    db.session.commit()
+    flash('Accounting record deleted successfully!', 'success')
+    return redirect(url_for('accounting.list_accounting'))
+
+@bp.route('/accounting/unbilled')
+@cached_page(Accounting, Member, Pod, SharingGroup)
+def list_accounting_unbilled():
+    query = filter_accounting(accounting_query().filter(Accounting.accBillingDate.is_(None)))
+    accounting_records = paginate_request(query, ACCOUNTING_SORTS, default_sort='id', primary_key=Accounting.accID)
+    corrected = db.session.scalar(
+        select(func.count(Accounting.accID)).where(Accounting.accBilledVersion < Accounting.accVersion)
+    )
+    return render_template('accounting/list_unbilled.html', accounting_records=accounting_records,
+                           sharing_groups=get_choices('sharing_groups'), corrected=corrected)
+
+@bp.route('/accounting/summary')
+def accounting_summary():
+    # Read from the accountingSummary table: the cost follows the number of groups, not of records
+    year = request.args.get('year', type=int)
+    month = request.args.get('month', type=int)
+    members = paginate_request(totals_by_member_query(year, month), {
+        'id': (),
+        'name': (Member.name, Member.firstname)
+    }, default_sort='name', primary_key=Member.id)
+    return render_template('accounting/summary.html',
+                           months=totals_by_month(year),
+                           sharing_groups=totals_by_sharing_group(year, month),
+                           members=members)
+
+@bp.route('/accounting/allocate', methods=['GET', 'POST'])
+def allocate_accounting():
+    form = AllocationForm()
+    if form.validate_on_submit():
+        year, month = form.accYear.data, form.accMonth.data
+        job = submit('allocation', {'year': year, 'month': month, 'replace_unbilled': form.replaceUnbilled.data},
+                     key=f'allocation:{year}-{month}')
+        return redirect(url_for('accounting.allocate_accounting', job=job.jobID))
+    job = db.session.get(Job, request.args['job']) if request.args.get('job') else None
+    summary = job.jobResult if job is not None and job.jobStatus == 'done' else None
+    return render_template('accounting/allocate.html', form=form, job=job, summary=summary,
+                           title='Allocate Energy Sharing')
+
+@bp.route('/accounting/createbilling', methods=['GET', 'POST'])
+def create_billing_file():
+    # The billing run is a background job, the browser follows its progress
+    params = {'adjustments_only': True} if request.values.get('adjustments') == '1' else None
+    job = submit('billing', params, key='billing')
+    return redirect(url_for('accounting.billing_run', run_id=job.jobID))
+
+@bp.route('/accounting/billing/<run_id>')
+def billing_run(run_id):
+    job = Job.query.filter_by(jobID=run_id, jobType='billing').first_or_404()
+    result = job.jobResult or {}
+    return render_template('accounting/create_billing.html',
+                         job=job,
+                         billing_data=result.get('billing_data', []),
+                         grandtotal=float(result.get('grandtotal', 0)),
+                         filename=result.get('filename'),
+                         file_id=result.get('file_id'))
+
+@bp.route('/download/<path:filename>')
+def download_file(filename):
+    billing_file = BillingFile.query.filter_by(bfFilename=filename).first_or_404()
+    # Byte ranges always count in the CSV itself, so they are served from the identity representation
+    if 'gzip' in request.accept_encodings and request.range is None:
+        # The archive is already gzip-compressed: serve it as is. Browsers decode it and save the CSV,
+        # Content-Length is the length of the encoded body as HTTP defines it
+        response = send_file(archive_path(billing_file.bfHash), mimetype='text/csv',
+                             as_attachment=True, download_name=filename,
+                             etag=f'{billing_file.bfHash}-gz', conditional=True)
+        response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Accept-Ranges'] = 'none'
+        response.vary.add('Accept-Encoding')
+        return response
+    response = Response(stream_with_context(iter_billing_file(billing_file)), mimetype='text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Content-Length'] = billing_file.bfSize
+    response.set_etag(billing_file.bfHash)
+    response.vary.add('Accept-Encoding')
+    # A range is cut from the decompressed stream, skipping up to its start
+    return response.make_conditional(request, accept_ranges=True, complete_length=billing_file.bfSize)
+
+@bp.route('/accounting/file_list', methods=['GET'])
+def file_list():
+    """Display the archived billing files, newest first"""
+    files = paginate_request(BillingFile.query, {
+        'created': (BillingFile.bfCreated,),
+        'filename': (BillingFile.bfFilename,),
+        'total': (BillingFile.bfTotal,)
+    }, default_sort='created', primary_key=BillingFile.bfID, default_order='desc')
+    return render_template('accounting/file_list.html', files=files)
+
+@bp.route('/accounting/files/<int:file_id>/statements', methods=['GET', 'POST'])
+def billing_file_statements(file_id):
+    """The members billed by a file, with their statements; POST renders them all again in the background."""
+    billing_file = db.get_or_404(BillingFile, file_id)
+    if request.method == 'POST':
+        submit('statements', {'billing_file_id': file_id}, key=statements_job_key(file_id))
+        return redirect(url_for('accounting.billing_file_statements', file_id=file_id))
+    job = Job.query.filter_by(jobType='statements', jobKey=statements_job_key(file_id)) \
+        .order_by(Job.jobCreated.desc()).first()
+    billed = select(BillingFileEntry.bfeMember).where(BillingFileEntry.billingFileID == file_id)
+    members = paginate_request(Member.query.filter(Member.id.in_(billed)), {
+        'id': (),
+        'name': (Member.name, Member.firstname)
+    }, default_sort='name', primary_key=Member.id)
+    return render_template('accounting/statements.html', billing_file=billing_file, job=job, members=members)
+
+@bp.route('/accounting/files/<int:file_id>/statements/<int:member_id>', methods=['GET', 'POST'])
+def member_statement(file_id, member_id):
+    """A member's statement, rendered on the first request when missing and again on POST."""
+    billing_file = db.get_or_404(BillingFile, file_id)
+    billed = db.session.scalar(select(BillingFileEntry.accID).where(
+        BillingFileEntry.billingFileID == file_id, BillingFileEntry.bfeMember == member_id).limit(1))
+    if billed is None:
+        abort(404)
+    path = statement_path(file_id, member_id)
+    if request.method == 'POST' or not os.path.exists(path):
+        generate_statement(billing_file, member_id)
+    if request.method == 'POST':
+        flash('Statement generated again.', 'success')
+        return redirect(url_for('accounting.billing_file_statements', file_id=file_id))
+    return send_file(path, mimetype='text/html', max_age=0)
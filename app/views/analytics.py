@@ -0,0 +1,49 @@
+from flask import Blueprint, render_template, send_file, abort
+from models import db, Member, SharingGroup, EnergyFlow, Accounting
+from analytics import (
+    sharing_group_series, member_series, sharing_group_totals, chart_payload, chart_file, chart_path
+)
+from pagecache import cached_page
+import os
+import re
+
+bp = Blueprint('analytics', __name__)
+
+CHART_NAME = re.compile(r'(sharing_group|member)-(\d+)-([0-9a-f]{16})')
+
+@bp.route('/analytics')
+@cached_page(SharingGroup, EnergyFlow)
+def analytics_index():
+    groups = SharingGroup.query.order_by(SharingGroup.sgName).all()
+    return render_template('analytics/index.html', groups=groups, totals=sharing_group_totals())
+
+@bp.route('/analytics/sharing_groups/<int:id>')
+@cached_page(EnergyFlow, Accounting, entity=(SharingGroup, 'id'))
+def sharing_group_analytics(id):
+    # Served from the energy flows and the accounting summary, the charts from their JSON file
+    group = db.get_or_404(SharingGroup, id)
+    series = sharing_group_series(id)
+    digest = chart_file('sharing_group', id, chart_payload(series, group.sgName))
+    return render_template('analytics/dashboard.html', title=f'Sharing group {group.sgName}', series=series,
+                           rate='self_consumption', chart=f'sharing_group-{id}-{digest}')
+
+@bp.route('/analytics/members/<int:id>')
+@cached_page(EnergyFlow, Accounting, entity=(Member, 'id'))
+def member_analytics(id):
+    member = db.get_or_404(Member, id)
+    series = member_series(id)
+    name = f'{member.firstname} {member.name}'
+    digest = chart_file('member', id, chart_payload(series, name, rate='coverage'))
+    return render_template('analytics/dashboard.html', title=f'Member {name}', series=series,
+                           rate='coverage', chart=f'member-{id}-{digest}')
+
+@bp.route('/analytics/charts/<name>.json')
+def chart(name):
+    # The name holds the digest of the content: a changed chart gets a new URL, this one never changes
+    match = CHART_NAME.fullmatch(name)
+    if match is None:
+        abort(404)
+    path = chart_path(match.group(1), match.group(2), match.group(3))
+    if not os.path.exists(path):
+        abort(404)
+    return send_file(path, mimetype='application/json', max_age=365 * 24 * 3600, etag=match.group(3))
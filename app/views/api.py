@@ -0,0 +1,184 @@
+from flask import Blueprint, current_app, request, jsonify, abort
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from models import db
+from pagination import paginate_request, page_url
+from resources import RESOURCES, MAX_BULK_ROWS, ValidationError, bulk_upsert
+from billing import is_invoiced
+import hmac
+
+bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# Query arguments that are not field filters
+RESERVED_ARGS = {'fields', 'sort', 'order', 'after', 'before', 'per_page'}
+
+
+def _error(status, message, errors=None):
+    body = {'error': message}
+    if errors:
+        body['errors'] = errors
+    response = jsonify(body)
+    response.status_code = status
+    return response
+
+
+@bp.before_request
+def check_token():
+    # Open like the HTML pages unless API_TOKEN is configured
+    token = current_app.config.get('API_TOKEN')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return _error(401, 'Missing or invalid API token')
+
+
+@bp.errorhandler(404)
+def not_found(e):
+    return _error(404, 'Not found')
+
+
+def _resource(name):
+    resource = RESOURCES.get(name)
+    if resource is None:
+        abort(404)
+    return resource
+
+
+def _fields(resource):
+    fields = request.args.get('fields')
+    if not fields:
+        return resource.fields
+    fields = [name.strip() for name in fields.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in resource.columns]
+    if unknown:
+        raise ValidationError([{'field': name, 'error': 'is not a field'} for name in unknown])
+    return fields
+
+
+def _json_body():
+    data = request.get_json(silent=True)
+    if data is None:
+        raise ValidationError([{'field': None, 'error': 'the body must be JSON'}])
+    return data
+
+
+@bp.errorhandler(ValidationError)
+def invalid(e):
+    return _error(400, 'Invalid request', e.errors)
+
+
+@bp.route('/<name>')
+def list_resource(name):
+    resource = _resource(name)
+    fields = _fields(resource)
+    pk = resource.primary_key
+    sortable = {field: (resource.column(field),) for field in resource.fields if field != pk.key}
+    sortable[pk.key] = ()
+    # Only the selected columns are read, plus those the cursor needs
+    sort = request.args.get('sort', pk.key)
+    needed = set(fields) | {pk.key} | ({sort} if sort in sortable else set())
+    query = db.session.query(*[resource.column(field) for field in resource.fields if field in needed])
+    errors = []
+    for arg, value in request.args.items():
+        if arg in RESERVED_ARGS:
+            continue
+        if arg not in resource.columns:
+            errors.append({'field': arg, 'error': 'is not a field'})
+            continue
+        try:
+            parsed = resource.parse(arg, value) if value != '' else None
+        except (ValueError, TypeError) as e:
+            errors.append({'field': arg, 'error': str(e)})
+            continue
+        column = resource.column(arg)
+        query = query.filter(column.is_(None) if parsed is None else column == parsed)
+    if errors:
+        raise ValidationError(errors)
+    page = paginate_request(query, sortable, default_sort=pk.key, primary_key=pk)
+    return jsonify({
+        'items': [resource.dump(row, fields) for row in page],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+        'next': page_url(after=page.next_cursor) if page.has_next else None,
+        'prev': page_url(before=page.prev_cursor) if page.has_prev else None,
+    })
+
+
+@bp.route('/<name>/<int:id>')
+def detail_resource(name, id):
+    resource = _resource(name)
+    fields = _fields(resource)
+    row = db.session.query(*[resource.column(field) for field in fields]) \
+        .filter(resource.primary_key == id).first()
+    if row is None:
+        abort(404)
+    return jsonify(resource.dump(row, fields))
+
+
+def _write(resource, rows):
+    try:
+        ids = bulk_upsert(resource, rows)
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        return None, _error(409, 'Conflicts with existing data, nothing was written', [{'error': str(e.orig)}])
+    except Exception:
+        db.session.rollback()
+        raise
+    return ids, None
+
+
+@bp.route('/<name>', methods=['POST'])
+def create_resource(name):
+    resource = _resource(name)
+    data = _json_body()
+    if not isinstance(data, dict):
+        raise ValidationError([{'field': None, 'error': 'must be an object, use /bulk for lists'}])
+    ids, error = _write(resource, [data])
+    return error or (jsonify({'id': ids[0]}), 201 if resource.primary_key.key not in data else 200)
+
+
+@bp.route('/<name>/bulk', methods=['POST'])
+def bulk_resource(name):
+    """Create or update up to MAX_BULK_ROWS rows in one transaction: all of them or none."""
+    resource = _resource(name)
+    data = _json_body()
+    if isinstance(data, dict):
+        data = data.get('rows')
+    if not isinstance(data, list):
+        raise ValidationError([{'field': None, 'error': 'must be a list of objects, or {"rows": [...]}'}])
+    if len(data) > MAX_BULK_ROWS:
+        return _error(413, f'At most {MAX_BULK_ROWS} rows per call')
+    ids, error = _write(resource, data)
+    return error or jsonify({'rows': len(ids), 'ids': ids})
+
+
+@bp.route('/<name>/<int:id>', methods=['PATCH', 'PUT'])
+def update_resource(name, id):
+    resource = _resource(name)
+    data = _json_body()
+    if not isinstance(data, dict):
+        raise ValidationError([{'field': None, 'error': 'must be an object'}])
+    pk = resource.primary_key
+    if data.get(pk.key, id) != id:
+        raise ValidationError([{'field': pk.key, 'error': 'does not match the URL'}])
+    if db.session.scalar(select(pk).where(pk == id)) is None:
+        abort(404)
+    ids, error = _write(resource, [dict(data, **{pk.key: id})])
+    if error:
+        return error
+    return detail_resource(name, id)
+
+
+@bp.route('/<name>/<int:id>', methods=['DELETE'])
+def delete_resource(name, id):
+    # Through the ORM, so the summary and choices caches follow
+    resource = _resource(name)
+    row = db.get_or_404(resource.model, id)
+    if resource.keep_billed and is_invoiced(row):
+        return _error(409, 'Invoiced, nothing was deleted: set the amount to 0 to credit it on the next billing run')
+    db.session.delete(row)
+    try:
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        return _error(409, 'Still referenced, nothing was deleted', [{'error': str(e.orig)}])
+    return '', 204
@@ -0,0 +1,20 @@
+from flask import Blueprint, request, abort, Response, stream_with_context
+from exports import EXPORTS, FORMATS, available_formats, stream_export
+from datetime import datetime
+
+bp = Blueprint('exports', __name__)
+
+@bp.route('/export/<name>.<fmt>')
+def export(name, fmt):
+    # Streamed from the cursor as it is read: no Content-Length, memory stays flat whatever the size
+    if name not in EXPORTS or fmt not in available_formats():
+        abort(404)
+    try:
+        chunks = stream_export(name, fmt, request.args)
+    except ValueError:
+        abort(400)
+    extension, mimetype = FORMATS[fmt]
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    filename = f"{name}-{datetime.now().strftime('%Y-%m-%d-%H-%M-%S')}.{extension}"
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
@@ -0,0 +1,220 @@
+from flask import Blueprint, render_template, request, redirect, url_for, flash
+from models import db, MemberFee, MemberFeePayment, Job
+from forms import MemberFeeForm, MemberFeePaymentForm, OverduePaymentsForm, PaymentStatusForm, BankReconciliationForm
+from pagination import paginate_request
+from choices import get_choices
+from queries import member_fee_payments_query
+from payments import (
+    generate_fee_payments, mark_overdue, transition_payments, payment_reference, payment_totals,
+    collection_report, STATUS_FILTERS
+)
+from artifacts import save_upload
+from jobs import submit
+from pagecache import cached_page
+
+bp = Blueprint('fees', __name__)
+
+@bp.route('/member_fees')
+@cached_page(MemberFee, MemberFeePayment)
+def list_member_fees():
+    # Every fee with its collection, counted in the database in one statement
+    member_fees = collection_report()
+    form = MemberFeeForm()
+    return render_template('member_fees/list.html', member_fees=member_fees, form=form)
+
+@bp.route('/member_fees/new', methods=['GET', 'POST'])
+def create_member_fee():
+    form = MemberFeeForm()
+    if form.validate_on_submit():
+        member_fee = MemberFee(
+            mfamount=form.mfamount.data,
+            mfYear=form.mfYear.data
+        )
+        db.session.add(member_fee)
+        created = 0
+        if form.generatePayments.data:
+            db.session.flush()
+            created = generate_fee_payments(member_fee.mfID)
+        db.session.commit()
+        flash(f'Member Fee created successfully, {created} pending payments added!', 'success')
+        return redirect(url_for('fees.list_member_fees'))
+    return render_template('member_fees/form.html', form=form, title='Create Member Fee', new=True)
+
+@bp.route('/member_fees/<int:id>/generate_payments', methods=['POST'])
+def generate_member_fee_payments(id):
+    member_fee = MemberFee.query.get_or_404(id)
+    created = generate_fee_payments(member_fee.mfID)
+    db.session.commit()
+    flash(f'{created} pending payments added for the members without one.', 'success')
+    return redirect(url_for('fees.detail_member_fee', id=member_fee.mfID))
+
+@bp.route('/member_fees/<int:id>')
+def detail_member_fee(id):
+    member_fee = MemberFee.query.get_or_404(id)
+    # The totals come from a GROUP BY, only one page of the chosen status is loaded
+    totals = payment_totals(id)
+    status = request.args.get('status', 'open')
+    if status not in STATUS_FILTERS:
+        status = 'open'
+    query = member_fee_payments_query().filter(
+        MemberFeePayment.memberFeeID == id, MemberFeePayment.paymentStatus.in_(STATUS_FILTERS[status])
+    )
+    payments = paginate_request(query, {
+        'id': (),
+        'date': (MemberFeePayment.paymentDate,),
+        'due': (MemberFeePayment.paymentDue,)
+    }, default_sort='id', primary_key=MemberFeePayment.mfpID)
+
+    return render_template('member_fees/detail.html', 
+                         member_fee=member_fee, 
+                         totals=totals,
+                         status=status,
+                         payments=payments,
+                         overdue_form=OverduePaymentsForm())
+@bp.route('/member_fees/<int:id>/edit', methods=['GET', 'POST'])
+def update_member_fee(id):
+    member_fee = MemberFee.query.get_or_404(id)
+    form = MemberFeeForm(obj=member_fee)
+    if form.validate_on_submit():
+        member_fee.mfamount = form.mfamount.data
+        member_fee.mfYear = form.mfYear.data
+        db.session.commit()
+        flash('Member Fee updated successfully!', 'success')
+        return redirect(url_for('fees.detail_member_fee', id=member_fee.mfID))
+    return render_template('member_fees/form.html', form=form, title='Edit Member Fee')
+
+@bp.route('/member_fees/<int:id>/delete', methods=['POST'])
+def delete_member_fee(id):
+    member_fee = MemberFee.query.get_or_404(id)
+    db.session.delete(member_fee)
+    db.session.commit()
+    flash('Member Fee deleted successfully!', 'success')
+    return redirect(url_for('fees.list_member_fees'))
+
+# Routes for Member Fee Payments
+@bp.route('/member_fee_payments')
+def list_member_fee_payments():
+    query = member_fee_payments_query()
+    status = request.args.get('status')
+    if status:
+        query = query.filter(MemberFeePayment.paymentStatus == status)
+    member_fee_id = request.args.get('member_fee', type=int)
+    if member_fee_id:
+        query = query.filter(MemberFeePayment.memberFeeID == member_fee_id)
+    member_id = request.args.get('member', type=int)
+    if member_id:
+        query = query.filter(MemberFeePayment.memberID == member_id)
+    member_fee_payments = paginate_request(query, {
+        'id': (),
+        'date': (MemberFeePayment.paymentDate,),
+        'status': (MemberFeePayment.paymentStatus,)
+    }, default_sort='id', primary_key=MemberFeePayment.mfpID)
+    return render_template('member_fee_payments/list.html', member_fee_payments=member_fee_payments,
+                           member_fees=get_choices('member_fees'), overdue_form=OverduePaymentsForm(),
+                           status_form=PaymentStatusForm())
+
+@bp.route('/member_fee_payments/mark_overdue', methods=['POST'])
+def mark_overdue_member_fee_payments():
+    form = OverduePaymentsForm()
+    member_fee_id = request.args.get('member_fee', type=int)
+    if form.validate_on_submit():
+        changed = mark_overdue(form.days.data, member_fee_id=member_fee_id)
+        db.session.commit()
+        flash(f'{changed} pending payments marked overdue.', 'success')
+    else:
+        flash(form.errors)
+    if member_fee_id:
+        return redirect(url_for('fees.detail_member_fee', id=member_fee_id))
+    return redirect(url_for('fees.list_member_fee_payments'))
+
+@bp.route('/member_fee_payments/status', methods=['POST'])
+def update_member_fee_payments_status():
+    form = PaymentStatusForm()
+    payment_ids = request.form.getlist('payment', type=int)
+    if form.validate_on_submit() and payment_ids:
+        changed = transition_payments(payment_ids, form.status.data)
+        db.session.commit()
+        flash(f'{changed} payments marked {form.status.data}.', 'success')
+    elif not payment_ids:
+        flash('No payment selected.')
+    else:
+        flash(form.errors)
+    return redirect(url_for('fees.list_member_fee_payments', **request.args))
+
+@bp.route('/member_fee_payments/reconcile', methods=['GET', 'POST'])
+def reconcile_member_fee_payments():
+    form = BankReconciliationForm()
+    if form.validate_on_submit():
+        job = submit('reconcile_payments', {
+            'path': save_upload(form.file.data),
+            'dry_run': form.dryRun.data
+        })
+        return redirect(url_for('fees.reconcile_member_fee_payments', job=job.jobID))
+    job = db.session.get(Job, request.args['job']) if request.args.get('job') else None
+    report = job.jobResult if job is not None and job.jobStatus == 'done' else None
+    return render_template('member_fee_payments/reconcile.html', form=form, job=job, report=report,
+                           title='Reconcile Bank Payments')
+
+@bp.route('/member_fee_payments/new', methods=['GET', 'POST'])
+def create_member_fee_payment():
+    form = MemberFeePaymentForm()
+    form.memberID.load_choices()
+    form.memberFeeID.load_choices()
+    
+    if form.validate_on_submit():
+        member_fee_payment = MemberFeePayment(
+            memberID=form.memberID.data,
+            memberFeeID=form.memberFeeID.data,
+            paymentDate=form.paymentDate.data,
+            paymentStatus=form.paymentStatus.data,
+            paymentDue=form.paymentDue.data
+        )
+        db.session.add(member_fee_payment)
+        db.session.commit()
+        flash('Member Fee Payment created successfully!', 'success')
+        return redirect(url_for('fees.list_member_fee_payments'))
+    if request.method == 'POST' and not form.validate_on_submit():
+        flash("Validation failed with error code :")
+        flash(form.errors)
+
+    return render_template('member_fee_payments/form.html', form=form, title='Create Member Fee Payment')
+
+@bp.route('/member_fee_payments/<int:id>')
+def detail_member_fee_payment(id):
+    # The related Member and MemberFee come with the payment in one query
+    member_fee_payment = member_fee_payments_query().get_or_404(id)
+    member = member_fee_payment.member
+    member_fee = member_fee_payment.member_fee
+
+    return render_template(
+        'member_fee_payments/detail.html',
+        member_fee_payment=member_fee_payment,
+        member=member,
+        member_fee=member_fee,
+        reference=payment_reference(member_fee.mfYear, member_fee_payment.mfpID)
+    )
+
+@bp.route('/member_fee_payments/<int:id>/edit', methods=['GET', 'POST'])
+def update_member_fee_payment(id):
+    member_fee_payment = MemberFeePayment.query.get_or_404(id)
+    form = MemberFeePaymentForm(obj=member_fee_payment)
+    form.memberID.load_choices()
+    form.memberFeeID.load_choices()
+    if form.validate_on_submit():
+        member_fee_payment.memberID = form.memberID.data
+        member_fee_payment.memberFeeID = form.memberFeeID.data
+        member_fee_payment.paymentDate = form.paymentDate.data
+        member_fee_payment.paymentStatus = form.paymentStatus.data
+        member_fee_payment.paymentDue = form.paymentDue.data or member_fee_payment.paymentDue
+        db.session.commit()
+        flash('Member Fee Payment updated successfully!', 'success')
+        return redirect(url_for('fees.detail_member_fee_payment', id=member_fee_payment.mfpID))
+    return render_template('member_fee_payments/form.html', form=form, title='Edit Member Fee Payment')
+
+@bp.route('/member_fee_payments/<int:id>/delete', methods=['POST'])
+def delete_member_fee_payment(id):
+    member_fee_payment = MemberFeePayment.query.get_or_404(id)
+    db.session.delete(member_fee_payment)
+    db.session.commit()
+    flash('Member Fee Payment deleted successfully!', 'success')
+    return redirect(url_for('fees.list_member_fee_payments'))
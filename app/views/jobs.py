@@ -0,0 +1,39 @@
+from flask import Blueprint, render_template, request, jsonify
+from models import db, Job
+from pagination import paginate_request
+
+bp = Blueprint('jobs', __name__)
+
+@bp.route('/jobs')
+def list_jobs():
+    query = Job.query
+    status = request.args.get('status')
+    if status:
+        query = query.filter(Job.jobStatus == status)
+    jobs = paginate_request(query, {
+        'created': (Job.jobCreated,),
+        'type': (Job.jobType, Job.jobCreated)
+    }, default_sort='created', primary_key=Job.jobID, default_order='desc')
+    return render_template('jobs/list.html', jobs=jobs)
+
+@bp.route('/jobs/<job_id>')
+def detail_job(job_id):
+    job = db.get_or_404(Job, job_id)
+    return render_template('jobs/detail.html', job=job)
+
+@bp.route('/jobs/<job_id>/status')
+def job_status(job_id):
+    job = db.get_or_404(Job, job_id)
+    return jsonify({
+        'id': job.jobID,
+        'type': job.jobType,
+        'status': job.jobStatus,
+        'progress': job.jobProgress,
+        'message': job.jobMessage,
+        'attempts': job.jobAttempts,
+        'error': job.jobError,
+        'created': job.jobCreated.isoformat() if job.jobCreated else None,
+        'finished': job.jobFinished.isoformat() if job.jobFinished else None,
+        'result': job.jobResult if job.jobType != 'billing' else
+            {k: v for k, v in (job.jobResult or {}).items() if k != 'billing_data'},
+    })
@@ -0,0 +1,14 @@
+from flask import Blueprint, render_template, request, jsonify, abort
+from choices import search_choices, PROVIDERS
+
+bp = Blueprint('main', __name__)
+
+@bp.route('/choices/<kind>')
+def autocomplete(kind):
+    if kind not in PROVIDERS:
+        abort(404)
+    return jsonify([{'id': value, 'label': label} for value, label in search_choices(kind, request.args.get('q', ''))])
+
+@bp.route('/', methods=['GET'])
+def menu():
+    return render_template("menu.html", page_title="Menu")
@@ -0,0 +1,122 @@
+from flask import Blueprint, render_template, request, redirect, url_for, flash
+from models import db, Member, Pod, PodSharingGroup, SharingGroup, MemberFee, MemberFeePayment, Job
+from forms import MemberForm, MemberImportForm, PodForm
+from artifacts import save_upload
+from pagination import paginate_request
+from queries import member_detail_query, member_edit_query, member_name_filter
+from jobs import submit
+from pagecache import cached_page
+
+bp = Blueprint('members', __name__)
+
+@bp.route('/members')
+@cached_page(Member)
+def list_members():
+    query = Member.query
+    search = request.args.get('q', '').strip()
+    if search:
+        query = query.filter(member_name_filter(search))
+    members = paginate_request(query, {
+        'id': (),
+        'name': (Member.name, Member.firstname),
+        'firstname': (Member.firstname,),
+        'email': (Member.email,)
+    }, default_sort='id', primary_key=Member.id)
+    return render_template('members/list.html', members=members, search=search)
+
+@bp.route('/members/new', methods=['GET', 'POST'])
+def create_member():
+    member_form = MemberForm()
+    pod_form = PodForm()
+    if member_form.validate_on_submit():
+        member = Member(
+            name=member_form.name.data,
+            firstname=member_form.firstname.data,
+            nationalId=member_form.nationalId.data,
+            address=member_form.address.data,
+            phoneNumber=member_form.phoneNumber.data,
+            email=member_form.email.data,
+            energyID=member_form.energyID.data
+        )
+        db.session.add(member)
+        db.session.commit()
+        flash('Member created successfully!', 'success')
+        return redirect(url_for('members.list_members'))
+    return render_template('members/form_new.html',member_form=member_form, pod_form=pod_form, title='Create Member')
+
+@bp.route('/members/import', methods=['GET', 'POST'])
+def import_members_file():
+    form = MemberImportForm()
+    if form.validate_on_submit():
+        job = submit('import_members', {
+            'path': save_upload(form.file.data),
+            'filename': form.file.data.filename,
+            'dry_run': form.dryRun.data
+        })
+        return redirect(url_for('members.import_members_file', job=job.jobID))
+    job = db.session.get(Job, request.args['job']) if request.args.get('job') else None
+    report = job.jobResult if job is not None and job.jobStatus == 'done' else None
+    return render_template('members/import.html', form=form, job=job, report=report, title='Import Members')
+
+@bp.route('/members/<int:id>')
+@cached_page(Pod, PodSharingGroup, SharingGroup, MemberFeePayment, MemberFee, entity=(Member, 'id'))
+def detail_member(id):
+    member = member_detail_query().get_or_404(id)
+    return render_template('members/detail.html', member=member)
+
+@bp.route('/members/<int:id>/edit', methods=['GET', 'POST'])
+def update_member(id):
+    member = member_edit_query().get_or_404(id)
+    member_form = MemberForm(obj=member)
+    pod_form = PodForm()
+    #pod_form.memberID.choices = [(member.id, f"{member.firstname} {member.name}")]
+    pod_form.memberID.load_choices()
+    pod_form.memberID.data = member.id  # Preselect the current member
+
+    if request.method == 'POST':
+
+        if member_form.validate_on_submit() and 'member_submit' in request.form:
+            member.name = member_form.name.data
+            member.firstname = member_form.firstname.data
+            member.nationalId = member_form.nationalId.data
+            member.address = member_form.address.data
+            member.phoneNumber = member_form.phoneNumber.data
+            member.email = member_form.email.data
+            member.energyID = member_form.energyID.data
+            db.session.commit()
+            flash('Member updated successfully!', 'success')
+            return redirect(url_for('members.detail_member', id=member.id))
+        elif pod_form.validate_on_submit() and 'pod_submit' in request.form:
+            pod = Pod(
+                podlabel=pod_form.podlabel.data,
+                podType=pod_form.podType.data,
+                memberID=pod_form.memberID.data,
+                podNumber=pod_form.podNumber.data,
+                energyproduction=pod_form.energyproduction.data,
+                energystorage=pod_form.energystorage.data
+            )
+            db.session.add(pod)
+            db.session.commit()
+            flash('Pod added successfully!', 'success')
+            return redirect(url_for('members.update_member', id=member.id))
+
+    return render_template('members/form.html', member_form=member_form, pod_form=pod_form, member=member, title='Edit Member')
+
+@bp.route('/members/<int:member_id>/pods/<int:pod_id>/delete', methods=['POST'])
+def delete_member_pod(member_id, pod_id):
+    pod = Pod.query.get_or_404(pod_id)
+    if pod.memberID != member_id:
+        flash('Pod does not belong to this member!', 'danger')
+        return redirect(url_for('members.update_member', id=member_id))
+    db.session.delete(pod)
+    db.session.commit()
+    flash('Pod deleted successfully!', 'success')
+    return redirect(url_for('members.update_member', id=member_id))
+
+@bp.route('/members/<int:id>/delete', methods=['POST'])
+def delete_member(id):
+    member = Member.query.get_or_404(id)
+    db.session.delete(member)
+    db.session.commit()
+    flash('Member deleted successfully!', 'success')
+    return redirect(url_for('members.list_members'))
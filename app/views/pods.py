@@ -0,0 +1,76 @@
+from flask import Blueprint, render_template, request, redirect, url_for, flash
+from models import db, Member, Pod
+from forms import PodForm
+from pagination import paginate_request
+from queries import pods_query
+from pagecache import cached_page
+
+bp = Blueprint('pods', __name__)
+
+@bp.route('/pods')
+@cached_page(Pod, Member)
+def list_pods():
+    query = pods_query()
+    pod_type = request.args.get('podType')
+    if pod_type:
+        query = query.filter(Pod.podType == pod_type)
+    member_id = request.args.get('member', type=int)
+    if member_id:
+        query = query.filter(Pod.memberID == member_id)
+    pods = paginate_request(query, {
+        'id': (),
+        'label': (Pod.podlabel,),
+        'type': (Pod.podType,),
+        'number': (Pod.podNumber,)
+    }, default_sort='id', primary_key=Pod.podsID)
+    return render_template('pods/list.html', pods=pods)
+
+@bp.route('/pods/new', methods=['GET', 'POST'])
+def create_pod():
+    form = PodForm()
+    form.memberID.load_choices()
+    if form.validate_on_submit():
+        pod = Pod(
+            podlabel=form.podlabel.data,
+            podType=form.podType.data,
+            memberID=form.memberID.data,
+            podNumber=form.podNumber.data,
+            energyproduction=form.energyproduction.data,
+            energystorage=form.energystorage.data
+        )
+        db.session.add(pod)
+        db.session.commit()
+        flash('Pod created successfully!', 'success')
+        return redirect(url_for('pods.list_pods'))
+    return render_template('pods/form.html', form=form, title='Create Pod')
+
+@bp.route('/pods/<int:id>')
+@cached_page(entity=(Pod, 'id'))
+def detail_pod(id):
+    pod = Pod.query.get_or_404(id)
+    return render_template('pods/detail.html', pod=pod)
+
+@bp.route('/pods/<int:id>/edit', methods=['GET', 'POST'])
+def update_pod(id):
+    pod = Pod.query.get_or_404(id)
+    form = PodForm(obj=pod)
+    form.memberID.load_choices()
+    if form.validate_on_submit():
+        pod.podlabel = form.podlabel.data
+        pod.podType = form.podType.data
+        pod.memberID = form.memberID.data
+        pod.podNumber = form.podNumber.data
+        pod.energyproduction = form.energyproduction.data
+        pod.energystorage = form.energystorage.data
+        db.session.commit()
+        flash('Pod updated successfully!', 'success')
+        return redirect(url_for('pods.detail_pod', id=pod.podsID))
+    return render_template('pods/form.html', form=form, title='Edit Pod')
+
+@bp.route('/pods/<int:id>/delete', methods=['POST'])
+def delete_pod(id):
+    pod = Pod.query.get_or_404(id)
+    db.session.delete(pod)
+    db.session.commit()
+    flash('Pod deleted successfully!', 'success')
+    return redirect(url_for('pods.list_pods'))
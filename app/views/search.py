@@ -0,0 +1,27 @@
+from flask import Blueprint, render_template, request, jsonify, url_for
+from models import Member, Pod
+from search import search, MIN_QUERY_LENGTH
+from pagecache import cached_page
+
+bp = Blueprint('search', __name__)
+
+def _result(kind, row_id, title, keys, score):
+    if kind == 'member':
+        url = url_for('members.detail_member', id=row_id)
+    else:
+        url = url_for('pods.detail_pod', id=row_id)
+    return {'kind': kind, 'id': row_id, 'title': title, 'keys': keys, 'score': score, 'url': url}
+
+@bp.route('/search')
+@cached_page(Member, Pod)
+def search_page():
+    term = request.args.get('q', '').strip()
+    results = [_result(*found) for found in search(term, limit=50)]
+    return render_template('search/results.html', term=term, results=results,
+                           min_length=MIN_QUERY_LENGTH, title='Search')
+
+@bp.route('/search/typeahead')
+@cached_page(Member, Pod)
+def typeahead():
+    # One query on the search index, the rows themselves are not read
+    return jsonify([_result(*found) for found in search(request.args.get('q', ''))])
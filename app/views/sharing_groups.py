@@ -0,0 +1,156 @@
+from flask import Blueprint, render_template, request, redirect, url_for, flash
+from models import db, Member, Pod, SharingGroup, PodSharingGroup
+from forms import SharingGroupForm, PodSharingGroupForm
+from pagination import paginate_request
+from choices import get_choices
+from queries import pod_sharing_groups_query, sharing_group_pods_query
+from pagecache import cached_page
+import time
+
+bp = Blueprint('sharing_groups', __name__)
+
+@bp.route('/sharing_groups')
+@cached_page(SharingGroup)
+def list_sharing_groups():
+    sharing_groups = SharingGroup.query.all()
+    return render_template('sharing_groups/list.html', sharing_groups=sharing_groups)
+
+@bp.route('/sharing_groups/new', methods=['GET', 'POST'])
+def create_sharing_group():
+    form = SharingGroupForm()
+    if form.validate_on_submit():
+        sharing_group = SharingGroup(
+            sgName=form.sgName.data,
+            sgNumber=form.sgNumber.data
+        )
+        db.session.add(sharing_group)
+        db.session.commit()
+        flash('Sharing Group created successfully!', 'success')
+        return redirect(url_for('sharing_groups.list_sharing_groups'))
+    return render_template('sharing_groups/form.html', form=form, title='Create Sharing Group')
+
+@bp.route('/sharing_groups/<int:id>')
+@cached_page(PodSharingGroup, Pod, Member, entity=(SharingGroup, 'id'))
+def detail_sharing_group(id):
+    sharing_group = SharingGroup.query.get_or_404(id)
+    sharing_group_pods = sharing_group_pods_query(id).all()
+    return render_template('sharing_groups/detail.html', 
+                         sharing_group=sharing_group, 
+                         sharing_group_pods=sharing_group_pods)
+@bp.route('/sharing_groups/<int:id>/edit', methods=['GET', 'POST'])
+def update_sharing_group(id):
+    sharing_group = SharingGroup.query.get_or_404(id)
+    form = SharingGroupForm(obj=sharing_group)
+    if form.validate_on_submit():
+        sharing_group.sgName = form.sgName.data
+        sharing_group.sgNumber = form.sgNumber.data
+        db.session.commit()
+        flash('Sharing Group updated successfully!', 'success')
+        return redirect(url_for('sharing_groups.detail_sharing_group', id=sharing_group.sgID))
+    return render_template('sharing_groups/form.html', form=form, title='Edit Sharing Group')
+
+@bp.route('/sharing_groups/<int:id>/delete', methods=['POST'])
+def delete_sharing_group(id):
+    sharing_group = SharingGroup.query.get_or_404(id)
+    db.session.delete(sharing_group)
+    db.session.commit()
+    flash('Sharing Group deleted successfully!', 'success')
+    return redirect(url_for('sharing_groups.list_sharing_groups'))
+
+@bp.route('/sharing_groups/simulate')
+def simulate_sharing_groups():
+    # pandas is only loaded for the simulator, the index lives in this process once built
+    from simulation import get_index, simulate
+    index = get_index()
+    moves, prices, errors = _scenario(request.args)
+    year = request.args.get('year', type=int)
+    month = request.args.get('month', type=int)
+    members = groups = None
+    started = time.perf_counter()
+    if not errors:
+        try:
+            members, groups = simulate(index, moves, prices, year=year, month=month)
+        except ValueError as e:
+            errors.append(str(e))
+    elapsed = (time.perf_counter() - started) * 1000
+    changed = members[members['delta'] != 0] if members is not None else None
+    return render_template('sharing_groups/simulate.html', index=index, moves=moves, prices=prices,
+                           year=year, month=month, errors=errors, members=members, changed=changed,
+                           groups=groups, elapsed=elapsed, title='Sharing Group Simulator')
+
+def _scenario(args):
+    """Moves and prices of a simulation from the query arguments, with the errors in them."""
+    moves, prices, errors = [], {}, []
+    for pod, from_group, to_group in zip(args.getlist('pod'), args.getlist('from'), args.getlist('to')):
+        if not pod:
+            continue
+        try:
+            moves.append((int(pod), int(from_group) if from_group else None, int(to_group) if to_group else None))
+        except ValueError:
+            errors.append(f'Invalid move of pod {pod}')
+    for key, value in args.items():
+        if key.startswith('price-') and value.strip():
+            try:
+                prices[int(key[len('price-'):])] = float(value)
+            except ValueError:
+                errors.append(f'Invalid price {value}')
+    return moves, prices, errors
+
+# Routes for Pod Sharing Groups
+@bp.route('/pod_sharing_groups')
+@cached_page(PodSharingGroup, Pod, SharingGroup)
+def list_pod_sharing_groups():
+    query = pod_sharing_groups_query()
+    sharing_group_id = request.args.get('sharing_group', type=int)
+    if sharing_group_id:
+        query = query.filter(PodSharingGroup.sharingGroupID == sharing_group_id)
+    pod_sharing_groups = paginate_request(query, {
+        'id': (),
+        'sharing_group': (PodSharingGroup.sharingGroupID,),
+        'pod': (PodSharingGroup.podID,)
+    }, default_sort='id', primary_key=PodSharingGroup.msgID)
+    return render_template('pod_sharing_groups/list.html', pod_sharing_groups=pod_sharing_groups,
+                           sharing_groups=get_choices('sharing_groups'))
+
+@bp.route('/pod_sharing_groups/new', methods=['GET', 'POST'])
+def create_pod_sharing_group():
+    form = PodSharingGroupForm()
+    form.podID.load_choices()
+    form.sharingGroupID.load_choices()
+    if form.validate_on_submit():
+        pod_sharing_group = PodSharingGroup(
+            podID=form.podID.data,
+            sharingGroupID=form.sharingGroupID.data
+        )
+        db.session.add(pod_sharing_group)
+        db.session.commit()
+        flash('Pod Sharing Group created successfully!', 'success')
+        return redirect(url_for('sharing_groups.list_pod_sharing_groups'))
+    return render_template('pod_sharing_groups/form.html', form=form, title='Create Pod Sharing Group')
+
+@bp.route('/pod_sharing_groups/<int:id>')
+def detail_pod_sharing_group(id):
+    pod_sharing_group = pod_sharing_groups_query().get_or_404(id)
+    return render_template('pod_sharing_groups/detail.html', pod_sharing_group=pod_sharing_group)
+
+@bp.route('/pod_sharing_groups/<int:id>/edit', methods=['GET', 'POST'])
+def update_pod_sharing_group(id):
+    pod_sharing_group = PodSharingGroup.query.get_or_404(id)
+    form = PodSharingGroupForm(obj=pod_sharing_group)
+    form.podID.load_choices()
+    form.sharingGroupID.load_choices()
+    if form.validate_on_submit():
+        pod_sharing_group.podID = form.podID.data
+        pod_sharing_group.sharingGroupID = form.sharingGroupID.data
+        db.session.commit()
+        flash('Pod Sharing Group updated successfully!', 'success')
+        return redirect(url_for('sharing_groups.detail_pod_sharing_group', id=pod_sharing_group.msgID))
+    return render_template('pod_sharing_groups/form.html', form=form, title='Edit Pod Sharing Group')
+
+@bp.route('/pod_sharing_groups/<int:id>/delete', methods=['POST'])
+def delete_pod_sharing_group(id):
+    pod_sharing_group = PodSharingGroup.query.get_or_404(id)
+    db.session.delete(pod_sharing_group)
+    db.session.commit()
+    flash('Pod Sharing Group deleted successfully!', 'success')
+    return redirect(url_for('sharing_groups.list_pod_sharing_groups'))
@@ -1,11 +0,0 @@
-import os
-from pathlib import Path
-
-basedir = Path(__file__).parent.parent
-
-class Config:
-    SECRET_KEY = os.environ.get('SECRET_KEY') or 'your-secret-key-here'
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
-        'sqlite:///' + str(basedir / 'data-management'/ 'database' /'commEnergy.db')
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
-    print(SQLALCHEMY_DATABASE_URI)
\ No newline at end of file
@@ -0,0 +1,68 @@
+import os
+import sys
+
+# The application modules import each other by name from the app directory, as in run.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+
+import pytest
+from app import create_app
+from config import Config
+from migrations import upgrade
+from models import db
+import analytics
+import artifacts
+import choices
+import simulation
+
+
+def make_config(path, **overrides):
+    """A configuration on the SQLite file ``path``, without the local job worker nor a shared page cache."""
+    return type('TestConfig', (Config,), {
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}',
+        'WTF_CSRF_ENABLED': False,
+        'JOBS_LOCAL_WORKER': False,
+        'PAGE_CACHE_DIR': None,
+        **overrides,
+    })
+
+
+def _reset():
+    # Process-wide caches, a test must not see the rows of the previous one
+    choices.invalidate()
+    simulation.invalidate()
+
+
+def app_context(path, **overrides):
+    app = create_app(make_config(path, **overrides))
+    context = app.app_context()
+    context.push()
+    upgrade(backup=False)
+    _reset()
+    return app, context
+
+
+def close_app(context):
+    db.session.remove()
+    db.engine.dispose()
+    context.pop()
+    _reset()
+
+
+@pytest.fixture(autouse=True)
+def data_dirs(tmp_path, monkeypatch):
+    # Generated files go to the test's directory, not to app/data
+    monkeypatch.setattr(analytics, 'CHART_DIR', str(tmp_path / 'analytics'))
+    monkeypatch.setattr(artifacts, 'ARCHIVE_DIR', str(tmp_path / 'archive'))
+
+
+@pytest.fixture
+def app(tmp_path):
+    app, context = app_context(tmp_path / 'test.db')
+    yield app
+    close_app(context)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
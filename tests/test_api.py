@@ -0,0 +1,89 @@
+from decimal import Decimal
+from billing import BillingRun, execute_billing, SUPPLEMENT
+from models import db, Member, Pod, SharingGroup, Accounting
+
+
+def _record(member_id=None, pod_id=None, group_id=None, **values):
+    return dict({'accYear': 2025, 'accMonth': 1, 'accMember': member_id, 'accPod': pod_id, 'accSGId': group_id,
+                 'accAmount': '10.00'}, **values)
+
+
+def _invoiced_record(client, tmp_path):
+    member = Member(name='Muller', firstname='Anne')
+    group = SharingGroup(sgName='Local', sgType='Local')
+    db.session.add_all([member, group])
+    db.session.flush()
+    pod = Pod(podType='Consumption', memberID=member.id)
+    db.session.add(pod)
+    db.session.commit()
+    keys = {'member_id': member.id, 'pod_id': pod.podsID, 'group_id': group.sgID}
+    response = client.post('/api/v1/accounting', json=_record(**keys))
+    assert response.status_code == 201
+    assert execute_billing(BillingRun(), data_dir=str(tmp_path)).billed_rows == 1
+    return response.get_json()['id'], keys
+
+
+def test_upsert_by_key_adjusts_invoiced_record(client, tmp_path):
+    acc_id, keys = _invoiced_record(client, tmp_path)
+
+    response = client.post('/api/v1/accounting', json=_record(**keys, accAmount='12.50'))
+
+    assert response.status_code == 201
+    assert response.get_json() == {'id': acc_id}
+    record = db.session.get(Accounting, acc_id)
+    assert (record.accAmount, record.accVersion, record.accBilledVersion) == (Decimal('12.50'), 2, 1)
+    run = execute_billing(BillingRun(), data_dir=str(tmp_path))
+    assert [(line['total_amount'], line['kind']) for line in run.billing_data] == [(Decimal('2.50'), SUPPLEMENT)]
+
+
+def test_upsert_by_key_keeps_version_of_unchanged_record(client, tmp_path):
+    acc_id, keys = _invoiced_record(client, tmp_path)
+
+    assert client.post('/api/v1/accounting', json=_record(**keys)).status_code == 201
+    assert db.session.get(Accounting, acc_id).accVersion == 1
+
+
+def test_billing_date_of_invoiced_record_is_read_only(client, tmp_path):
+    acc_id, keys = _invoiced_record(client, tmp_path)
+    billed = db.session.get(Accounting, acc_id).accBillingDate.isoformat()
+    db.session.remove()
+
+    for method, url, body in (
+        ('patch', f'/api/v1/accounting/{acc_id}', {'accBillingDate': None}),
+        ('post', '/api/v1/accounting', _record(**keys, accBillingDate='2020-01-01')),
+        ('post', '/api/v1/accounting/bulk', [{'accID': acc_id, 'accBilledVersion': 2}]),
+    ):
+        response = getattr(client, method)(url, json=body)
+        assert response.status_code == 400, url
+    # Sending back the record as read is fine
+    response = client.patch(f'/api/v1/accounting/{acc_id}', json={'accBillingDate': billed, 'accAmount': '11.00'})
+    assert response.status_code == 200
+    assert response.get_json()['accBillingDate'] == billed
+
+
+def test_api_writes_drop_the_simulation_index(client):
+    import simulation
+    group = SharingGroup(sgName='Local', sgType='Local')
+    db.session.add(group)
+    db.session.commit()
+    group_id = group.sgID
+    assert simulation.get_index().groups.index.tolist() == [group_id]
+
+    response = client.post('/api/v1/sharing_groups/bulk', json=[{'sgName': 'National', 'sgType': 'National'}])
+
+    assert response.status_code == 200
+    assert simulation._index is None
+    assert len(simulation.get_index().groups) == 2
+
+
+def test_patch_with_same_amount_keeps_version(client, tmp_path):
+    acc_id, keys = _invoiced_record(client, tmp_path)
+
+    for body in ({'accAmount': '10.00'}, {'accAmount': '10.00', 'accMember': keys['member_id']}):
+        assert client.patch(f'/api/v1/accounting/{acc_id}', json=body).status_code == 200
+    assert client.post('/api/v1/accounting/bulk', json=[{'accID': acc_id, 'accAmount': '10'}]).status_code == 200
+    assert db.session.get(Accounting, acc_id).accVersion == 1
+    db.session.remove()
+
+    assert client.patch(f'/api/v1/accounting/{acc_id}', json={'accAmount': '10.50'}).status_code == 200
+    assert db.session.get(Accounting, acc_id).accVersion == 2
@@ -0,0 +1,32 @@
+from decimal import Decimal
+from billing import BillingRun, execute_billing, SUPPLEMENT
+from models import db, Member, Pod, SharingGroup, Accounting
+
+
+def _invoiced(member, pod, group, month, billed_member):
+    return Accounting(accYear=2025, accMonth=month, accMember=member.id, accPod=pod.podsID, accSGId=group.sgID,
+                      accAmount=Decimal('12.00'), accVersion=2, accBilledVersion=1,
+                      accBilledAmount=Decimal('10.00'), accBilledMember=billed_member)
+
+
+def test_adjustments_skip_records_without_billed_member(app, tmp_path):
+    member = Member(name='Muller', firstname='Anne')
+    group = SharingGroup(sgName='Local', sgType='Local')
+    db.session.add_all([member, group])
+    db.session.flush()
+    pod = Pod(podType='Consumption', memberID=member.id)
+    db.session.add(pod)
+    db.session.flush()
+    # Dated on insert, like every invoiced record
+    db.session.add_all([_invoiced(member, pod, group, 1, member.id), _invoiced(member, pod, group, 2, None)])
+    db.session.commit()
+    member_id = member.id
+
+    run = execute_billing(BillingRun(), data_dir=str(tmp_path))
+
+    assert run.status == 'done', run.error
+    assert run.adjusted_rows == 1
+    assert [(line['member_id'], line['total_amount'], line['kind']) for line in run.billing_data] == [
+        (member_id, Decimal('2.00'), SUPPLEMENT)]
+    # Left for a later run once its billed member is known
+    assert db.session.get(Accounting, 2).accBilledVersion == 1
@@ -0,0 +1,27 @@
+import threading
+from conftest import app_context, close_app
+from benchmark import generate_community, run_concurrency_check
+from jobs import work
+
+
+def test_concurrent_reads_and_writes(tmp_path):
+    # Production mode, as deployed: WAL and a busy timeout on every connection
+    app, context = app_context(tmp_path / 'concurrency.db', DATABASE_MODE='production')
+    stop = threading.Event()
+    worker = threading.Thread(target=work, args=(app,), kwargs={'poll_interval': 0.05, 'stop': stop})
+    try:
+        generate_community(members=100, months=2)
+        worker.start()
+        report = run_concurrency_check(app, seconds=2, readers=3, writers=2)
+    finally:
+        stop.set()
+        if worker.is_alive():
+            worker.join()
+        close_app(context)
+
+    assert report['errors'] == {}
+    assert report['results']['billing']['status'] == 'done'
+    assert report['results']['read']['errors'] == report['results']['write']['errors'] == 0
+    writes = report['results']['writes']
+    assert writes['created'] and writes['edited']
+    assert writes['lost'] == 0
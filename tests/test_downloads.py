@@ -0,0 +1,47 @@
+import gzip
+from billing import BillingRun, execute_billing
+from models import db, Member, Pod, SharingGroup, Accounting
+
+
+def _billing_file(tmp_path):
+    member = Member(name='Muller', firstname='Anne')
+    group = SharingGroup(sgName='Local', sgType='Local')
+    db.session.add_all([member, group])
+    db.session.flush()
+    pod = Pod(podType='Consumption', memberID=member.id)
+    db.session.add(pod)
+    db.session.flush()
+    db.session.add(Accounting(accYear=2025, accMonth=1, accMember=member.id, accPod=pod.podsID,
+                              accSGId=group.sgID, accAmount=10, accBillingDate=None))
+    db.session.commit()
+    return execute_billing(BillingRun(), data_dir=str(tmp_path)).filename
+
+
+def test_download_representations(client, tmp_path):
+    url = f'/download/{_billing_file(tmp_path)}'
+    plain = client.get(url, headers={'Accept-Encoding': 'identity'})
+    compressed = client.get(url, headers={'Accept-Encoding': 'gzip'})
+
+    assert plain.status_code == compressed.status_code == 200
+    assert plain.data.startswith('Nom;Prénom'.encode())
+    assert 'Content-Encoding' not in plain.headers
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.data) == plain.data
+    # One ETag per representation, a cache must not answer one with the other
+    assert compressed.headers['ETag'] == plain.headers['ETag'][:-1] + '-gz"'
+    assert client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': compressed.headers['ETag']}) \
+        .status_code == 304
+    assert client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': plain.headers['ETag']}) \
+        .status_code == 200
+
+
+def test_download_range_of_the_csv(client, tmp_path):
+    url = f'/download/{_billing_file(tmp_path)}'
+    full = client.get(url, headers={'Accept-Encoding': 'identity'}).data
+
+    partial = client.get(url, headers={'Accept-Encoding': 'gzip', 'Range': 'bytes=4-'})
+
+    assert partial.status_code == 206
+    assert 'Content-Encoding' not in partial.headers
+    assert partial.headers['Content-Range'] == f'bytes 4-{len(full) - 1}/{len(full)}'
+    assert partial.data == full[4:]
@@ -0,0 +1,41 @@
+from sqlalchemy import func, select, update
+from jobs import job_handler, submit, work
+from models import db, Job, Member
+
+
+@job_handler('test_taken_over')
+def taken_over(job):
+    job.complete_on_commit(lambda: {'members': 1})
+    db.session.add(Member(name='Twice'))
+    # Another worker claims the job meanwhile, as when the heartbeats were blocked for STALE_AFTER
+    with job.engine.begin() as connection:
+        connection.execute(update(Job).where(Job.jobID == job.id)
+                           .values(jobAttempts=Job.jobAttempts + 1, jobWorker='other'))
+    db.session.commit()
+
+
+@job_handler('test_done')
+def done(job):
+    job.complete_on_commit(lambda: {'members': 1})
+    db.session.add(Member(name='Once'))
+    db.session.commit()
+
+
+def test_job_claimed_again_does_not_commit(app):
+    job_id = submit('test_taken_over').jobID
+
+    work(app, worker='first', once=True)
+
+    job = db.session.get(Job, job_id, populate_existing=True)
+    assert (job.jobStatus, job.jobWorker, job.jobAttempts, job.jobResult) == ('running', 'other', 2, None)
+    assert db.session.scalar(select(func.count(Member.id))) == 0
+
+
+def test_job_completes_with_its_work(app):
+    job_id = submit('test_done').jobID
+
+    work(app, worker='first', once=True)
+
+    job = db.session.get(Job, job_id, populate_existing=True)
+    assert (job.jobStatus, job.jobResult) == ('done', {'members': 1})
+    assert db.session.scalar(select(func.count(Member.id))) == 1
@@ -0,0 +1,33 @@
+import numpy as np
+from loadcurves import SLOTS_PER_DAY, ingest_csv, monthly_energy_by_pod, open_partition
+from models import db, Member, Pod
+
+READINGS = '''podNumber;timestamp;value
+LU/001;2025-03-30T01:45:00+01:00;1.5
+LU/001;2025-03-30T03:00:00+02:00;2.5
+LU_001;2025-03-30T00:00:00Z;4
+'''
+
+
+def test_ingest_by_pod_in_utc_slots(app, tmp_path):
+    member = Member(name='Muller')
+    db.session.add(member)
+    db.session.flush()
+    # Two pods sharing a number, and a number secure_filename would turn into the other one
+    pods = [Pod(podType='Consumption', memberID=member.id, podNumber=number)
+            for number in ('LU/001', 'LU/001', 'LU_001')]
+    db.session.add_all(pods)
+    db.session.commit()
+    source = tmp_path / 'readings.csv'
+    source.write_text(READINGS)
+
+    stats = ingest_csv(str(source), store_dir=str(tmp_path / 'store'))
+
+    assert (stats['stored'], stats['invalid'], stats['partitions']) == (3, 0, 3)
+    # Consecutive quarter hours across the switch to summer time
+    curve = open_partition(pods[0].podsID, 2025, 3, str(tmp_path / 'store'))
+    day = 29 * SLOTS_PER_DAY
+    assert curve[day + 3] == 1.5 and curve[day + 4] == 2.5
+    assert np.isnan(curve[day + 7]) and np.isnan(curve[day + 12])
+    totals = monthly_energy_by_pod(2025, 3, store_dir=str(tmp_path / 'store'))
+    assert totals.to_dict() == {pods[0].podsID: 4.0, pods[1].podsID: 4.0, pods[2].podsID: 4.0}
@@ -0,0 +1,73 @@
+from datetime import date
+from decimal import Decimal
+from sqlalchemy import create_engine, insert, inspect, select, text
+import pytest
+from conftest import app_context, close_app
+from billing import BillingRun, execute_billing
+from migrations import HEAD, _schema, current_version
+from models import db, Accounting
+
+
+@pytest.fixture
+def baseline_app(tmp_path):
+    """An application on a database with the schema from before the migrations, and a month to bill."""
+    path = tmp_path / 'baseline.db'
+    engine = create_engine(f'sqlite:///{path}')
+    schema = _schema(0)
+    tables = schema.tables
+    with engine.begin() as connection:
+        schema.create_all(connection)
+        connection.execute(insert(tables['members']), [{'id': 1, 'name': 'Muller', 'firstname': 'Anne'},
+                                                        {'id': 2, 'name': 'Weber', 'firstname': 'Paul'}])
+        connection.execute(insert(tables['pods']), [{'podsID': 1, 'podType': 'Consumption', 'memberID': 1},
+                                                     {'podsID': 2, 'podType': 'Consumption', 'memberID': 2}])
+        connection.execute(insert(tables['sharingGroup']), [{'sgID': 1, 'sgName': 'Local', 'sgType': 'Local'}])
+        connection.execute(insert(tables['podSharingGroup']), [{'podID': 1, 'sharingGroupID': 1},
+                                                                {'podID': 2, 'sharingGroupID': 1}])
+        connection.execute(insert(tables['accounting']), [
+            {'accYear': 2025, 'accMonth': month, 'accMember': member, 'accPod': member, 'accSGId': 1,
+             'accAmount': Decimal('10.00'), 'accBillingDate': date(2025, 3, 1) if month == 1 else None}
+            for month in (1, 2) for member in (1, 2)
+        ])
+    engine.dispose()
+    app, context = app_context(path)
+    yield app
+    close_app(context)
+
+
+def test_upgrade_from_baseline_keeps_indexes_consistent(baseline_app):
+    with db.engine.connect() as connection:
+        assert current_version(connection) == HEAD
+        assert connection.exec_driver_sql('PRAGMA integrity_check').scalar() == 'ok'
+        # Invoiced at the version and amount they had before the migrations
+        billed = connection.execute(
+            select(Accounting.accBilledVersion, Accounting.accBilledMember).where(Accounting.accMonth == 1)
+        ).all()
+        assert billed == [(1, 1), (1, 2)]
+
+
+def test_billing_after_upgrade_from_baseline(baseline_app, tmp_path):
+    run = execute_billing(BillingRun(), data_dir=str(tmp_path))
+    assert run.error is None
+    assert run.status == 'done'
+    assert run.total_rows == 2
+    assert run.billed_rows == 2
+    assert run.grandtotal == Decimal('20.00')
+
+
+def test_frozen_schema_matches_models():
+    # A migrated database ends with the tables, columns and indexes of a new one
+    frozen = _schema(HEAD)
+    for table in db.metadata.sorted_tables:
+        if table.name == 'schemaVersion':
+            continue
+        assert table.name in frozen.tables
+        assert [c.name for c in table.columns] == [c.name for c in frozen.tables[table.name].columns]
+        assert {i.name for i in table.indexes} == {i.name for i in frozen.tables[table.name].indexes}
+    assert set(frozen.tables) == {table.name for table in db.metadata.sorted_tables} - {'schemaVersion'}
+
+
+def test_migrated_indexes_match_models(baseline_app):
+    migrated = inspect(db.engine)
+    for table in _schema(HEAD).sorted_tables:
+        assert {i['name'] for i in migrated.get_indexes(table.name)} == {i.name for i in table.indexes}
@@ -0,0 +1,45 @@
+import os
+import subprocess
+import sys
+import pytest
+from conftest import app_context, close_app
+from models import db, Member
+
+# A second process of the deployment on the same database renames the member, as a POST on another worker does
+RENAME = '''
+import sys
+sys.path[:0] = [{tests!r}]
+from conftest import app_context, close_app
+from models import db, Member
+app, context = app_context({database!r}, PAGE_CACHE_DIR={directory!r})
+db.session.get(Member, {member_id}).name = 'Schmit'
+db.session.commit()
+close_app(context)
+'''
+
+
+@pytest.mark.parametrize('shared', [True, False], ids=['shared-dir', 'no-dir'])
+def test_page_shows_a_write_of_another_process(tmp_path, shared):
+    database = str(tmp_path / 'test.db')
+    directory = str(tmp_path / 'pages') if shared else None
+    app, context = app_context(database, PAGE_CACHE_DIR=directory)
+    try:
+        # Without a shared directory the pages are not cached at all
+        assert ('page_cache' in app.extensions) == shared
+        member = Member(name='Muller', firstname='Anne')
+        db.session.add(member)
+        db.session.commit()
+        member_id = member.id
+        client = app.test_client()
+        assert b'Muller' in client.get('/members').data
+        # The requests share the test's app context, end their transaction as their teardown would
+        db.session.remove()
+
+        script = RENAME.format(tests=os.path.dirname(__file__), database=database, directory=directory,
+                               member_id=member_id)
+        subprocess.run([sys.executable, '-c', script], check=True)
+
+        page = client.get('/members').data
+        assert b'Schmit' in page and b'Muller' not in page
+    finally:
+        close_app(context)
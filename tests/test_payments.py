@@ -0,0 +1,28 @@
+from datetime import date
+from decimal import Decimal
+from models import db, Member, MemberFeePayment
+from payments import create_fee_cycle, payment_reference, reconcile_payments
+
+
+def test_reconcile_reports_invalid_lines_and_pays_the_others(app, tmp_path):
+    db.session.add_all([Member(name=f'Name{i}') for i in range(3)])
+    db.session.flush()
+    member_fee, _ = create_fee_cycle(2025, amount=Decimal('50.00'))
+    db.session.commit()
+    first, second, third = (payment.mfpID for payment in
+                            MemberFeePayment.query.order_by(MemberFeePayment.mfpID))
+    source = tmp_path / 'bank.csv'
+    source.write_text('\n'.join([
+        'Date;Amount;Communication',
+        f'2025-02-01;50,00;{payment_reference(2025, first)}',
+        f'2025-02-02;fifty;{payment_reference(2025, second)}',
+        f'2025-02-30;50,00;{payment_reference(2025, third)}',
+        '2025-02-03;12,00;Rent',
+    ]) + '\n')
+
+    report = reconcile_payments(str(source))
+
+    assert (report.lines, report.ignored, report.paid) == (4, 1, 1)
+    assert [line for line, _ in report.errors] == [3, 4]
+    assert db.session.get(MemberFeePayment, first).paymentDate == date(2025, 2, 1)
+    assert {db.session.get(MemberFeePayment, payment_id).paymentStatus for payment_id in (second, third)} == {'pending'}
@@ -0,0 +1,19 @@
+import pytest
+from conftest import app_context, close_app
+from querybudget import QUERY_BUDGETS, seed_sample_community, measure_page
+
+
+@pytest.fixture(scope='module')
+def community(tmp_path_factory):
+    app, context = app_context(tmp_path_factory.mktemp('budgets') / 'community.db')
+    seed_sample_community()
+    yield app
+    close_app(context)
+
+
+@pytest.mark.parametrize('endpoint', QUERY_BUDGETS)
+def test_page_within_query_budget(community, endpoint):
+    url, budget = QUERY_BUDGETS[endpoint]
+    status, statements = measure_page(community.test_client(), url)
+    assert status == 200
+    assert len(statements) <= budget, '\n'.join(statements)
@@ -0,0 +1,11 @@
+from migrations import check_query_plans
+from models import db
+
+
+def test_hot_queries_use_their_index(app):
+    with db.engine.connect() as connection:
+        results = check_query_plans(connection)
+        connection.rollback()
+    assert len(results) > 10
+    failed = {f'{name} ({index})': plan + problems for name, index, plan, problems in results if problems}
+    assert not failed
@@ -0,0 +1,22 @@
+from exports import EXPORTS
+from models import db, Member
+
+
+def _members():
+    db.session.add_all([Member(name='50%_off', firstname='Anne'), Member(name='500 Club', firstname='Paul'),
+                        Member(name='A_B', firstname='Marc'), Member(name='AXB', firstname='Luc')])
+    db.session.commit()
+
+
+def test_member_list_search_matches_percent_and_underscore_literally(client):
+    _members()
+    page = client.get('/members?q=50%25').get_data(as_text=True)
+    assert '50%_off' in page and '500 Club' not in page
+    page = client.get('/members?q=a_').get_data(as_text=True)
+    assert 'A_B' in page and 'AXB' not in page
+
+
+def test_member_export_search_matches_percent_and_underscore_literally(app):
+    _members()
+    names = db.session.scalars(EXPORTS['members'].query({'q': 'A_'}).with_only_columns(Member.name)).all()
+    assert names == ['A_B']
@@ -0,0 +1,37 @@
+from decimal import Decimal
+from models import db, Member, Pod, SharingGroup, Accounting, BillingFile, BillingFileEntry
+from statements import generate_statement, generate_statements
+import artifacts
+import os
+
+
+def _billing_file():
+    member = Member(name='Muller', firstname='Anne')
+    group = SharingGroup(sgName='Local', sgType='Local')
+    db.session.add_all([member, group])
+    db.session.flush()
+    pod = Pod(podType='Consumption', podNumber='LU0001', memberID=member.id)
+    db.session.add(pod)
+    db.session.flush()
+    record = Accounting(accYear=2025, accMonth=1, accMember=member.id, accPod=pod.podsID, accSGId=group.sgID,
+                        accAmount=Decimal('12.00'))
+    billing_file = BillingFile(bfFilename='decompte-test.csv', bfHash='0' * 64)
+    db.session.add_all([record, billing_file])
+    db.session.flush()
+    db.session.add(BillingFileEntry(billingFileID=billing_file.bfID, bfeMember=member.id, accID=record.accID,
+                                    bfeAmount=Decimal('12.00')))
+    db.session.commit()
+    return billing_file, member.id
+
+
+def test_statements_are_written_to_the_archive_dir(app, tmp_path):
+    billing_file, member_id = _billing_file()
+    expected = os.path.join(artifacts.ARCHIVE_DIR, 'statements', str(billing_file.bfID), f'{member_id}.html')
+
+    assert generate_statement(billing_file, member_id) == expected
+    os.remove(expected)
+    assert generate_statements(billing_file, workers=1) == 1
+
+    assert expected.startswith(str(tmp_path))
+    with open(expected, encoding='utf-8') as f:
+        assert 'Muller' in f.read()